@@ -18,4 +18,6 @@ interaction_id = vector_store.add_interaction(
     query_type="test"
 )
 
+vector_store.summarize_pending()
+
 print(f"Added interaction {interaction_id} to database")
\ No newline at end of file
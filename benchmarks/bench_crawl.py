@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""Time to enumerate, filter and render a large project tree: the old per-consumer walks against the Crawler.
+
+Run from the repository root: python -m benchmarks.bench_crawl
+"""
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import click
+from termcolor import colored
+
+from config import ALLOWED_EXTENSIONS, CLI_LLM_DIR, EXCLUDED_DIRS, IMAGE_EXTENSIONS
+from src.fs_walk import Crawler, render_tree
+
+EXTENSIONS = [".py", ".md", ".json", ".txt", ".png", ".pdf", ".bin"]
+
+
+def build_tree(root: Path, n_files: int, files_per_dir: int, fanout: int) -> None:
+    """n_files spread over nested directories, with a tenth of them under excluded node_modules/ and build/"""
+    n_dirs = max(1, n_files // files_per_dir)
+    dirs = [root]
+    while len(dirs) < n_dirs:
+        parent = dirs[(len(dirs) - 1) // fanout]
+        index = len(dirs)
+        name = ("node_modules" if index % 20 == 0 else "build") if index % 10 == 0 else f"pkg{index}"
+        dirs.append(parent / name)
+    for directory in dirs:
+        directory.mkdir(parents=True, exist_ok=True)
+
+    for i in range(n_files):
+        directory = dirs[i % len(dirs)]
+        (directory / f"file{i}{EXTENSIONS[i % len(EXTENSIONS)]}").touch()
+
+
+def legacy(root: Path) -> int:
+    """What ContextManager did before: rglob + per-file resolve/exclusion check, then a glob-per-directory tree"""
+    kept = 0
+    for path in sorted(root.rglob("*")):
+        if not path.is_file():
+            continue
+        if path.suffix.lower() in IMAGE_EXTENSIONS:
+            kept += 1
+            continue
+        if path.suffix.lower() not in ALLOWED_EXTENSIONS:
+            continue
+        path_str = str(path.resolve())
+        if any(f"{os.sep}{part}{os.sep}" in path_str or path.name == part for part in EXCLUDED_DIRS):
+            continue
+        kept += 1
+
+    def tree(directory: Path, prefix: str = "") -> str:
+        items = [i for i in sorted(directory.glob("*")) if not any(e in str(i) for e in EXCLUDED_DIRS)]
+        out = ""
+        for n, item in enumerate(items):
+            out += f"{prefix}{'└──' if n == len(items) - 1 else '├──'} {item.name}\n"
+            if item.is_dir():
+                out += tree(item, prefix + "    ")
+        return out
+
+    tree(root)
+    return kept
+
+
+def crawler(root: Path, cache_dir: Path) -> int:
+    crawl = Crawler(cache_dir=cache_dir)
+    kept = sum(1 for entry in crawl.crawl([root]) if entry.kind != "other")
+    render_tree(root, cache=crawl.cache_for(root), max_entries=10**9, max_lines=10**9, max_depth=10**9)
+    crawl.save()
+    return kept
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+@click.command()
+@click.option('--files', 'n_files', default=100_000, type=int, help='Files in the generated tree')
+@click.option('--files-per-dir', default=50, type=int, help='Files per directory')
+@click.option('--fanout', default=8, type=int, help='Subdirectories per directory')
+def main(n_files, files_per_dir, fanout):
+    """Compare enumeration + tree rendering of a generated tree"""
+    # Not under /tmp: the old substring check would drop the whole tree because "tmp" is an excluded name
+    CLI_LLM_DIR.mkdir(exist_ok=True, parents=True)
+    with tempfile.TemporaryDirectory(dir=CLI_LLM_DIR) as tmp:
+        root = Path(tmp).resolve() / "bench_project"
+        cache_dir = Path(tmp) / "tree_cache"
+        print(colored(f"Building {n_files} files ...", "cyan"))
+        build_tree(root, n_files, files_per_dir, fanout)
+        # Directory mtimes must be older than the racy window for listings to be cached
+        past = time.time() - 60
+        for directory, _, _ in os.walk(root):
+            os.utime(directory, (past, past))
+
+        print(colored(f"{'variant':<24} {'files kept':>10} {'seconds':>10}", "cyan"))
+        for name, fn, args in [
+            ("legacy rglob + glob tree", legacy, (root,)),
+            ("crawler, cold cache", crawler, (root, cache_dir)),
+            ("crawler, warm cache", crawler, (root, cache_dir)),
+        ]:
+            kept, seconds = timed(fn, *args)
+            print(f"{name:<24} {kept:>10} {seconds:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""Cold-start cost of the `llm "question"` path, measured with `python -X importtime`.
+
+Run from the repository root: python -m benchmarks.bench_startup
+"""
+import statistics
+import subprocess
+import sys
+import time
+
+import click
+from termcolor import colored
+
+# Heavy modules that must stay off the plain-query path (the default model needs openai, so it is not listed)
+HEAVY_MODULES = {"chromadb", "sentence_transformers", "torch", "tika", "anthropic", "google.generativeai"}
+
+# Builds everything main_cli builds for a one-line question, short of sending the request
+QUERY_PATH = """
+import cli
+from config import DEFAULT_MODEL, SUPPORTED_MODELS
+from src.llm import LLM
+from src.response_handler import ResponseHandler
+from src.file_processor import FileProcessor
+FileProcessor()
+LLM(llm_config=SUPPORTED_MODELS[DEFAULT_MODEL])
+ResponseHandler(DEFAULT_MODEL, store_in_db=False)
+"""
+
+
+def run_once():
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", QUERY_PATH],
+        capture_output=True, text=True, check=True,
+    )
+    wall = time.perf_counter() - start
+
+    # "import time: self [us] | cumulative | imported package", nested imports indented by two spaces
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        imports.append((int(cumulative_us), int(self_us), name.rstrip()[1:]))
+
+    # Lazily imported modules sit in sys.modules unexecuted, so only count modules that importtime saw load
+    loaded = {name.strip() for _, _, name in imports}
+    loaded_heavy = sorted(name for name in HEAVY_MODULES if name in loaded)
+    return wall, imports, loaded_heavy
+
+
+@click.command()
+@click.option('--runs', default=5, type=int, help='Number of cold starts to time')
+@click.option('--top', default=15, type=int, help='Slowest top-level imports to list')
+def main(runs, top):
+    """Time the import/initialisation cost of a plain `llm "question"` run"""
+    walls = []
+    for _ in range(runs):
+        wall, imports, loaded_heavy = run_once()
+        walls.append(wall)
+
+    print(colored(f"Wall time over {runs} runs: median {statistics.median(walls) * 1000:.0f} ms, "
+                  f"min {min(walls) * 1000:.0f} ms", "cyan"))
+
+    # Top-level entries (no indentation) from the last run
+    top_level = sorted((i for i in imports if not i[2].startswith(" ")), reverse=True)[:top]
+    print(colored(f"{'cumulative ms':>14} {'self ms':>9}  module", "cyan"))
+    for cumulative_us, self_us, name in top_level:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+
+    if loaded_heavy:
+        print(colored(f"Heavy modules loaded on the query path: {', '.join(loaded_heavy)}", "red"))
+        sys.exit(1)
+    print(colored("No heavy modules loaded on the query path", "green"))
+
+
+if __name__ == "__main__":
+    main()
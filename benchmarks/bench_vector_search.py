@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""Search latency of VectorStore against corpus size.
+
+Run from the repository root: python -m benchmarks.bench_vector_search
+"""
+import json
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import click
+import numpy as np
+from termcolor import colored
+
+from src.vector_store import VectorStore
+
+
+def populate(vector_store: VectorStore, n_records: int, dim: int, rng: np.random.Generator, batch_size: int = 1000) -> None:
+    """Fill the store with random unit vectors and small synthetic documents"""
+    model_name = vector_store.embedding_generator.model_name
+    for start in range(0, n_records, batch_size):
+        n = min(batch_size, n_records - start)
+        embeddings = rng.standard_normal((n, dim)).astype(np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        vector_store.collection.add(
+            ids=[f"bench-{start + i}" for i in range(n)],
+            embeddings=embeddings,
+            metadatas=[{"summary": f"synthetic {start + i}", "model": "bench", "embedding_model": model_name} for i in range(n)],
+            documents=[json.dumps({"query": f"query {start + i}", "response": "response"}) for i in range(n)],
+        )
+
+
+@click.command()
+@click.option('--sizes', default="100,1000,10000", help='Comma-separated corpus sizes')
+@click.option('--queries', default=50, type=int, help='Queries timed per corpus size')
+@click.option('--limit', default=5, type=int, help='Results per query')
+def main(sizes, queries, limit):
+    """Time VectorStore.search_by_embedding for growing corpora"""
+    rng = np.random.default_rng(0)
+    print(colored(f"{'records':>10} {'load ms':>10} {'median ms':>10} {'p95 ms':>10}", "cyan"))
+
+    for size in [int(s) for s in sizes.split(",")]:
+        with tempfile.TemporaryDirectory() as tmp:
+            vector_store = VectorStore(data_dir=Path(tmp))
+            dim = len(vector_store.embedding_generator.get_embedding("dimension probe"))
+            populate(vector_store, size, dim, rng)
+
+            # First search loads the stored embeddings into the similarity index
+            start = time.perf_counter()
+            vector_store.search_by_embedding([0.0] * dim, limit=limit)
+            load_ms = (time.perf_counter() - start) * 1000
+
+            timings = []
+            for _ in range(queries):
+                query = rng.standard_normal(dim).astype(np.float32)
+                query /= np.linalg.norm(query)
+                start = time.perf_counter()
+                vector_store.search_by_embedding(query.tolist(), limit=limit)
+                timings.append((time.perf_counter() - start) * 1000)
+
+            p95 = statistics.quantiles(timings, n=20)[-1]
+            print(f"{size:>10} {load_ms:>10.2f} {statistics.median(timings):>10.2f} {p95:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
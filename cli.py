@@ -3,14 +3,15 @@ import click
 from termcolor import colored
 import sys
 from pathlib import Path
-from time import sleep
 
-from config import DEFAULT_MODEL, DEFAULT_SYSTEM_PROMPT_NAME, SUPPORTED_MODELS, PROMPTS
+from config import (
+    DEFAULT_MODEL, DEFAULT_SYSTEM_PROMPT_NAME, SUPPORTED_MODELS, PROMPTS, FILE_PROCESSING_WORKERS,
+    STDIN_HEAD_TOKENS, STDIN_TAIL_TOKENS,
+)
 from src.llm import LLM
 from src.response_handler import ResponseHandler
 from src.file_processor import FileProcessor
-from src.vector_store import VectorStore
-from src.search_service import SearchService
+from src.file_scheduler import FileScheduler
 
 ### CLI ######
 
@@ -26,7 +27,10 @@ from src.search_service import SearchService
 @click.option('-o', '--output', type=str, help='Output destination (obsidian_papers, file, or directory path)')
 @click.option('--force', is_flag=True, help='Force overwrite existing output files')
 @click.option('--no-store', is_flag=True, help='Do not store this interaction in the vector database')
-def main_cli(ctx, query, prompt, model, temperature, vision, file, output, force, no_store, syllabus):
+@click.option('-j', '--jobs', type=int, default=FILE_PROCESSING_WORKERS, help='Number of files processed concurrently')
+@click.option('--stdin-head', type=int, default=STDIN_HEAD_TOKENS, help='Tokens kept from the start of piped input')
+@click.option('--stdin-tail', type=int, default=STDIN_TAIL_TOKENS, help='Tokens kept from the end of piped input')
+def main_cli(ctx, query, prompt, model, temperature, vision, file, output, force, no_store, syllabus, jobs, stdin_head, stdin_tail):
     """LLM CLI tool - running without subcommand acts as basic query"""
     if ctx.invoked_subcommand is None:
         # Initialize services
@@ -58,33 +62,28 @@ def main_cli(ctx, query, prompt, model, temperature, vision, file, output, force
                 print(colored(f"No processable files found in {file}", "red"))
                 return
                 
-            for file_path in files:
-                print(colored(f"Processing file: {file_path}", "cyan"))
-                
+            def process_file(file_path):
+                """Runs on a worker thread; output is written on the main thread in file order"""
                 if file_path.suffix.lower() == '.pdf':
-                    summary = llm.process_pdf(file_path, PROMPTS.get(prompt, ""))
-                    if summary:
-                        response_handler.handle_response(summary, output, file_path)
-                    
-                    # to get around tight rate limits from e.g. Gemini pro 2.5
-                    sleep(30)
-                else:
-                    # Regular file processing
-                    try:
-                        content = file_processor.process_text_file(str(file_path))
-                        
-                        # Check if the file was too large
-                        if "[File too large" in content['text']:
-                            print(colored(content['text'], "yellow"))
-                            continue
-                            
-                        # Prepare query and get response
-                        prompt_text = f"{content['text']}\n\n{PROMPTS.get(prompt, '')}"
-                        messages = [{"role": "user", "content": prompt_text}]
-                        response = llm.query(messages=messages)
-                        response_handler.handle_response(response, output, file_path, query=prompt_text)
-                    except Exception as e:
-                        print(colored(f"Error processing file {file_path}: {e}", "red"))
+                    return {"response": llm.process_pdf(file_path, PROMPTS.get(prompt, ""))}
+
+                # Regular file processing
+                content = file_processor.process_text_file(str(file_path))
+
+                # Prepare query and get response
+                prompt_text = f"{content['text']}\n\n{PROMPTS.get(prompt, '')}"
+                messages = [{"role": "user", "content": prompt_text}]
+                return {"response": llm.query(messages=messages), "query": prompt_text}
+
+            # Results are written in path order regardless of which request finishes first
+            files = sorted(files)
+            print(colored(f"Processing {len(files)} files with up to {jobs} workers", "cyan"))
+            for file_path, result, error in FileScheduler(workers=jobs).map(process_file, files):
+                print(colored(f"Processing file: {file_path}", "cyan"))
+                if error:
+                    print(colored(f"Error processing file {file_path}: {error}", "red"))
+                elif result["response"]:
+                    response_handler.handle_response(result["response"], output, file_path, query=result.get("query"))
             
             return
             
@@ -95,14 +94,14 @@ def main_cli(ctx, query, prompt, model, temperature, vision, file, output, force
            
             # Add terminal input if available
             if not sys.stdin.isatty():
-                llm_content.append(file_processor.process_terminal_input())
+                llm_content.append(file_processor.process_terminal_input(stdin_head, stdin_tail))
 
             # Add the user's query
             llm_content.append({"type": "text", "text": f"\nQuery\n: {query}"})
 
             # Add image if specified
             if vision:
-                llm_content.append(file_processor.process_image(vision))
+                llm_content.append(file_processor.process_image(vision, llm.llm_config.provider))
 
             # Create the messages for the LLM
             messages = [{"role": "user", "content": llm_content}]
@@ -154,6 +153,41 @@ def supported_models():
         provider = config.provider
         print(colored(f"- {model} ({provider})", "green"))
 
+@main_cli.command()
+def embedding_cache_stats():
+    """Show hit/miss statistics of the embedding cache"""
+    from src.embedding_cache import EmbeddingCache
+
+    stats = EmbeddingCache().stats()
+    print(colored(f"Embedding cache: {stats['entries']}/{stats['max_entries']} entries", "cyan", attrs=["bold"]))
+    for scope in ("session", "lifetime"):
+        scope_stats = stats[scope]
+        if scope == "session" and scope_stats["hits"] + scope_stats["misses"] == 0:
+            continue
+        print(colored(
+            f"- {scope}: {scope_stats['hits']} hits, {scope_stats['misses']} misses "
+            f"({scope_stats['hit_rate']:.0%} hit rate), "
+            f"~{scope_stats['estimated_seconds_saved']:.1f}s encoder time saved",
+            "green"
+        ))
+
+@main_cli.command()
+@click.argument('action', type=click.Choice(['status', 'start', 'stop']), default='status')
+def tika_server(action):
+    """Start, stop or check the shared local Tika server used for document parsing"""
+    from src.tika_server import TikaServer
+
+    server = TikaServer()
+    if action == 'start':
+        ok = server.ensure_running()
+        print(colored(f"Tika server {'running' if ok else 'could not be started'} at {server.endpoint}", "green" if ok else "red"))
+    elif action == 'stop':
+        print(colored("Tika server stopped" if server.stop() else "No Tika server started by llm is running", "cyan"))
+    else:
+        pid = server.server_pid()
+        status = "running" if server.healthy() else "not running"
+        print(colored(f"Tika server at {server.endpoint}: {status}" + (f" (pid {pid})" if pid else ""), "cyan"))
+
 @main_cli.command()
 @click.argument('search_query')
 @click.option('--limit', '-l', type=int, default=5, help='Maximum number of results to return')
@@ -161,6 +195,9 @@ def supported_models():
 @click.option('--min-similarity', type=float, default=0.7, help='Minimum similarity score (0.0-1.0)')
 def search(search_query, limit, detailed, min_similarity):
     """Search previous interactions for similar queries or content"""
+    # Imported here so regular queries never load chromadb or sentence-transformers
+    from src.search_service import SearchService
+
     try:
         # Initialize search service
         search_service = SearchService()
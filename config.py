@@ -3,11 +3,15 @@ from pathlib import Path
 import logging
 from dataclasses import dataclass   
 from datetime import datetime
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
 import yaml
-from pydantic import BaseModel
 from prompts.prompts import PROMPTS
 
+if TYPE_CHECKING:
+    # Only needed for annotations; pydantic is slow to import on the CLI hot path
+    from pydantic import BaseModel
+
 load_dotenv()
 # Load config from YAML
 with open(Path('~/Projects/cli_llm/config.yaml').expanduser().resolve(), 'r') as f:
@@ -28,14 +32,136 @@ ALLOWED_EXTENSIONS = {
     '.html', '.css', '.json', '.yaml', '.yml', 
     '.pdf', '.doc', '.docx', '.rtf', '.sql', '.sh', '.bash', '.zsh', '.fish',
 }
+# Extensions read directly as text; every other allowed extension goes through Tika (and OCR for PDFs)
+TEXT_EXTENSIONS = {
+    '.txt', '.md', '.py', '.js', '.jsx', '.ts', '.tsx', '.html', '.css', '.json',
+    '.yaml', '.yml', '.sql', '.sh', '.bash', '.zsh', '.fish',
+}
 EXCLUDED_DIRS = {'.git', '.venv', '__pycache__', 'node_modules', 'build', 'dist', 'env', 'bin', 'lib', 'include', 'share', 'tmp', 'temp', 'cache'}
 
+# Project trees in session prompts: directories expanded below the listed path, entries shown per directory,
+# and total lines before the tree is cut off
+TREE_MAX_DEPTH = 8
+TREE_MAX_ENTRIES = 100
+TREE_MAX_LINES = 2000
+
 # Maximum tokens per file
 MAX_TOKENS = 100_000
 
+# Text files over MAX_TOKENS keep an excerpt instead: "head_tail" (beginning and end) or "sample" (evenly spaced windows)
+TEXT_EXCERPT_MODE = "head_tail"
+TEXT_SAMPLE_WINDOWS = 8
+
+# Piped stdin keeps its first and last tokens in a rolling window; the tail gets more since logs end with the errors
+STDIN_HEAD_TOKENS = 20_000
+STDIN_TAIL_TOKENS = 80_000
+
 # Supported image extensions
 IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp'}
 
+# Images sent to models: longest edge per provider (larger ones are downscaled when Pillow is installed), the format
+# and quality they are re-encoded to, and the cap on cached prepared payloads under CLI_LLM_DIR/image_cache
+IMAGE_MAX_DIMENSIONS = {"anthropic": 1568, "openai": 2048, "gemini": 3072, "perplexity": 2048}
+IMAGE_DEFAULT_MAX_DIMENSION = 2048
+IMAGE_FORMAT = "WEBP"
+IMAGE_QUALITY = 85
+IMAGE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Local state (vector db, caches) lives under here
+CLI_LLM_DIR = Path.home() / ".cli_llm"
+
+# Sentence-transformers model used for the vector store. Changing it triggers a re-embed of stored interactions.
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+# Texts per SentenceTransformer forward pass, and texts per yielded block when streaming embeddings
+EMBEDDING_BATCH_SIZE = 64
+EMBEDDING_STREAM_CHUNK_SIZE = 4096
+# Max vectors kept in the on-disk embedding cache before least-recently-used eviction (~1.5KB each for MiniLM)
+EMBEDDING_CACHE_MAX_ENTRIES = 100_000
+# Long interactions and retrieval files are embedded as overlapping windows so nothing past the encoder's input
+# limit (256 word-pieces for all-MiniLM-L6-v2) is silently dropped. Windows are counted with the embedding model's
+# own tokenizer and capped at its limit; search pools chunk scores back to the interaction ("max" or "mean")
+EMBEDDING_CHUNK_TOKENS = 180
+EMBEDDING_CHUNK_OVERLAP = 40
+EMBEDDING_CHUNK_POOLING = "max"
+# Chunks of the session's files sent with each query when a session sets `retrieval: true` (override: retrieval_top_k)
+RETRIEVAL_TOP_K = 20
+
+# Write-behind storage of interactions: batch size of the background writer, seconds the CLI waits for it at exit,
+# and whether leftovers are handed to a detached drainer process (otherwise the next run stores them)
+INTERACTION_WRITE_BATCH_SIZE = 32
+INTERACTION_WRITE_EXIT_GRACE = 2.0
+INTERACTION_WRITE_DETACH_ON_EXIT = True
+# Seconds the detached drainer waits for the exiting CLI run, so it can recover the batch that run was writing,
+# and how long it then stays around storing what later runs spool (they do not start drainers of their own)
+INTERACTION_DRAINER_WAIT = 30.0
+INTERACTION_DRAINER_IDLE = 120.0
+
+# Interactions summarised per structured-output request, and how much of each query/response is sent along
+SUMMARY_BATCH_SIZE = 20
+SUMMARY_MAX_CHARS_PER_FIELD = 2000
+# Pending interactions summarised per background write, attempts before an interaction is left without a summary,
+# and the base of the exponential delay (seconds) before a failed one is retried
+SUMMARY_PENDING_LIMIT = SUMMARY_BATCH_SIZE * 3
+SUMMARY_MAX_ATTEMPTS = 5
+SUMMARY_RETRY_BACKOFF = 60.0
+
+# Shared HTTP connection pools for provider clients (HTTP/2 is used when the optional h2 package is installed)
+HTTP_MAX_CONNECTIONS = 20
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 10
+HTTP_KEEPALIVE_EXPIRY = 60.0
+
+# Files processed concurrently by `llm -f <dir>`, and retry/backoff behaviour when a provider answers 429
+FILE_PROCESSING_WORKERS = 4
+RATE_LIMIT_MAX_RETRIES = 6
+RATE_LIMIT_BACKOFF_BASE = 2.0
+RATE_LIMIT_BACKOFF_MAX = 120.0
+
+# Default timeout (seconds) for LLM.aquery, and for the wait on each chunk in LLM.astream
+LLM_REQUEST_TIMEOUT = 600.0
+
+# Maximum number of uncached session search terms fetched from Perplexity at once
+SEARCH_CONCURRENCY = 4
+
+# Document parsing: Tika/OCR run in worker processes, direct text reads in threads
+TIKA_TIMEOUT = 180
+DOCUMENT_PARSE_PROCESSES = min(4, os.cpu_count() or 1)
+DOCUMENT_READ_THREADS = 8
+
+# Tika runs as one long-lived local server (started on first use, left running for later invocations) that every
+# parse process talks to over pooled keep-alive connections; when it cannot be started, tika.parser is used as before
+TIKA_MANAGED_SERVER = True
+TIKA_SERVER_ENDPOINT = os.environ.get("TIKA_SERVER_ENDPOINT", "http://localhost:9998")
+TIKA_JAVA = os.environ.get("TIKA_JAVA", "java")
+TIKA_STARTUP_TIMEOUT = 60
+TIKA_POOL_SIZE = 8
+
+# OCR of scanned PDFs: pages are rasterized OCR_BATCH_PAGES at a time and OCRed across OCR_PROCESSES workers
+OCR_DPI = 200
+OCR_BATCH_PAGES = 4
+OCR_PROCESSES = min(4, os.cpu_count() or 1)
+OCR_LANGUAGE = "eng"
+# Pages whose text layer has fewer characters than this are OCRed; with OCR_MIXED_PDFS, also in PDFs Tika could read
+OCR_MIN_PAGE_CHARS = 20
+OCR_MIXED_PDFS = True
+# Share of textless pages from which a mixed PDF is rebuilt from text layer plus OCR; below it Tika's text is kept
+# and the OCR text of those pages appended
+OCR_MIXED_MIN_FRACTION = 0.25
+
+# Global cache of extracted document text, keyed by content hash; least recently used text is evicted beyond this
+PARSE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Token counts memoized per encoding (by content hash), and threads used by batch counting
+TOKEN_COUNT_CACHE_SIZE = 4096
+TOKENIZER_THREADS = 8
+
+# Prompt packing for models with a context_window: fraction of the window held back for tokenizer mismatch
+# (Gemini/Claude are counted with cl100k), each section's guaranteed share of the budget left after the query,
+# the smallest excerpt worth sending of a trimmed file, and the flat cost assumed per attached image
+CONTEXT_SAFETY_MARGIN = 0.05
+CONTEXT_SECTION_SHARES = {"history": 0.3, "files": 0.5, "search": 0.15, "structure": 0.05}
+CONTEXT_MIN_EXCERPT_TOKENS = 200
+CONTEXT_IMAGE_TOKENS = 1_500
+
 DEFAULT_METADATA = {
     "created_at": datetime.now().isoformat(),
     "llm_config": "flash",
@@ -58,9 +184,12 @@ class LLMConfig:
     provider: str = "openai"
     base_url: str | None = None
     tools: list[dict] | None = None 
-    response_format: type[BaseModel] | None = None
+    response_format: "type[BaseModel] | None" = None
     extended_thinking: bool | None = None 
     budget_tokens: int | None = None # budget for thinking tokens
+    requests_per_minute: int | None = None # client-side rate limits, None = only back off on 429s
+    tokens_per_minute: int | None = None
+    context_window: int | None = None # input + output tokens the model accepts, None = prompts are not packed
 
 flash = LLMConfig(
     model_name="gemini-2.5-flash",
@@ -70,6 +199,7 @@ flash = LLMConfig(
     system_prompt=PROMPTS["default"],
     provider="gemini",
     base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
+    context_window=1_048_576,
 )
 claude = LLMConfig(
     model_name="claude-sonnet-4-20250514",
@@ -79,6 +209,7 @@ claude = LLMConfig(
     system_prompt=PROMPTS[DEFAULT_SYSTEM_PROMPT_NAME],
     provider="anthropic",
     base_url="https://api.anthropic.com/v1/",
+    context_window=200_000,
 )
 pro = LLMConfig(
     model_name="gemini-2.5-pro",
@@ -88,6 +219,9 @@ pro = LLMConfig(
     system_prompt=PROMPTS["default"],
     provider="gemini",
     base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
+    requests_per_minute=5,
+    tokens_per_minute=250_000,
+    context_window=1_048_576,
 )
 report = LLMConfig(
     model_name="gemini-exp-1206",
@@ -97,6 +231,7 @@ report = LLMConfig(
     system_prompt=PROMPTS["report"],
     provider="gemini",
     base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
+    context_window=2_097_152,
 )
 explainer = LLMConfig(
     model_name="gemini-2.5-pro",
@@ -105,7 +240,10 @@ explainer = LLMConfig(
     max_tokens=8000,
     system_prompt=PROMPTS['explain'],
     provider="gemini",
-    base_url="https://generativelanguage.googleapis.com/v1beta/openai/"
+    base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
+    requests_per_minute=5,
+    tokens_per_minute=250_000,
+    context_window=1_048_576,
 )
 o4_mini = LLMConfig(
     model_name="o4-mini",
@@ -113,7 +251,8 @@ o4_mini = LLMConfig(
     temperature=0.5,
     max_tokens=100000,
     system_prompt=PROMPTS[DEFAULT_SYSTEM_PROMPT_NAME],
-    provider="openai"
+    provider="openai",
+    context_window=200_000,
 )
 visualise = LLMConfig(
     model_name="gemini-2.0-flash",
@@ -122,7 +261,8 @@ visualise = LLMConfig(
     max_tokens=8000,
     system_prompt=PROMPTS['visualise'],
     provider="gemini",
-    base_url="https://generativelanguage.googleapis.com/v1beta/openai/"
+    base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
+    context_window=1_048_576,
 )
 o3 = LLMConfig(
     model_name="o3",
@@ -130,7 +270,8 @@ o3 = LLMConfig(
     temperature=0.5,
     max_tokens=65536,
     system_prompt=PROMPTS[DEFAULT_SYSTEM_PROMPT_NAME],
-    provider="openai"
+    provider="openai",
+    context_window=200_000,
 )
 perplexity = LLMConfig(
     model_name="sonar",  
@@ -139,7 +280,8 @@ perplexity = LLMConfig(
     max_tokens=8000,
     system_prompt="",
     provider="perplexity",
-    base_url="https://api.perplexity.ai"
+    base_url="https://api.perplexity.ai",
+    context_window=127_072,
 )
 
 SUPPORTED_MODELS = {
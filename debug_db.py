@@ -17,13 +17,13 @@ client = chromadb.PersistentClient(path=str(data_dir))
 try:
     # Get collection
     collection = client.get_collection("llm_responses")
-    count = collection.count()
-    print(f"Found collection with {count} items")
+    print(f"Found collection with {collection.count()} records (interactions and their chunks)")
     
-    # Query all items
+    # Query all interactions, including ones stored before chunking; chunk records hold raw text rather than JSON
+    results = collection.get(where={"record_type": {"$ne": "chunk"}})
+    count = len(results['ids'])
     if count > 0:
-        results = collection.get(limit=count)
-        print(f"Retrieved {len(results['ids'])} items")
+        print(f"Retrieved {count} interactions")
         
         print("\nCollection contents:")
         for i in range(len(results['ids'])):
@@ -1,10 +1,12 @@
+import asyncio
 from pathlib import Path
-from typing import Dict
+from typing import Dict, List, Tuple
 import click
 from termcolor import colored
 
 from config import SUPPORTED_MODELS
 from src.llm import LLM
+from src.client_pool import run_async
 from config_logger import logger
 
 # Define evaluation prompts
@@ -54,6 +56,19 @@ def save_response(model_name: str, prompt_name: str, response: str):
         f.write(response)
     logger.info(f"Saved response for prompt '{prompt_name}' under model '{model_name}'.")
 
+async def run_prompt(model_name: str, prompt_key: str, llm: LLM):
+    messages = [{"role": "user", "content": EVALUATION_PROMPTS[prompt_key]["prompt"]}]
+    try:
+        response = await llm.aquery(messages=messages)
+        save_response(model_name, prompt_key, response)
+        print(colored(f"    ✔ Completed '{prompt_key}' for '{model_name}'.", "green"))
+    except Exception as e:
+        print(colored(f"    ✖ Error running '{prompt_key}' for '{model_name}': {e}", "red"))
+        logger.error(f"Error running prompt '{prompt_key}' for model '{model_name}': {e}")
+
+async def run_evaluations(pending: List[Tuple[str, str, LLM]]):
+    await asyncio.gather(*(run_prompt(model_name, prompt_key, llm) for model_name, prompt_key, llm in pending))
+
 @click.command()
 @click.option('--models', '-m', multiple=True, help='Specify models to evaluate. If not provided, all supported models are evaluated.')
 @click.option('--re-run', is_flag=True, help='Re-run evaluations even if responses already exist.')
@@ -65,6 +80,7 @@ def evaluate(models: tuple, re_run: bool):
     ensure_model_dirs()
 
     models_to_evaluate = models if models else SUPPORTED_MODELS.keys()
+    pending: List[Tuple[str, str, LLM]] = []
 
     for model_name in models_to_evaluate:
         if model_name not in SUPPORTED_MODELS:
@@ -78,7 +94,6 @@ def evaluate(models: tuple, re_run: bool):
         
         for prompt_key, prompt_detail in EVALUATION_PROMPTS.items():
             prompt_description = prompt_detail["description"]
-            prompt_text = prompt_detail["prompt"]
 
             response_path = EVALUATIONS_DIR / model_name / f"{prompt_key}.txt"
             if response_path.exists() and not re_run:
@@ -86,15 +101,11 @@ def evaluate(models: tuple, re_run: bool):
                 logger.info(f"Skipped prompt '{prompt_key}' for model '{model_name}' as response already exists.")
                 continue
 
-            print(colored(f"  Running prompt '{prompt_key}': {prompt_description}", "green"))
-            messages = [{"role": "user", "content": prompt_text}]
-            try:
-                response = llm.query(messages=messages)
-                save_response(model_name, prompt_key, response)
-                print(colored(f"    ✔ Completed '{prompt_key}'.", "green"))
-            except Exception as e:
-                print(colored(f"    ✖ Error running '{prompt_key}': {e}", "red"))
-                logger.error(f"Error running prompt '{prompt_key}' for model '{model_name}': {e}")
+            print(colored(f"  Queued prompt '{prompt_key}': {prompt_description}", "green"))
+            pending.append((model_name, prompt_key, llm))
+
+    # Every model/prompt pair runs concurrently from one event loop; each model's rate limiter paces its own requests
+    run_async(run_evaluations(pending))
 
     print(colored("\nEvaluation completed.", "green", attrs=["bold"]))
     logger.info("Completed evaluations.")
@@ -51,6 +51,9 @@ for item in sample_data:
     )
     print(f"Added interaction {interaction_id}")
 
+# Summaries are generated in batches rather than one request per interaction
+print(f"Summarised {vector_store.summarize_pending()} interactions")
+
 print("Database populated successfully!")
 print("Try searching with: python search_cli.py \"your search query\"")
 
@@ -25,7 +25,7 @@ def search(search_query, limit, detailed, min_similarity, debug):
             
             # Count items
             count = vector_store.collection.count()
-            print(f"Database contains {count} items")
+            print(f"Database contains {count} records (interactions and their chunks)")
             
             # Get embedding for query
             from src.embeddings import EmbeddingGenerator
@@ -33,9 +33,9 @@ def search(search_query, limit, detailed, min_similarity, debug):
             query_embedding = generator.get_embedding(search_query)
             print(f"Generated embedding for query with {len(query_embedding)} dimensions")
             
-            # Get all items
-            items = vector_store.collection.get()
-            print(f"Retrieved {len(items['ids'])} items from database")
+            # Get all interactions, including ones stored before chunking; chunk records hold raw text rather than JSON
+            items = vector_store.collection.get(where={"record_type": {"$ne": "chunk"}}, include=["documents", "embeddings"])
+            print(f"Retrieved {len(items['ids'])} interactions from database")
             print(f"Fields: {list(items.keys())}")
             
             # Calculate similarities directly
@@ -0,0 +1,46 @@
+from typing import List, Optional, Sequence, Tuple
+
+from config import EMBEDDING_CHUNK_TOKENS, EMBEDDING_CHUNK_OVERLAP
+from src.tokenizer import get_tokenizer
+
+# (start, end) character offsets of one token in the text it came from
+Span = Tuple[int, int]
+
+
+def windows(n_tokens: int, max_tokens: int = EMBEDDING_CHUNK_TOKENS, overlap: int = EMBEDDING_CHUNK_OVERLAP) -> List[Tuple[int, int]]:
+    """(start, end) token ranges of the chunks of an n_tokens long text; chunk k starts at k * (max_tokens - overlap)"""
+    if overlap >= max_tokens:
+        raise ValueError(f"Chunk overlap ({overlap}) must be smaller than chunk size ({max_tokens})")
+    if n_tokens <= max_tokens:
+        return [(0, n_tokens)]
+
+    step = max_tokens - overlap
+    ranges = []
+    for start in range(0, n_tokens, step):
+        ranges.append((start, min(start + max_tokens, n_tokens)))
+        if start + max_tokens >= n_tokens:
+            break
+    return ranges
+
+
+def chunk_text(text: str,
+               max_tokens: int = EMBEDDING_CHUNK_TOKENS,
+               overlap: int = EMBEDDING_CHUNK_OVERLAP,
+               spans: Optional[Sequence[Span]] = None) -> List[str]:
+    """
+    Split text into windows of at most max_tokens tokens, consecutive windows sharing `overlap` tokens.
+    Tokens are the embedding model's own when their character spans are given (see
+    EmbeddingGenerator.token_spans), cl100k tokens otherwise.
+    """
+    if spans is not None:
+        ranges = windows(len(spans), max_tokens, overlap)
+        if len(ranges) == 1:
+            return [text]
+        return [text[spans[start][0]:spans[end - 1][1]] for start, end in ranges]
+
+    tokenizer = get_tokenizer()
+    tokens = tokenizer.encode(text)
+    ranges = windows(len(tokens), max_tokens, overlap)
+    if len(ranges) == 1:
+        return [text]
+    return [tokenizer.encoding.decode(tokens[start:end]) for start, end in ranges]
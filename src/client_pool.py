@@ -0,0 +1,210 @@
+import asyncio
+import concurrent.futures
+import importlib.util
+import threading
+import weakref
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from config import (
+    LLMConfig,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    HTTP_KEEPALIVE_EXPIRY,
+)
+from config_logger import logger
+from src.lazy_import import lazy_import
+
+openai = lazy_import("openai")
+anthropic = lazy_import("anthropic")
+httpx = lazy_import("httpx")
+
+ClientKey = Tuple[str, Optional[str], Optional[str]]
+T = TypeVar("T")
+
+
+class ClientRegistry:
+    """
+    Process-wide cache of provider SDK clients keyed by (provider, base_url, api_key).
+    Every client shares one keep-alive HTTP connection pool, so repeated LLM(...) constructions
+    (per search term, per summary batch) reuse open TLS connections instead of handshaking again.
+    """
+
+    def __init__(self):
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._clients: Dict[ClientKey, Any] = {}
+        # httpx async pools are bound to the event loop that opened them, so async clients are cached per loop
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[ClientKey, Any]]" = weakref.WeakKeyDictionary()
+        self._stats: Dict[ClientKey, Dict[str, int]] = {}
+        self.http2 = importlib.util.find_spec("h2") is not None
+
+    def get(self, llm_config: LLMConfig) -> Any:
+        """Shared SDK client for the config's provider, base URL and API key"""
+        key = _client_key(llm_config)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = self._clients[key] = self._create(key[0], llm_config, self._stats_for(key))
+            else:
+                self._stats[key]["clients_reused"] += 1
+            return client
+
+    def get_async(self, llm_config: LLMConfig) -> Any:
+        """Shared async SDK client for the running event loop"""
+        key = _client_key(llm_config)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = self._async_clients.setdefault(loop, {})
+            client = clients.get(key)
+            if client is None:
+                client = clients[key] = self._create_async(key[0], llm_config, self._stats_for(key))
+            else:
+                self._stats[key]["clients_reused"] += 1
+            return client
+
+    async def aclose_loop(self) -> None:
+        """Close the async clients opened on the running event loop; must run before that loop ends"""
+        with self._lock:
+            clients = self._async_clients.pop(asyncio.get_running_loop(), {})
+        for client in clients.values():
+            try:
+                await client.close()
+            except Exception as e:
+                self.logger.warning(f"Error closing async provider client: {e}")
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-pool request counts, client reuse and (where the transport exposes it) open connections"""
+        with self._lock:
+            result: Dict[str, Dict[str, Any]] = {}
+            for key, client in self._clients.items():
+                family, base_url, _ = key
+                # API keys are never reported; pools for different keys on one endpoint are summed
+                entry = result.setdefault(f"{family}:{base_url or 'default'}", {
+                    "pools": 0, "clients_reused": 0, "requests": 0, "responses": 0,
+                    "open_connections": 0, "http2": self.http2,
+                })
+                entry["pools"] += 1
+                for name, value in self._stats[key].items():
+                    entry[name] += value
+                open_connections = _open_connections(client)
+                if open_connections is None or entry["open_connections"] is None:
+                    entry["open_connections"] = None
+                else:
+                    entry["open_connections"] += open_connections
+            return result
+
+    def close(self) -> None:
+        """Close every pooled connection and forget the clients"""
+        with self._lock:
+            for client in self._clients.values():
+                try:
+                    client.close()
+                except Exception as e:
+                    self.logger.warning(f"Error closing provider client: {e}")
+            self._clients.clear()
+            loops = list(self._async_clients.keys())
+            self._stats.clear()
+        # Async pools can only be closed on their own loop; those of closed loops are just dropped
+        for loop in loops:
+            if loop.is_closed():
+                with self._lock:
+                    self._async_clients.pop(loop, None)
+            elif loop.is_running():
+                asyncio.run_coroutine_threadsafe(self.aclose_loop(), loop)
+            else:
+                loop.run_until_complete(self.aclose_loop())
+
+    def _stats_for(self, key: ClientKey) -> Dict[str, int]:
+        return self._stats.setdefault(key, {"clients_reused": 0, "requests": 0, "responses": 0})
+
+    def _create(self, family: str, llm_config: LLMConfig, stats: Dict[str, int]) -> Any:
+        hooks = {"request": [_counter(stats, "requests")], "response": [_counter(stats, "responses")]}
+        if family == "anthropic":
+            # The pinned anthropic SDK has no DefaultHttpxClient; plain httpx with its default timeout and redirects
+            http_client = httpx.Client(timeout=anthropic.DEFAULT_TIMEOUT, follow_redirects=True,
+                                       http2=self.http2, limits=self._limits(), event_hooks=hooks)
+            return anthropic.Anthropic(api_key=llm_config.api_key, http_client=http_client)
+
+        # The SDK's own httpx subclass keeps its default timeouts and redirect handling
+        http_client = openai.DefaultHttpxClient(http2=self.http2, limits=self._limits(), event_hooks=hooks)
+        if llm_config.base_url:
+            return openai.OpenAI(api_key=llm_config.api_key, base_url=llm_config.base_url, http_client=http_client)
+        return openai.OpenAI(api_key=llm_config.api_key, http_client=http_client)
+
+    def _create_async(self, family: str, llm_config: LLMConfig, stats: Dict[str, int]) -> Any:
+        hooks = {"request": [_async_counter(stats, "requests")], "response": [_async_counter(stats, "responses")]}
+        if family == "anthropic":
+            http_client = httpx.AsyncClient(timeout=anthropic.DEFAULT_TIMEOUT, follow_redirects=True,
+                                            http2=self.http2, limits=self._limits(), event_hooks=hooks)
+            return anthropic.AsyncAnthropic(api_key=llm_config.api_key, http_client=http_client)
+
+        http_client = openai.DefaultAsyncHttpxClient(http2=self.http2, limits=self._limits(), event_hooks=hooks)
+        if llm_config.base_url:
+            return openai.AsyncOpenAI(api_key=llm_config.api_key, base_url=llm_config.base_url, http_client=http_client)
+        return openai.AsyncOpenAI(api_key=llm_config.api_key, http_client=http_client)
+
+    @staticmethod
+    def _limits() -> Any:
+        return httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        )
+
+
+def _client_key(llm_config: LLMConfig) -> ClientKey:
+    family = "anthropic" if llm_config.provider == "anthropic" else "openai"
+    return (family, llm_config.base_url, llm_config.api_key)
+
+
+def _counter(stats: Dict[str, int], name: str) -> Callable[[Any], None]:
+    def hook(_):
+        stats[name] += 1
+    return hook
+
+
+def _async_counter(stats: Dict[str, int], name: str) -> Callable[[Any], Any]:
+    # httpx.AsyncClient requires coroutine event hooks
+    async def hook(_):
+        stats[name] += 1
+    return hook
+
+
+def _open_connections(client: Any) -> Optional[int]:
+    # httpx does not expose its pool publicly; report None rather than fail if the internals change
+    try:
+        return len(client._client._transport._pool.connections)
+    except (AttributeError, TypeError):
+        return None
+
+
+client_registry = ClientRegistry()
+
+
+def get_client(llm_config: LLMConfig) -> Any:
+    return client_registry.get(llm_config)
+
+
+def get_async_client(llm_config: LLMConfig) -> Any:
+    return client_registry.get_async(llm_config)
+
+
+def run_async(awaitable: Awaitable[T]) -> T:
+    """
+    asyncio.run for code using pooled async clients: closes the clients opened on the loop before it ends,
+    so their connections are not leaked with it. Callable from synchronous code running inside an event loop
+    (which asyncio.run refuses); the awaitable then runs on a helper thread's loop.
+    """
+    async def main() -> T:
+        try:
+            return await awaitable
+        finally:
+            await client_registry.aclose_loop()
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(main())
+    # The running loop is blocked by our synchronous caller and cannot run anything until it returns
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="run-async") as executor:
+        return executor.submit(asyncio.run, main()).result()
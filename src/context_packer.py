@@ -0,0 +1,273 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from config import (
+    LLMConfig,
+    CONTEXT_SAFETY_MARGIN,
+    CONTEXT_SECTION_SHARES,
+    CONTEXT_MIN_EXCERPT_TOKENS,
+    CONTEXT_IMAGE_TOKENS,
+)
+from config_logger import logger
+from src.tokenizer import Tokenizer, get_tokenizer
+
+# Sections in priority order; the query is always packed first and never dropped
+SECTIONS = ("history", "files", "search", "structure")
+
+# Tokens of framing (headers, separators) added around every packed item
+ITEM_OVERHEAD = 8
+
+# Characters of each omitted question kept in the summary of dropped turns
+SUMMARY_LINE_CHARS = 160
+
+
+@dataclass
+class PackDecision:
+    section: str
+    name: str
+    tokens: int
+    kept_tokens: int
+    action: str  # "kept", "truncated", "summarized" or "dropped"
+
+
+@dataclass
+class PackedContext:
+    query: str
+    chat_history: List[Dict[str, str]]
+    files: Dict[str, str]
+    search: Dict[str, str]
+    structure: str
+    history_summary: str = ""
+    budget: Optional[int] = None
+    decisions: List[PackDecision] = field(default_factory=list)
+
+    @property
+    def used_tokens(self) -> int:
+        return sum(d.kept_tokens for d in self.decisions)
+
+    def report(self) -> str:
+        """Human-readable account of what was kept, cut or dropped"""
+        if self.budget is None:
+            return "Context not packed (no context window configured)"
+        if not self.decisions:
+            return f"Context fits the {self.budget} token budget untouched"
+        lines = [f"Context budget {self.budget} tokens, used ~{self.used_tokens}"]
+        for d in self.decisions:
+            if d.action == "kept":
+                lines.append(f"  {d.section:<9} {d.name}: kept ({d.tokens} tokens)")
+            else:
+                lines.append(f"  {d.section:<9} {d.name}: {d.action} ({d.tokens} -> {d.kept_tokens} tokens)")
+        return "\n".join(lines)
+
+
+class ContextPacker:
+    """
+    Fits a prompt into a model's context window. After the query, each section gets a guaranteed share of the
+    remaining budget (CONTEXT_SECTION_SHARES) and whatever a section does not use flows to the others in
+    priority order: recent turns, files, search results, project structure.
+    Within a section the oldest turns are dropped first (and replaced by a short list of their questions),
+    and files or search results are trimmed to a fair share each, keeping their beginning and end.
+    """
+
+    def __init__(self, budget: int, tokenizer: Optional[Tokenizer] = None):
+        self.logger = logger
+        self.budget = max(0, budget)
+        self.tokenizer = tokenizer or get_tokenizer()
+
+    @classmethod
+    def for_config(cls, llm_config: LLMConfig) -> Optional["ContextPacker"]:
+        """Packer for a model's input budget, or None if the config has no context_window"""
+        if not llm_config.context_window:
+            return None
+        tokenizer = get_tokenizer(llm_config.model_name)
+        budget = (
+            llm_config.context_window
+            - llm_config.max_tokens
+            - tokenizer.count(llm_config.system_prompt or "")
+            - int(llm_config.context_window * CONTEXT_SAFETY_MARGIN)
+        )
+        return cls(budget, tokenizer)
+
+    def pack(self,
+             query: str,
+             chat_history: List[Dict[str, str]],
+             files: Dict[str, str],
+             search: Dict[str, str],
+             structure: str = "",
+             n_images: int = 0) -> PackedContext:
+        texts = [query, structure, *files.values(), *search.values()]
+        texts += [m["content"] for m in chat_history if isinstance(m.get("content"), str)]
+        # A token is at least one byte, so anything within budget by byte length needs no counting at all
+        n_bytes = sum(len(t.encode("utf-8", "surrogatepass")) + ITEM_OVERHEAD for t in texts)
+        if n_bytes + n_images * CONTEXT_IMAGE_TOKENS <= self.budget:
+            return PackedContext(query, list(chat_history), dict(files), dict(search), structure, budget=self.budget)
+
+        decisions: List[PackDecision] = []
+        remaining = self.budget - n_images * CONTEXT_IMAGE_TOKENS
+
+        query_tokens = self.tokenizer.count(query)
+        if query_tokens > remaining:
+            self.logger.warning(f"Query alone has {query_tokens} tokens, more than the {remaining} available. Truncating it.")
+            query = excerpt(query, remaining, self.tokenizer)
+            decisions.append(PackDecision("query", "query", query_tokens, max(0, remaining), "truncated"))
+            remaining = 0
+        else:
+            decisions.append(PackDecision("query", "query", query_tokens, query_tokens, "kept"))
+            remaining -= query_tokens
+
+        turns = [chat_history[i:i + 2] for i in range(0, len(chat_history), 2)]
+        turn_tokens = [sum(self._count_message(m) + ITEM_OVERHEAD for m in turn) for turn in turns]
+        file_tokens = {name: self.tokenizer.count(text) + ITEM_OVERHEAD for name, text in files.items()}
+        search_tokens = {term: self.tokenizer.count(text) + ITEM_OVERHEAD for term, text in search.items()}
+        structure_tokens = self.tokenizer.count(structure) if structure else 0
+
+        allocation = allocate(
+            {
+                "history": sum(turn_tokens),
+                "files": sum(file_tokens.values()),
+                "search": sum(search_tokens.values()),
+                "structure": structure_tokens,
+            },
+            remaining,
+        )
+
+        kept_history, history_summary = self._pack_history(turns, turn_tokens, allocation["history"], decisions)
+        packed_files = self._pack_items("files", files, file_tokens, allocation["files"], decisions)
+        packed_search = self._pack_items("search", search, search_tokens, allocation["search"], decisions)
+        packed_structure = ""
+        if structure:
+            packed_structure = self._pack_items(
+                "structure", {"project structure": structure}, {"project structure": structure_tokens},
+                allocation["structure"], decisions,
+            ).get("project structure", "")
+
+        packed = PackedContext(
+            query, kept_history, packed_files, packed_search, packed_structure,
+            history_summary, self.budget, decisions,
+        )
+        cut = [d for d in decisions if d.action != "kept"]
+        if cut:
+            self.logger.info(f"Packed context into {self.budget} tokens: {len(cut)} parts truncated, summarized or dropped")
+        self.logger.debug(packed.report())
+        return packed
+
+    def _count_message(self, message: Dict) -> int:
+        content = message.get("content", "")
+        if isinstance(content, str):
+            return self.tokenizer.count(content)
+        return sum(self.tokenizer.count(part.get("text", "")) for part in content if part.get("type") == "text")
+
+    def _pack_history(self,
+                      turns: List[List[Dict[str, str]]],
+                      turn_tokens: List[int],
+                      budget: int,
+                      decisions: List[PackDecision]):
+        """Keep the newest whole turns that fit; older ones are listed by their question if room allows"""
+        kept = 0
+        used = 0
+        for tokens in reversed(turn_tokens):
+            if used + tokens > budget:
+                break
+            used += tokens
+            kept += 1
+
+        first_kept = len(turns) - kept
+        for i, tokens in enumerate(turn_tokens):
+            action = "kept" if i >= first_kept else "dropped"
+            decisions.append(PackDecision("history", f"turn {i + 1}", tokens, tokens if action == "kept" else 0, action))
+
+        summary = ""
+        dropped = turns[:first_kept]
+        if dropped:
+            questions = [" ".join(turn[0]["content"].split())[:SUMMARY_LINE_CHARS] for turn in dropped
+                         if isinstance(turn[0].get("content"), str)]
+            # Most recent omitted questions are the most relevant; drop the oldest lines until it fits
+            while questions:
+                summary = self._history_summary(len(dropped), questions)
+                summary_tokens = self.tokenizer.count(summary)
+                if used + summary_tokens <= budget:
+                    decisions.append(PackDecision(
+                        "history", f"summary of {len(dropped)} earlier turns",
+                        sum(turn_tokens[:first_kept]), summary_tokens, "summarized",
+                    ))
+                    break
+                questions = questions[1:]
+                summary = ""
+
+        return [message for turn in turns[first_kept:] for message in turn], summary
+
+    def _history_summary(self, n_dropped: int, questions: List[str]) -> str:
+        lines = "\n".join(f"- {q}" for q in questions)
+        return (
+            f"{n_dropped} earlier turns of this conversation were omitted to fit the context window. "
+            f"Their questions were:\n{lines}"
+        )
+
+    def _pack_items(self,
+                    section: str,
+                    items: Dict[str, str],
+                    tokens: Dict[str, int],
+                    budget: int,
+                    decisions: List[PackDecision]) -> Dict[str, str]:
+        """Split budget fairly (small items whole, large ones an equal share each) and trim items to their share"""
+        shares = fair_shares(tokens, budget)
+        packed: Dict[str, str] = {}
+        for name, text in items.items():
+            share, size = shares[name], tokens[name]
+            if share >= size:
+                packed[name] = text
+                decisions.append(PackDecision(section, name, size, size, "kept"))
+            elif share - ITEM_OVERHEAD < CONTEXT_MIN_EXCERPT_TOKENS:
+                # A few dozen tokens of a long document mislead more than they help
+                decisions.append(PackDecision(section, name, size, 0, "dropped"))
+            else:
+                packed[name] = excerpt(text, share - ITEM_OVERHEAD, self.tokenizer)
+                decisions.append(PackDecision(section, name, size, share, "truncated"))
+        return packed
+
+
+def excerpt(text: str, max_tokens: int, tokenizer: Optional[Tokenizer] = None) -> str:
+    """Beginning and end of text within max_tokens, with a marker where the middle was cut"""
+    tokenizer = tokenizer or get_tokenizer()
+    if max_tokens <= 0:
+        return ""
+    tokens = tokenizer.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    marker = f"\n[... {len(tokens) - max_tokens} tokens omitted ...]\n"
+    room = max(0, max_tokens - tokenizer.count(marker))
+    head = room * 2 // 3
+    tail = room - head
+    decode = tokenizer.encoding.decode
+    return decode(tokens[:head]) + marker + (decode(tokens[-tail:]) if tail else "")
+
+
+def allocate(demands: Dict[str, int], total: int) -> Dict[str, int]:
+    """
+    Token allocation per section: each gets up to its guaranteed share of total, then leftover budget
+    goes to sections that want more, in priority order.
+    """
+    total = max(0, total)
+    allocation = {
+        section: min(demands.get(section, 0), int(total * CONTEXT_SECTION_SHARES.get(section, 0)))
+        for section in SECTIONS
+    }
+    slack = total - sum(allocation.values())
+    for section in SECTIONS:
+        extra = min(demands.get(section, 0) - allocation[section], slack)
+        allocation[section] += extra
+        slack -= extra
+    return allocation
+
+
+def fair_shares(sizes: Dict[str, int], total: int) -> Dict[str, int]:
+    """Max-min fair split of total: items smaller than an equal share get their size, the rest split what is left"""
+    shares: Dict[str, int] = {}
+    remaining = max(0, total)
+    pending = sorted(sizes, key=sizes.get)
+    while pending:
+        name = pending.pop(0)
+        share = min(sizes[name], remaining // (len(pending) + 1))
+        shares[name] = share
+        remaining -= share
+    return shares
@@ -0,0 +1,203 @@
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from config import (
+    TEXT_EXTENSIONS, TIKA_TIMEOUT, DOCUMENT_PARSE_PROCESSES, DOCUMENT_READ_THREADS, OCR_MIXED_PDFS,
+    OCR_MIXED_MIN_FRACTION,
+)
+from config_logger import logger
+from src.lazy_import import lazy_import
+from src.ocr import OcrEngine, extract_page_texts, failed_pages
+from src.parse_cache import ParseCache, get_parse_cache
+from src.text_reader import read_bounded
+from src.tika_server import get_tika_server
+from src.tokenizer import count_tokens
+
+# Tika pulls in requests and may spawn its JVM server; only load it when a document actually needs parsing
+parser = lazy_import("tika.parser")
+
+
+@dataclass
+class ParseResult:
+    path: Path
+    content: str
+    seconds: float
+    method: str  # "text", "tika", "tika+ocr", "ocr" or "failed"
+    token_count: int = 0
+    cached: bool = False
+
+
+def tika_text(file_path: Path) -> str:
+    """Text of a document from the shared Tika server, or through tika.parser when the server is unavailable"""
+    server = get_tika_server()
+    if server is not None and server.ensure_running():
+        try:
+            return server.parse(file_path)
+        except Exception as e:
+            logger.warning(f"Tika server failed on {file_path}, retrying through tika.parser: {e}")
+    parsed_file = parser.from_file(str(file_path), requestOptions={'timeout': TIKA_TIMEOUT})
+    return (parsed_file.get('content') or "") if parsed_file else ""
+
+
+def ocr_pdf(file_path: Path, page_texts: Optional[List[str]] = None) -> str:
+    """OCR a PDF; every page when Tika finds no text layer, only the textless pages when page_texts is given"""
+    try:
+        return OcrEngine().extract(file_path, page_texts)
+    except Exception as e:
+        logger.error(f"Error in fallback OCR parsing for {file_path}: {e}")
+        return ""
+
+
+def ocr_pdf_pages(file_path: Path, pages: Sequence[int]) -> str:
+    """OCR text of the given 1-based pages of a PDF, in page order"""
+    try:
+        texts = OcrEngine().ocr_pages(file_path, pages)
+    except Exception as e:
+        logger.error(f"Error OCRing pages {list(pages)} of {file_path}: {e}")
+        return ""
+    return "\n\n".join(texts[page].rstrip() for page in sorted(texts) if texts[page].strip())
+
+
+def parse_document(file_path: Path) -> ParseResult:
+    """
+    Parse one file: direct read for text extensions, Tika otherwise, OCR for PDFs Tika cannot read.
+    Module-level so it can run in a worker process.
+    """
+    file_path = Path(file_path)
+    start_time = time.perf_counter()
+    method = "failed"
+    content = ""
+    token_count: Optional[int] = None
+
+    try:
+        if file_path.suffix.lower() in TEXT_EXTENSIONS:
+            # Files over MAX_TOKENS come back as an excerpt, read and counted without loading the whole file
+            text = read_bounded(file_path)
+            content, method, token_count = text.content, "text", text.token_count
+        else:
+            content, method = tika_text(file_path), "tika"
+            if not content.strip() and file_path.suffix.lower() == '.pdf':
+                logger.warning(f"Tika failed to extract content from PDF {file_path}. Attempting OCR.")
+                content, method = ocr_pdf(file_path), "ocr"
+            elif file_path.suffix.lower() == '.pdf' and OCR_MIXED_PDFS:
+                # Scanned pages inside an otherwise digital PDF come back from Tika as nothing at all
+                page_texts = extract_page_texts(file_path) or []
+                failed = failed_pages(page_texts)
+                if failed:
+                    logger.info(f"{len(failed)} of {len(page_texts)} pages of {file_path} have no text layer. Attempting OCR.")
+                if failed and len(failed) >= OCR_MIXED_MIN_FRACTION * len(page_texts):
+                    ocr_content = ocr_pdf(file_path, page_texts)
+                    if ocr_content:
+                        content, method = ocr_content, "ocr"
+                elif failed:
+                    # A few scanned (or simply blank) pages: keep Tika's text and add whatever OCR finds on them
+                    ocr_content = ocr_pdf_pages(file_path, failed)
+                    if ocr_content:
+                        content, method = f"{content.rstrip()}\n\n{ocr_content}", "tika+ocr"
+    except Exception as e:
+        logger.error(f"Failed parsing {file_path} with Tika/direct read. Attempting OCR if PDF. Error: {e}")
+        if file_path.suffix.lower() == '.pdf':
+            content, method = ocr_pdf(file_path), "ocr"
+
+    if not content:
+        return ParseResult(file_path, "", time.perf_counter() - start_time, "failed")
+    # Counted here so the work happens in the pool and the count can be cached next to the text
+    if token_count is None:
+        token_count = count_tokens(content)
+    return ParseResult(file_path, content, time.perf_counter() - start_time, method, token_count)
+
+
+class DocumentParser:
+    """
+    Parses many files at once: Tika and OCR work goes to a process pool, direct text reads to a thread pool.
+    Results come back in input order regardless of which file finishes first.
+    """
+
+    def __init__(self,
+                 processes: int = DOCUMENT_PARSE_PROCESSES,
+                 threads: int = DOCUMENT_READ_THREADS,
+                 cache: Optional[ParseCache] = None,
+                 use_cache: bool = True):
+        self.logger = logger
+        self.processes = max(1, processes)
+        self.threads = max(1, threads)
+        self.cache = (cache or get_parse_cache()) if use_cache else None
+
+    def parse(self, file_path: Path) -> ParseResult:
+        return self.parse_many([file_path])[0]
+
+    def parse_many(self, file_paths: Sequence[Path]) -> List[ParseResult]:
+        file_paths = [Path(p) for p in file_paths]
+        results: List[Optional[ParseResult]] = [None] * len(file_paths)
+        for i, path in enumerate(file_paths):
+            cached = self.cache.get(path) if self.cache else None
+            if cached:
+                results[i] = ParseResult(path, cached.content, 0.0, cached.method, cached.token_count, cached=True)
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        for i, result in zip(missing, self._parse_uncached([file_paths[i] for i in missing])):
+            results[i] = result
+            if self.cache and result.content:
+                self.cache.put(result.path, result.content, result.token_count, result.method)
+
+        self._log_timings(results)
+        return results
+
+    def _parse_uncached(self, file_paths: List[Path]) -> List[ParseResult]:
+        needs_process = [p.suffix.lower() not in TEXT_EXTENSIONS for p in file_paths]
+        n_documents = sum(needs_process)
+
+        # A single document is not worth the worker start-up; parse it on a thread like a text file
+        process_pool: Optional[ProcessPoolExecutor] = None
+        if n_documents > 1 and self.processes > 1:
+            process_pool = ProcessPoolExecutor(max_workers=min(self.processes, n_documents))
+
+        with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="document-read") as thread_pool:
+            try:
+                futures: List[Future] = [
+                    (process_pool if process_pool and heavy else thread_pool).submit(parse_document, path)
+                    for path, heavy in zip(file_paths, needs_process)
+                ]
+                return [self._result(future, path) for future, path in zip(futures, file_paths)]
+            finally:
+                if process_pool:
+                    process_pool.shutdown(cancel_futures=True)
+
+    def _result(self, future: Future, path: Path) -> ParseResult:
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            # A crashed worker (e.g. OCR running out of memory) should cost one retry, not the whole session
+            self.logger.warning(f"Parse worker died while parsing {path}, retrying in-process")
+            return parse_document(path)
+        except Exception as e:
+            self.logger.error(f"Error parsing {path}: {e}")
+            return ParseResult(path, "", 0.0, "failed")
+
+    def _log_timings(self, results: List[ParseResult]) -> None:
+        if not results:
+            return
+        total = sum(r.seconds for r in results)
+        cached = sum(r.cached for r in results)
+        self.logger.info(f"Parsed {len(results) - cached} files, {cached} from cache ({total:.2f}s of parse time)")
+        for (suffix, method), (count, seconds) in sorted(timings_by_type(results).items(), key=lambda kv: -kv[1][1]):
+            self.logger.info(f"  {suffix or '(none)':<8} {method:<6} {count:5d} files  {seconds:7.2f}s  "
+                             f"{seconds / count:6.2f}s avg")
+        for r in sorted(results, key=lambda r: r.seconds, reverse=True)[:10]:
+            self.logger.debug(f"  {r.seconds:7.2f}s  {r.method:<8}  {r.path}")
+
+
+def timings_by_type(results: Sequence[ParseResult]) -> Dict[Tuple[str, str], Tuple[int, float]]:
+    """(suffix, method) -> (files, total seconds) over the results that were actually parsed"""
+    timings: Dict[Tuple[str, str], Tuple[int, float]] = {}
+    for r in results:
+        if r.cached:
+            continue
+        key = (r.path.suffix.lower(), r.method)
+        count, seconds = timings.get(key, (0, 0.0))
+        timings[key] = (count + 1, seconds + r.seconds)
+    return timings
@@ -0,0 +1,150 @@
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from config import CLI_LLM_DIR, EMBEDDING_CACHE_MAX_ENTRIES
+from config_logger import logger
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed embedding cache backed by SQLite.
+    Entries are keyed by a hash of the model name and normalised text and evicted least-recently-used
+    once the cache holds more than max_entries vectors.
+    """
+
+    def __init__(self, path: Optional[Path] = None, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.logger = logger
+        self.path = Path(path) if path else CLI_LLM_DIR / "embedding_cache.sqlite3"
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self.max_entries = max_entries
+
+        # Counters for this process; lifetime totals are kept in the stats table
+        self.hits = 0
+        self.misses = 0
+        self.encode_seconds = 0.0
+        self.encoded_texts = 0
+
+        # The write-behind worker embeds from a background thread, so share one connection behind a lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, dim INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value REAL NOT NULL)")
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        return " ".join(unicodedata.normalize("NFC", text).split())
+
+    @classmethod
+    def make_key(cls, model_name: str, text: str) -> str:
+        return hashlib.sha256(f"{model_name}\x00{cls.normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model_name: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Cached embeddings for texts, with None for misses"""
+        keys = [self.make_key(model_name, text) for text in texts]
+        found: Dict[str, np.ndarray] = {}
+
+        with self._lock:
+            unique_keys = list(dict.fromkeys(keys))
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(unique_keys), 500):
+                batch = unique_keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32)
+
+            if found:
+                now = time.time()
+                with self._conn:
+                    self._conn.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found]
+                    )
+
+            results = [found.get(key) for key in keys]
+            hits = sum(1 for result in results if result is not None)
+            self.hits += hits
+            self.misses += len(results) - hits
+            self._bump_stats(hits=hits, misses=len(results) - hits)
+
+        return results
+
+    def put_many(self, model_name: str, texts: Sequence[str], embeddings) -> None:
+        """Store embeddings for texts and evict the least recently used entries beyond the cap"""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        now = time.time()
+        rows = [
+            (self.make_key(model_name, text), embedding.tobytes(), embedding.shape[0], now)
+            for text, embedding in zip(texts, embeddings)
+        ]
+
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, dim, last_used) VALUES (?, ?, ?, ?)", rows
+            )
+            overflow = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (overflow,),
+                )
+                self.logger.debug(f"Evicted {overflow} embeddings from cache")
+
+    def record_encode(self, n_texts: int, seconds: float) -> None:
+        """Record encoder time spent on cache misses, used to estimate time saved by hits"""
+        with self._lock:
+            self.encode_seconds += seconds
+            self.encoded_texts += n_texts
+            self._bump_stats(encode_seconds=seconds, encoded_texts=n_texts)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counts for this process and lifetime, plus estimated encoder time saved"""
+        with self._lock:
+            lifetime = dict(self._conn.execute("SELECT name, value FROM stats").fetchall())
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+        def summarise(hits, misses, encode_seconds, encoded_texts):
+            lookups = hits + misses
+            seconds_per_text = encode_seconds / encoded_texts if encoded_texts else 0.0
+            return {
+                "hits": int(hits),
+                "misses": int(misses),
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "encode_seconds": encode_seconds,
+                "estimated_seconds_saved": hits * seconds_per_text,
+            }
+
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "session": summarise(self.hits, self.misses, self.encode_seconds, self.encoded_texts),
+            "lifetime": summarise(
+                lifetime.get("hits", 0), lifetime.get("misses", 0),
+                lifetime.get("encode_seconds", 0.0), lifetime.get("encoded_texts", 0),
+            ),
+        }
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.execute("DELETE FROM stats")
+
+    def _bump_stats(self, **increments: float) -> None:
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO stats (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                [(name, value) for name, value in increments.items() if value],
+            )
@@ -1,46 +1,144 @@
 import time
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterable, Iterator
 import numpy as np
-from sentence_transformers import SentenceTransformer
 from config_logger import logger
-from config import LLMConfig
+from config import (
+    LLMConfig, EMBEDDING_MODEL_NAME, EMBEDDING_BATCH_SIZE, EMBEDDING_STREAM_CHUNK_SIZE, EMBEDDING_CHUNK_TOKENS,
+    EMBEDDING_CHUNK_OVERLAP,
+)
+from src.chunking import Span, chunk_text
+from src.embedding_cache import EmbeddingCache
+from src.lazy_import import lazy_import
+
+# Importing sentence-transformers pulls in torch, which takes seconds
+sentence_transformers = lazy_import("sentence_transformers")
 
 class EmbeddingGenerator:
     """Handles generating embeddings using sentence-transformers library"""
     
-    def __init__(self, api_key: str = None):
+    def __init__(self,
+                 api_key: str = None,
+                 model_name: str = EMBEDDING_MODEL_NAME,
+                 cache: Optional[EmbeddingCache] = None,
+                 use_cache: bool = True):
         self.logger = logger
         # api_key is ignored but kept for backward compatibility
         
-        # Load a lightweight multilingual model
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
-        self.logger.info("Initialized sentence-transformers embedding model")
+        # Lightweight model, loaded on first encode so cache hits never pay for it
+        self.model_name = model_name
+        self._model = None
+
+        self.cache = cache if cache is not None else (EmbeddingCache() if use_cache else None)
         
-    def get_embedding(self, text: str) -> List[float]:
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = sentence_transformers.SentenceTransformer(self.model_name)
+            self.logger.info(f"Initialized sentence-transformers embedding model {self.model_name}")
+        return self._model
+
+    @property
+    def max_input_tokens(self) -> Optional[int]:
+        """Tokens the model reads per text, not counting its special tokens; anything longer is truncated"""
+        max_length = getattr(self.model, "max_seq_length", None)
+        return max_length - 2 if isinstance(max_length, int) else None
+
+    @property
+    def chunk_tokens(self) -> int:
+        """Chunk window in the model's own tokens: EMBEDDING_CHUNK_TOKENS, capped at what the model reads"""
+        limit = self.max_input_tokens
+        return min(EMBEDDING_CHUNK_TOKENS, limit) if limit else EMBEDDING_CHUNK_TOKENS
+
+    @property
+    def chunk_overlap(self) -> int:
+        return min(EMBEDDING_CHUNK_OVERLAP, self.chunk_tokens // 2)
+
+    def token_spans(self, text: str) -> Optional[List[Span]]:
+        """Character span of each of the model's tokens in text, or None if the model exposes no tokenizer"""
+        tokenizer = getattr(self.model, "tokenizer", None)
+        if tokenizer is None:
+            return None
+        encoded = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+        return [tuple(span) for span in encoded["offset_mapping"]]
+
+    def chunk(self, text: str) -> List[str]:
+        """Overlapping windows of text that each fit the model's input, measured with its own tokenizer"""
+        return chunk_text(text, max_tokens=self.chunk_tokens, overlap=self.chunk_overlap, spans=self.token_spans(text))
+
+    def get_embedding(self, text: str) -> np.ndarray:
         """Generate embedding for a single text input"""
+        return self.get_batch_embeddings([text])[0]
+        
+    def get_batch_embeddings(self, texts: List[str], batch_size: int = EMBEDDING_BATCH_SIZE) -> np.ndarray:
+        """Generate embeddings for multiple texts as an (n, dim) float32 array, in input order"""
+        if not texts:
+            return np.empty((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        if self.cache is None:
+            return self._encode(texts, batch_size)
+
+        cached = self.cache.get_many(self.model_name, texts)
+        missing = [i for i, embedding in enumerate(cached) if embedding is None]
+        if not missing:
+            return np.stack(cached)
+
+        start = time.perf_counter()
+        encoded = self._encode([texts[i] for i in missing], batch_size)
+        self.cache.record_encode(len(missing), time.perf_counter() - start)
+        self.cache.put_many(self.model_name, [texts[i] for i in missing], encoded)
+
+        embeddings = np.empty((len(texts), encoded.shape[1]), dtype=np.float32)
+        embeddings[missing] = encoded
+        for i, embedding in enumerate(cached):
+            if embedding is not None:
+                embeddings[i] = embedding
+        return embeddings
+
+    def _encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        """Run the encoder over texts in length-sorted batches, returning rows in input order"""
+        # Encode in length order so each batch pads to similar lengths, then scatter back
+        order = np.argsort([len(text) for text in texts], kind="stable")
+        sorted_texts = [texts[i] for i in order]
         try:
-            # Generate embedding
-            embedding = self.model.encode(text)
-            return embedding.tolist()  # Convert numpy array to list
+            encoded = self.model.encode(
+                sorted_texts,
+                batch_size=batch_size,
+                normalize_embeddings=True,
+                convert_to_numpy=True,
+                show_progress_bar=False,
+            )
         except Exception as e:
-            self.logger.error(f"Error generating embedding: {e}")
+            self.logger.error(f"Error generating embeddings: {e}")
             raise
-        
-    def get_batch_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings for multiple texts"""
-        embeddings = []
-        for text in texts:
-            embedding = self.get_embedding(text)
-            embeddings.append(embedding)
+
+        embeddings = np.empty(encoded.shape, dtype=np.float32)
+        embeddings[order] = encoded
         return embeddings
+
+    def iter_batch_embeddings(self,
+                              texts: Iterable[str],
+                              batch_size: int = EMBEDDING_BATCH_SIZE,
+                              chunk_size: int = EMBEDDING_STREAM_CHUNK_SIZE) -> Iterator[np.ndarray]:
+        """Stream embeddings for a large or lazy input, yielding one (chunk, dim) array per chunk_size texts"""
+        chunk = []
+        for text in texts:
+            chunk.append(text)
+            if len(chunk) >= chunk_size:
+                yield self.get_batch_embeddings(chunk, batch_size=batch_size)
+                chunk = []
+        if chunk:
+            yield self.get_batch_embeddings(chunk, batch_size=batch_size)
+
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        """Hit/miss statistics of the embedding cache, or None when caching is disabled"""
+        return self.cache.stats() if self.cache else None
         
     def similarity(self, embedding1: List[float], embedding2: List[float]) -> float:
         """Calculate cosine similarity between two embeddings"""
-        if not embedding1 or not embedding2:
+        if embedding1 is None or embedding2 is None or len(embedding1) == 0 or len(embedding2) == 0:
             return 0.0
             
-        vec1 = np.array(embedding1)
-        vec2 = np.array(embedding2)
+        vec1 = np.asarray(embedding1)
+        vec2 = np.asarray(embedding2)
         
         dot_product = np.dot(vec1, vec2)
         norm1 = np.linalg.norm(vec1)
@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import RETRIEVAL_TOP_K
+from config_logger import logger
+from src.chunking import windows
+from src.embeddings import EmbeddingGenerator
+from src.similarity_index import SimilarityIndex
+from src.tokenizer import get_tokenizer
+
+# 2: chunks are measured in the embedding model's own tokens
+INDEX_VERSION = 2
+
+
+class FileIndex:
+    """
+    Per-session retrieval index over chunks of the session's text files.
+    Chunk embeddings are stored next to the session together with each file's content digest, so a refresh
+    only chunks and embeds files whose text changed; the embedding cache makes unchanged chunks of an
+    edited file free as well. Rows of the embedding matrix follow the manifest's file order.
+    """
+
+    def __init__(self, index_dir: Path, embedding_generator: Optional[EmbeddingGenerator] = None):
+        self.logger = logger
+        self.index_dir = Path(index_dir)
+        self.index_dir.mkdir(exist_ok=True, parents=True)
+        self.manifest_path = self.index_dir / "manifest.json"
+        # Embeddings are written to a new file per update and the manifest points at it, so a crash never pairs
+        # a manifest with another version's rows
+        self.embeddings_file: Optional[str] = None
+
+        self._embedding_generator = embedding_generator
+        self.embedding_model: Optional[str] = None
+        # name -> {"digest", "n_chunks"}, in row order
+        self.files: Dict[str, Dict] = {}
+        self.embeddings: Optional[np.ndarray] = None
+        self._contents: Dict[str, str] = {}
+        self._similarity_index: Optional[SimilarityIndex] = None
+        self._load()
+
+    @property
+    def embedding_generator(self) -> EmbeddingGenerator:
+        if self._embedding_generator is None:
+            self._embedding_generator = EmbeddingGenerator()
+        return self._embedding_generator
+
+    def update(self, files: Dict[str, str]) -> int:
+        """Bring the index in line with files (name -> text); returns how many files were (re-)embedded"""
+        self._contents = dict(files)
+        model_name = self.embedding_generator.model_name
+        if self.embedding_model != model_name:
+            self.files, self.embeddings = {}, None
+
+        digests = {name: _digest(text) for name, text in files.items()}
+        if list(self.files) == list(files) and all(self.files[n]["digest"] == d for n, d in digests.items()):
+            return 0
+
+        rows = self._row_ranges()
+        blocks: List[Tuple[str, object]] = []
+        new_files: Dict[str, Dict] = {}
+        texts_to_embed: List[str] = []
+        for name, text in files.items():
+            entry = self.files.get(name)
+            if entry and entry["digest"] == digests[name]:
+                start, end = rows[name]
+                blocks.append(("stored", self.embeddings[start:end]))
+                new_files[name] = entry
+            else:
+                chunks = self.embedding_generator.chunk(text) if text.strip() else []
+                blocks.append(("new", (len(texts_to_embed), len(texts_to_embed) + len(chunks))))
+                texts_to_embed.extend(chunks)
+                new_files[name] = {"digest": digests[name], "n_chunks": len(chunks)}
+
+        n_embedded = sum(kind == "new" for kind, _ in blocks)
+        fresh = self.embedding_generator.get_batch_embeddings(texts_to_embed) if texts_to_embed else None
+        parts = [block if kind == "stored" else fresh[block[0]:block[1]] for kind, block in blocks]
+        parts = [part for part in parts if part is not None and len(part)]
+
+        self.files = new_files
+        self.embedding_model = model_name
+        self.embeddings = np.vstack(parts).astype(np.float32) if parts else None
+        self._similarity_index = None
+        self._save()
+        self.logger.info(f"Retrieval index: embedded {len(texts_to_embed)} chunks from {n_embedded} changed files, "
+                         f"{len(self.files) - n_embedded} files unchanged")
+        return n_embedded
+
+    def retrieve(self, query: str, top_k: int = RETRIEVAL_TOP_K) -> Dict[str, str]:
+        """
+        Excerpts of the files most relevant to query: the top_k chunks, merged where they are adjacent,
+        grouped per file (best-scoring file first) and in document order within a file.
+        """
+        if not query.strip() or self.embeddings is None or top_k <= 0:
+            return {}
+
+        query_embedding = self.embedding_generator.get_embedding(query)
+        hits = self._get_similarity_index().search(query_embedding, top_k)
+
+        owners = self._row_owners()
+        by_file: Dict[str, List[int]] = {}
+        best: Dict[str, float] = {}
+        for row_id, score in hits:
+            name, chunk_index = owners[int(row_id)]
+            by_file.setdefault(name, []).append(chunk_index)
+            best[name] = max(best.get(name, -1.0), score)
+
+        excerpts = {}
+        for name in sorted(by_file, key=best.get, reverse=True):
+            if name in self._contents:
+                excerpts[name] = self._excerpt(self._contents[name], sorted(by_file[name]))
+        self.logger.info(f"Retrieved {len(hits)} chunks from {len(excerpts)} of {len(self.files)} files")
+        return excerpts
+
+    def _excerpt(self, text: str, chunk_indices: List[int]) -> str:
+        """Text of the given chunks, cutting each run of consecutive chunks once so overlaps are not repeated"""
+        generator = self.embedding_generator
+        # Same tokens and windows as EmbeddingGenerator.chunk
+        spans = generator.token_spans(text)
+        if spans is None:
+            tokenizer = get_tokenizer()
+            tokens = tokenizer.encode(text)
+        ranges = windows(len(spans) if spans is not None else len(tokens), generator.chunk_tokens, generator.chunk_overlap)
+        if len(ranges) == 1:
+            return text
+
+        runs: List[List[int]] = []
+        for index in chunk_indices:
+            if runs and index == runs[-1][1] + 1:
+                runs[-1][1] = index
+            else:
+                runs.append([index, index])
+        pieces = []
+        for first, last in runs:
+            start, end = ranges[first][0], ranges[last][1]
+            pieces.append(text[spans[start][0]:spans[end - 1][1]] if spans is not None
+                          else tokenizer.encoding.decode(tokens[start:end]))
+        return "\n[...]\n".join(pieces)
+
+    def _row_ranges(self) -> Dict[str, Tuple[int, int]]:
+        ranges, start = {}, 0
+        for name, entry in self.files.items():
+            ranges[name] = (start, start + entry["n_chunks"])
+            start += entry["n_chunks"]
+        return ranges
+
+    def _row_owners(self) -> List[Tuple[str, int]]:
+        return [(name, i) for name, entry in self.files.items() for i in range(entry["n_chunks"])]
+
+    def _get_similarity_index(self) -> SimilarityIndex:
+        if self._similarity_index is None:
+            self._similarity_index = SimilarityIndex.from_embeddings(
+                [str(row) for row in range(len(self.embeddings))], self.embeddings
+            )
+        return self._similarity_index
+
+    def _load(self) -> None:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("version") != INDEX_VERSION:
+                return
+            files = manifest["files"]
+            embeddings_file = manifest.get("embeddings_file")
+            embeddings = np.load(self.index_dir / embeddings_file) if embeddings_file else None
+            n_rows = sum(entry["n_chunks"] for entry in files.values())
+            if n_rows != (0 if embeddings is None else len(embeddings)):
+                self.logger.warning(f"Retrieval index {self.index_dir} is inconsistent; rebuilding")
+                return
+            self.files, self.embeddings, self.embeddings_file = files, embeddings, embeddings_file
+            self.embedding_model = manifest.get("embedding_model")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.logger.warning(f"Ignoring unreadable retrieval index {self.index_dir}: {e}")
+
+    def _save(self) -> None:
+        previous = self.embeddings_file
+        self.embeddings_file = None
+        if self.embeddings is not None:
+            self.embeddings_file = f"embeddings-{uuid.uuid4().hex}.npy"
+            np.save(self.index_dir / self.embeddings_file, self.embeddings)
+
+        tmp_path = self.index_dir / f".manifest.{os.getpid()}.tmp"
+        manifest = {
+            "version": INDEX_VERSION,
+            "embedding_model": self.embedding_model,
+            "embeddings_file": self.embeddings_file,
+            "files": self.files,
+        }
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+        if previous:
+            (self.index_dir / previous).unlink(missing_ok=True)
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8", "surrogatepass")).hexdigest()
@@ -3,10 +3,13 @@ import os
 from typing import Optional, List, Dict
 from termcolor import colored
 import sys
-import base64
 from config_logger import logger
-from config import MAX_TOKENS
-import tiktoken
+from config import MAX_TOKENS, STDIN_HEAD_TOKENS, STDIN_TAIL_TOKENS
+from src.document_parser import DocumentParser
+from src.fs_walk import Crawler
+from src.image_processor import get_image_processor
+from src.text_reader import read_bounded, read_stream_bounded
+from src.tokenizer import get_tokenizer
 
 class FileProcessor:
     """
@@ -17,16 +20,15 @@ class FileProcessor:
     def __init__(self):
         self.logger = logger
         
-    def process_image(self, image_path: str) -> Dict:
-        """Process an image file and return it in the format expected by LLMs."""
+    def process_image(self, image_path: str, provider: Optional[str] = None) -> Dict:
+        """Process an image file and return it in the format expected by LLMs, sized for the provider's model."""
         self.logger.debug(f"Processing image: {image_path}")
-        with open(image_path, "rb") as image_file:
-            base64_image = base64.b64encode(image_file.read()).decode("utf-8")
-        
+        image = get_image_processor().prepare(Path(image_path), provider)
+
         return {
             "type": "image_url",
             "image_url": {
-                "url": f"data:image/jpeg;base64,{base64_image}"
+                "url": image.data_url
             }
         }
         
@@ -34,53 +36,35 @@ class FileProcessor:
         """Process a text file and return its contents."""
         self.logger.debug(f"Processing text file: {file_path}")
         try:
-            with open(file_path, 'r') as f:
-                file_content = f.read()
-                
-            # Check token count - skip if file is too large
-            token_count = self.count_tokens(file_content)
-            if token_count > MAX_TOKENS:
-                self.logger.warning(f"File {file_path} has {token_count} tokens, which exceeds the limit of {MAX_TOKENS}. Skipping.")
-                return {"type": "text", "text": f"\nFile Content:\n\n[File too large ({token_count} tokens) - exceeds limit of {MAX_TOKENS} tokens]"}
-                
-            return {"type": "text", "text": f"\nFile Content:\n\n {file_content}"}
+            # Files over MAX_TOKENS are counted only until the limit is passed and sent as an excerpt
+            text = read_bounded(Path(file_path), MAX_TOKENS)
+            if text.truncated:
+                self.logger.warning(f"File {file_path} has more than {MAX_TOKENS} tokens. Keeping an excerpt.")
+            return {"type": "text", "text": f"\nFile Content:\n\n {text.content}"}
         except Exception as e:
             self.logger.error(f"Error reading file {file_path}: {e}")
             return {"type": "text", "text": f"[Error reading file: {e}]"}
             
-    def process_terminal_input(self) -> Dict:
-        """Process input piped from the terminal."""
+    def process_terminal_input(self, head_tokens: int = STDIN_HEAD_TOKENS, tail_tokens: int = STDIN_TAIL_TOKENS) -> Dict:
+        """Process input piped from the terminal, keeping its first head_tokens and last tail_tokens tokens."""
         self.logger.debug("Processing piped terminal input")
-        terminal_output = sys.stdin.read().strip()
-        
-        # Check token count - truncate if too large
-        token_count = self.count_tokens(terminal_output)
-        if token_count > MAX_TOKENS:
-            self.logger.warning(f"Terminal input has {token_count} tokens, which exceeds the limit of {MAX_TOKENS}. Truncating.")
-            # Just truncate to the token limit approximately
-            encoding = tiktoken.get_encoding("cl100k_base")
-            tokens = encoding.encode(terminal_output)
-            truncated_tokens = tokens[:MAX_TOKENS]
-            terminal_output = encoding.decode(truncated_tokens)
-            terminal_output += "\n[Input truncated due to size limit]"
-            
-        return {"type": "text", "text": f"\nTerminal context:\n{terminal_output}"}
+        # Streamed in chunks so a huge pipe never sits in memory whole
+        text = read_stream_bounded(getattr(sys.stdin, "buffer", sys.stdin), head_tokens, tail_tokens)
+        if text.truncated:
+            self.logger.warning(f"Terminal input ({text.size} bytes) is longer than {head_tokens} + {tail_tokens} tokens. "
+                                f"Keeping its beginning and end.")
+
+        return {"type": "text", "text": f"\nTerminal context:\n{text.content.strip()}"}
     
     def extract_pdf_text(self, pdf_path: Path) -> Optional[str]:
-        """Extract text from a PDF file using Tika parser."""
+        """Extract text from a PDF file using Tika parser, with OCR as fallback; results come from the parse cache when possible."""
         try:
-            from tika import parser
-            parsed_file = parser.from_file(str(pdf_path), requestOptions={'timeout': 180})
-            content = parsed_file.get('content', '')
-            
-            # If Tika fails to extract content, try OCR
-            if not content:
-                self.logger.warning(f"Tika failed to extract text from {pdf_path}. Trying OCR.")
-                content = self._ocr_pdf(pdf_path)
+            result = DocumentParser().parse(pdf_path)
+            content = result.content
                 
             # Check token count - skip if too large
             if content:
-                token_count = self.count_tokens(content)
+                token_count = result.token_count
                 if token_count > MAX_TOKENS:
                     self.logger.warning(f"PDF {pdf_path} has {token_count} tokens, which exceeds the limit of {MAX_TOKENS}. Skipping.")
                     return f"[PDF too large ({token_count} tokens) - exceeds limit of {MAX_TOKENS} tokens]"
@@ -90,48 +74,23 @@ class FileProcessor:
             self.logger.error(f"Error extracting text from PDF {pdf_path}: {e}")
             return None
             
-    def _ocr_pdf(self, pdf_path: Path) -> str:
-        """OCR a PDF file to extract text."""
-        try:
-            import pytesseract
-            from pdf2image import convert_from_path
-            
-            images = convert_from_path(pdf_path)
-            text = ""
-            for image in images:
-                text += pytesseract.image_to_string(image)
-                
-            return text
-        except Exception as e:
-            self.logger.error(f"Error OCRing PDF {pdf_path}: {e}")
-            return ""
-            
     def get_files_from_path(self, path: str) -> List[Path]:
         """
         Get a list of files from a path, which can be a single file or a directory.
-        If a directory, returns all files in that directory (recursive).
+        If a directory, returns all non-hidden files in that directory (recursive), skipping excluded directories.
         """
-        path_obj = Path(path)
-        file_paths = []
-        
-        if path_obj.is_file():
-            file_paths.append(path_obj)
-        elif path_obj.is_dir():
-            self.logger.info(f"Processing directory: {path_obj}")
-            # Get all files recursively
-            for file_path in path_obj.rglob('*'):
-                if file_path.is_file() and not file_path.name.startswith('.'):
-                    file_paths.append(file_path)
-            
-            self.logger.info(f"Found {len(file_paths)} files in directory {path_obj}")
-        
+        crawler = Crawler(include_hidden_files=False)
+        file_paths = [entry.path for entry in crawler.crawl([path])]
+        crawler.save()
+
+        if crawler.directories:
+            self.logger.info(f"Found {len(file_paths)} files in directory {crawler.directories[0]}")
         return file_paths
         
     def count_tokens(self, text: str) -> int:
-        """Count tokens in text using tiktoken."""
+        """Count tokens in text with the shared tokenizer."""
         try:
-            encoding = tiktoken.get_encoding("cl100k_base")  # GPT-4 encoding
-            return len(encoding.encode(text))
+            return get_tokenizer().count(text)
         except Exception as e:
             self.logger.error(f"Error counting tokens: {e}")
             return 0
\ No newline at end of file
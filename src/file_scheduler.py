@@ -0,0 +1,33 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterator, Optional, Sequence, Tuple, TypeVar
+
+from config import FILE_PROCESSING_WORKERS
+from config_logger import logger
+
+T = TypeVar("T")
+
+
+class FileScheduler:
+    """
+    Runs a per-file task on a bounded thread pool and yields results in input order.
+    Tasks share their LLM's rate limiter, so concurrency is capped by the provider limits rather than fixed sleeps.
+    """
+
+    def __init__(self, workers: int = FILE_PROCESSING_WORKERS):
+        self.logger = logger
+        self.workers = max(1, workers)
+
+    def map(self, task: Callable[[T], Any], items: Sequence[T]) -> Iterator[Tuple[T, Any, Optional[Exception]]]:
+        """Yield (item, result, error) for every item, in the order given, as soon as each is ready"""
+        pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="file-worker")
+        try:
+            futures = [pool.submit(task, item) for item in items]
+            for item, future in zip(items, futures):
+                try:
+                    yield item, future.result(), None
+                except Exception as e:
+                    self.logger.error(f"Error processing {item}: {e}")
+                    yield item, None, e
+        finally:
+            # On Ctrl-C (or an abandoned iterator) drop queued files instead of finishing the whole directory
+            pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,264 @@
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+from config import (
+    CLI_LLM_DIR, EXCLUDED_DIRS, ALLOWED_EXTENSIONS, TEXT_EXTENSIONS, IMAGE_EXTENSIONS,
+    TREE_MAX_DEPTH, TREE_MAX_ENTRIES, TREE_MAX_LINES,
+)
+from config_logger import logger
+
+CACHE_VERSION = 2
+
+# Listings of directories modified this recently are not cached: another change within the same
+# mtime tick would go unnoticed
+RACY_SECONDS = 2.0
+
+# (name, is_dir, is_symlink) for every entry of a directory, sorted by name; symlinks are never is_dir
+Listing = List[Tuple[str, bool, bool]]
+
+
+class DirectoryCache:
+    """
+    Directory listings of one tree, reused while a directory's mtime is unchanged (adding, removing or renaming
+    an entry updates it), so walking an unchanged tree costs one stat per directory instead of a scandir.
+    Persisted per root under CLI_LLM_DIR/tree_cache; only directories visited in this process are written back.
+    """
+
+    def __init__(self, root: Path, cache_dir: Optional[Path] = None):
+        self.logger = logger
+        self.root = Path(root).resolve()
+        cache_dir = Path(cache_dir) if cache_dir else CLI_LLM_DIR / "tree_cache"
+        cache_dir.mkdir(exist_ok=True, parents=True)
+        root_key = hashlib.sha1(str(self.root).encode("utf-8")).hexdigest()
+        self.path = cache_dir / f"{root_key}.json"
+
+        self._stored: Dict[str, Tuple[int, Listing]] = {}
+        self._visited: Dict[str, Tuple[int, Listing]] = {}
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def listing(self, directory: Path) -> Listing:
+        key = str(directory)
+        if key in self._visited:
+            return self._visited[key][1]
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError:
+            return []
+
+        stored = self._stored.get(key)
+        if stored and stored[0] == mtime_ns:
+            self.hits += 1
+            self._visited[key] = stored
+            return stored[1]
+
+        self.misses += 1
+        entries = scan_directory(directory)
+        if time.time() - mtime_ns / 1e9 > RACY_SECONDS:
+            self._visited[key] = (mtime_ns, entries)
+            self._dirty = True
+        return entries
+
+    def save(self) -> None:
+        # A directory that disappeared is never visited, so dropping unvisited entries keeps the file bounded
+        if not self._dirty and len(self._visited) == len(self._stored):
+            return
+        data = {
+            "version": CACHE_VERSION,
+            "directories": {key: [mtime_ns, entries] for key, (mtime_ns, entries) in self._visited.items()},
+        }
+        tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            self.logger.warning(f"Could not write directory cache {self.path}: {e}")
+        self._dirty = False
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != CACHE_VERSION:
+                return
+            self._stored = {
+                key: (mtime_ns, [(name, is_dir, is_symlink) for name, is_dir, is_symlink in entries])
+                for key, (mtime_ns, entries) in data["directories"].items()
+            }
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.logger.warning(f"Ignoring unreadable directory cache {self.path}: {e}")
+
+
+def scan_directory(directory: Path) -> Listing:
+    """Sorted entries of one directory; symlinks are reported as such and left for the crawler to resolve"""
+    entries = []
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    is_symlink = entry.is_symlink()
+                    entries.append((entry.name, not is_symlink and entry.is_dir(follow_symlinks=False), is_symlink))
+                except OSError:
+                    continue
+    except OSError as e:
+        logger.debug(f"Cannot list {directory}: {e}")
+    entries.sort()
+    return entries
+
+
+def _listing(directory: Path, cache: Optional[DirectoryCache]) -> Listing:
+    return cache.listing(directory) if cache else scan_directory(directory)
+
+
+@dataclass
+class ManifestEntry:
+    key: str  # file name for a listed file, path relative to the listed directory otherwise
+    path: Path  # with symlinks resolved
+    kind: str  # "text", "image", "tika" (parsed by Tika/OCR) or "other"
+    root: Optional[Path] = None  # listed directory the file was found under
+
+
+def classify(path: Path) -> str:
+    suffix = path.suffix.lower()
+    if suffix in IMAGE_EXTENSIONS:
+        return "image"
+    if suffix in TEXT_EXTENSIONS:
+        return "text"
+    if suffix in ALLOWED_EXTENSIONS:
+        return "tika"
+    return "other"
+
+
+class Crawler:
+    """
+    Single pass over the files and directories a session or `llm -f` lists, yielding a streaming manifest.
+    Excluded directory names are pruned before descending, symlinks are resolved once (and followed into
+    directories unless that would revisit one), and every file is reported once however many links reach it.
+    Directory listings come from a DirectoryCache per listed directory, which render_tree reuses afterwards.
+    """
+
+    def __init__(self,
+                 excluded: Iterable[str] = EXCLUDED_DIRS,
+                 include_hidden_files: bool = True,
+                 use_cache: bool = True,
+                 cache_dir: Optional[Path] = None):
+        self.logger = logger
+        self.excluded = frozenset(excluded)
+        # Only dot-files are skipped; hidden directories such as .github are walked (.git is in EXCLUDED_DIRS)
+        self.include_hidden_files = include_hidden_files
+        self.use_cache = use_cache
+        self.cache_dir = cache_dir
+        # Listed paths that turned out to be directories, in listing order
+        self.directories: List[Path] = []
+        self._caches: Dict[Path, DirectoryCache] = {}
+
+    def cache_for(self, root: Path) -> Optional[DirectoryCache]:
+        if not self.use_cache:
+            return None
+        root = Path(root)
+        if root not in self._caches:
+            self._caches[root] = DirectoryCache(root, cache_dir=self.cache_dir)
+        return self._caches[root]
+
+    def crawl(self, paths: Iterable[Union[str, Path]], base: Optional[Path] = None) -> Iterator[ManifestEntry]:
+        """Manifest entries for paths (relative ones are taken from base), in listing order then walk order"""
+        seen: Set[Path] = set()
+        for item in paths:
+            item_path = Path(item).expanduser()
+            if not item_path.is_absolute() and base is not None:
+                item_path = Path(base) / item_path
+            resolved = item_path.resolve()
+
+            if resolved.is_file():
+                if resolved not in seen:
+                    seen.add(resolved)
+                    yield ManifestEntry(resolved.name, resolved, classify(resolved))
+            elif resolved.is_dir():
+                self.directories.append(resolved)
+                yield from self._walk(resolved, seen)
+            else:
+                self.logger.warning(f"Path does not exist or could not be resolved: {item} (tried from {base})")
+
+    def save(self) -> None:
+        for cache in self._caches.values():
+            cache.save()
+
+    def _walk(self, root: Path, seen: Set[Path]) -> Iterator[ManifestEntry]:
+        cache = self.cache_for(root)
+        visited_dirs = {root}
+        # (directory to list, the path it is reached by under root)
+        stack: List[Tuple[Path, Path]] = [(root, root)]
+        while stack:
+            directory, shown_as = stack.pop()
+            subdirectories = []
+            for name, is_dir, is_symlink in _listing(directory, cache):
+                path = directory / name
+                if is_symlink:
+                    target = Path(os.path.realpath(path))
+                    is_dir = target.is_dir()
+                    if not is_dir and not target.is_file():
+                        continue  # broken link, socket, ...
+                else:
+                    target = path
+
+                if is_dir:
+                    if name not in self.excluded and target not in visited_dirs:
+                        visited_dirs.add(target)
+                        subdirectories.append((target, shown_as / name))
+                elif not self.include_hidden_files and name.startswith("."):
+                    continue
+                elif target not in seen:
+                    seen.add(target)
+                    key = str((shown_as / name).relative_to(root))
+                    yield ManifestEntry(key, target, classify(target), root)
+            # Reversed so the alphabetically first directory is walked next
+            stack.extend(reversed(subdirectories))
+
+
+def render_tree(root: Path,
+                excluded: Iterable[str] = EXCLUDED_DIRS,
+                prefix: str = "",
+                max_depth: int = TREE_MAX_DEPTH,
+                max_entries: int = TREE_MAX_ENTRIES,
+                max_lines: int = TREE_MAX_LINES,
+                cache: Optional[DirectoryCache] = None) -> str:
+    """
+    Text tree of root (├── / └── lines) without excluded directories. Directories deeper than max_depth are
+    listed but not expanded, each directory shows at most max_entries entries, and the whole tree stops
+    after max_lines lines.
+    """
+    excluded = frozenset(excluded)
+    lines: List[str] = []
+
+    def add(directory: Path, indent: str, depth: int) -> bool:
+        entries = [(name, is_dir) for name, is_dir, _ in _listing(directory, cache) if not (is_dir and name in excluded)]
+        shown = entries[:max_entries]
+        hidden = len(entries) - len(shown)
+        for i, (name, is_dir) in enumerate(shown):
+            if len(lines) >= max_lines:
+                lines.append(f"{indent}└── … (tree truncated at {max_lines} lines)")
+                return False
+            is_last = i == len(shown) - 1 and not hidden
+            node = "└──" if is_last else "├──"
+            if is_dir and depth >= max_depth:
+                lines.append(f"{indent}{node} {name}/ …")
+                continue
+            lines.append(f"{indent}{node} {name}")
+            if is_dir and not add(directory / name, indent + ("    " if is_last else "│   "), depth + 1):
+                return False
+        if hidden:
+            lines.append(f"{indent}└── … {hidden} more entries")
+        return True
+
+    add(Path(root), prefix, 1)
+    return "".join(f"{line}\n" for line in lines)
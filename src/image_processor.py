@@ -0,0 +1,196 @@
+import base64
+import io
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from config import (
+    CLI_LLM_DIR, IMAGE_MAX_DIMENSIONS, IMAGE_DEFAULT_MAX_DIMENSION, IMAGE_FORMAT, IMAGE_QUALITY,
+    IMAGE_CACHE_MAX_BYTES,
+)
+from config_logger import logger
+from src.lazy_import import is_installed, lazy_import
+from src.parse_cache import ParseCache, get_parse_cache
+
+# Optional: without Pillow images are sent as they are, with their real MIME type
+Image = lazy_import("PIL.Image")
+ImageOps = lazy_import("PIL.ImageOps")
+
+# Formats every provider accepts; anything else (e.g. BMP) has to be re-encoded
+SUPPORTED_MIME_TYPES = {"image/png", "image/jpeg", "image/gif", "image/webp"}
+
+# Files smaller than this that are within the size limit and in a supported format are not worth re-encoding
+REENCODE_MIN_BYTES = 256 * 1024
+
+CACHE_VERSION = 1
+
+
+@dataclass
+class PreparedImage:
+    mime_type: str
+    data: str  # base64
+    width: Optional[int] = None
+    height: Optional[int] = None
+    cached: bool = False
+
+    @property
+    def data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{self.data}"
+
+
+def sniff_mime_type(head: bytes) -> Optional[str]:
+    """MIME type from an image's first bytes, or None if it is not a format we know"""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head.startswith(b"BM"):
+        return "image/bmp"
+    return None
+
+
+def media_type_of(data_url: str) -> str:
+    """MIME type of a data: URL ("data:image/png;base64,...")"""
+    header = data_url.split(",", 1)[0]
+    return header[len("data:"):].split(";", 1)[0] or "image/jpeg"
+
+
+class ImageProcessor:
+    """
+    Turns image files into base64 payloads for a provider: the real MIME type is sniffed from the bytes, images
+    larger than the provider's maximum edge are downscaled and large or unsupported ones re-encoded (with Pillow).
+    Payloads are cached on disk by content hash and settings, so unchanged images cost a stat and a file read.
+    """
+
+    def __init__(self,
+                 cache_dir: Optional[Path] = None,
+                 use_cache: bool = True,
+                 parse_cache: Optional[ParseCache] = None,
+                 max_cache_bytes: int = IMAGE_CACHE_MAX_BYTES):
+        self.logger = logger
+        self.cache_dir = Path(cache_dir) if cache_dir else CLI_LLM_DIR / "image_cache"
+        self.use_cache = use_cache
+        self.max_cache_bytes = max_cache_bytes
+        self._parse_cache = parse_cache
+        if use_cache:
+            self.cache_dir.mkdir(exist_ok=True, parents=True)
+
+    def prepare(self, image_path: Path, provider: Optional[str] = None) -> PreparedImage:
+        image_path = Path(image_path)
+        max_dimension = IMAGE_MAX_DIMENSIONS.get(provider or "", IMAGE_DEFAULT_MAX_DIMENSION)
+        cache_path = None
+        if self.use_cache:
+            # The parse cache keeps (path, mtime, size) -> content hash, so unchanged files are not hashed again
+            digest = (self._parse_cache or get_parse_cache()).digest(image_path)
+            # Payloads prepared without Pillow are unresized; installing it must not keep serving them
+            resizer = "pil" if is_installed(Image) else "raw"
+            cache_path = self.cache_dir / f"{digest}-{max_dimension}-{IMAGE_FORMAT}-{IMAGE_QUALITY}-{resizer}-v{CACHE_VERSION}.b64"
+            cached = self._load(cache_path)
+            if cached:
+                return cached
+
+        prepared = self._encode(image_path.read_bytes(), max_dimension, image_path)
+        if cache_path is not None:
+            self._store(cache_path, prepared)
+        return prepared
+
+    def _encode(self, raw: bytes, max_dimension: int, image_path: Path) -> PreparedImage:
+        mime_type = sniff_mime_type(raw[:16])
+        if mime_type is None:
+            self.logger.warning(f"Unrecognised image format for {image_path}; sending it as image/jpeg")
+            mime_type = "image/jpeg"
+
+        try:
+            with Image.open(io.BytesIO(raw)) as image:
+                width, height = image.size
+                too_large = max(width, height) > max_dimension
+                if not too_large and mime_type in SUPPORTED_MIME_TYPES and len(raw) < REENCODE_MIN_BYTES:
+                    return PreparedImage(mime_type, base64.b64encode(raw).decode("ascii"), width, height)
+                # Animated GIFs would lose their frames
+                if mime_type == "image/gif" and getattr(image, "is_animated", False) and not too_large:
+                    return PreparedImage(mime_type, base64.b64encode(raw).decode("ascii"), width, height)
+
+                image = ImageOps.exif_transpose(image)
+                if too_large:
+                    image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+                if image.mode not in ("RGB", "RGBA"):
+                    image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+                buffer = io.BytesIO()
+                image.save(buffer, format=IMAGE_FORMAT, quality=IMAGE_QUALITY, method=4)
+                encoded = buffer.getvalue()
+                new_size = image.size
+        except ModuleNotFoundError:
+            self.logger.debug("Pillow is not installed; sending images unresized")
+            return PreparedImage(mime_type, base64.b64encode(raw).decode("ascii"))
+        except Exception as e:
+            self.logger.warning(f"Could not re-encode {image_path}, sending it as is: {e}")
+            return PreparedImage(mime_type, base64.b64encode(raw).decode("ascii"))
+
+        # Keep the original when re-encoding did not help and nothing forced it
+        if not too_large and mime_type in SUPPORTED_MIME_TYPES and len(encoded) >= len(raw):
+            return PreparedImage(mime_type, base64.b64encode(raw).decode("ascii"), width, height)
+        self.logger.debug(f"Prepared {image_path}: {width}x{height} {len(raw)} bytes -> "
+                          f"{new_size[0]}x{new_size[1]} {len(encoded)} bytes {IMAGE_FORMAT}")
+        return PreparedImage(f"image/{IMAGE_FORMAT.lower()}", base64.b64encode(encoded).decode("ascii"), *new_size)
+
+    def _load(self, cache_path: Path) -> Optional[PreparedImage]:
+        try:
+            with open(cache_path, "r", encoding="ascii") as f:
+                header = f.readline().split()
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Ignoring unreadable image cache entry {cache_path}: {e}")
+            return None
+        # Last use is the mtime, for eviction
+        os.utime(cache_path)
+        mime_type, width, height = header[0], header[1], header[2]
+        return PreparedImage(mime_type, data, int(width) or None, int(height) or None, cached=True)
+
+    def _store(self, cache_path: Path, prepared: PreparedImage) -> None:
+        tmp_path = cache_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_path, "w", encoding="ascii") as f:
+                f.write(f"{prepared.mime_type} {prepared.width or 0} {prepared.height or 0}\n")
+                f.write(prepared.data)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            self.logger.warning(f"Could not cache prepared image {cache_path}: {e}")
+            return
+        self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".b64"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_cache_bytes:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+
+
+_image_processor: Optional[ImageProcessor] = None
+_image_processor_lock = threading.Lock()
+
+
+def get_image_processor() -> ImageProcessor:
+    """Process-wide image processor"""
+    global _image_processor
+    with _image_processor_lock:
+        if _image_processor is None:
+            _image_processor = ImageProcessor()
+        return _image_processor
@@ -0,0 +1,310 @@
+import atexit
+import fcntl
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from config import (
+    CLI_LLM_DIR,
+    INTERACTION_WRITE_BATCH_SIZE,
+    INTERACTION_WRITE_EXIT_GRACE,
+    INTERACTION_WRITE_DETACH_ON_EXIT,
+    INTERACTION_DRAINER_WAIT,
+    INTERACTION_DRAINER_IDLE,
+    SUMMARY_PENDING_LIMIT,
+)
+from config_logger import logger
+
+CLAIM_SUFFIX = ".claimed-"
+DRAINER_LOCK = "drainer.lock"
+DRAINER_POLL_SECONDS = 1.0
+
+
+class InteractionWriter:
+    """
+    Write-behind queue that persists interactions to the vector store off the response path.
+
+    Every interaction is first written to a durable spool directory, then embedded and inserted in batches
+    by a background thread. Anything still spooled when the process exits is drained by a detached process, which
+    consecutive runs share (or by the next run), so output latency never depends on summary generation, embedding
+    or Chroma.
+    """
+
+    def __init__(self,
+                 spool_dir: Optional[Path] = None,
+                 batch_size: int = INTERACTION_WRITE_BATCH_SIZE,
+                 vector_store_factory: Optional[Callable[[], Any]] = None,
+                 detach_on_exit: bool = INTERACTION_WRITE_DETACH_ON_EXIT):
+        self.logger = logger
+        self.spool_dir = Path(spool_dir) if spool_dir else CLI_LLM_DIR / "spool"
+        self.spool_dir.mkdir(exist_ok=True, parents=True)
+        self.batch_size = batch_size
+        self.detach_on_exit = detach_on_exit
+        self._vector_store_factory = vector_store_factory or _default_vector_store
+        self._vector_store = None
+
+        self._queue: "queue.Queue[Path]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._closed = False
+        atexit.register(self.close)
+
+    def enqueue(self,
+                query: str,
+                response: str,
+                model_name: str,
+                query_type: str = "question",
+                file_path: Optional[str] = None) -> str:
+        """Spool an interaction and hand it to the background writer; returns the interaction id"""
+        interaction = {
+            "id": str(uuid.uuid4()),
+            "timestamp": datetime.now().isoformat(),
+            "query": query,
+            "response": response,
+            "model_name": model_name,
+            "query_type": query_type,
+            "file_path": file_path,
+        }
+        spool_path = self._spool(interaction)
+        claimed = self._claim(spool_path)
+        if claimed:
+            self._queue.put(claimed)
+        self._ensure_worker()
+        return interaction["id"]
+
+    def drain(self) -> int:
+        """Synchronously persist everything currently in the spool (including other runs' leftovers)"""
+        claimed = self._claim_spooled()
+        for start in range(0, len(claimed), self.batch_size):
+            self._write_batch(claimed[start:start + self.batch_size])
+        return len(claimed)
+
+    def serve(self, idle: float = INTERACTION_DRAINER_IDLE) -> int:
+        """
+        Drain the spool, then keep storing whatever later runs spool until nothing arrives for `idle` seconds.
+        Only one process serves a spool at a time (it holds the drainer lock); returns 0 at once if another does.
+        """
+        with open(self.spool_dir / DRAINER_LOCK, "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0
+            stored, last_activity = 0, time.monotonic()
+            while True:
+                n = self.drain()
+                stored += n
+                if n:
+                    last_activity = time.monotonic()
+                elif time.monotonic() - last_activity >= idle:
+                    return stored
+                else:
+                    time.sleep(DRAINER_POLL_SECONDS)
+
+    def drainer_running(self) -> bool:
+        """Whether a detached drainer is serving this spool (and will pick up what this process leaves)"""
+        with open(self.spool_dir / DRAINER_LOCK, "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            return False
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until the background writer has processed everything queued; False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout: float = INTERACTION_WRITE_EXIT_GRACE) -> None:
+        """Give the writer a short grace period, then leave the rest to a detached drainer or the next run"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is None:
+            return
+        # Until the vector store is loaded the worker is still importing chromadb and the embedding model;
+        # waiting would only delay exit, so hand everything over straight away
+        if self._vector_store is None:
+            timeout = 0
+        if self.flush(timeout):
+            return
+
+        pending = self._release_queued()
+        self.logger.info(f"{pending} interactions still spooled at exit")
+        if self.detach_on_exit and not self.drainer_running():
+            # The batch the worker is writing stays claimed by this process; the drainer recovers it once we exit.
+            # A drainer that is already running does the same, so consecutive runs share one
+            self._spawn_drainer()
+
+    def _ensure_worker(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            # Pick up interactions spooled by earlier runs that never got written
+            for path in self._claim_spooled():
+                self._queue.put(path)
+            self._thread = threading.Thread(target=self._run, name="interaction-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_batch(self, claimed_paths: List[Path]) -> None:
+        interactions, paths = [], []
+        for path in claimed_paths:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    interactions.append(json.load(f))
+                paths.append(path)
+            except (OSError, json.JSONDecodeError) as e:
+                self.logger.error(f"Dropping unreadable spooled interaction {path}: {e}")
+                path.unlink(missing_ok=True)
+
+        if not interactions:
+            return
+        try:
+            if self._vector_store is None:
+                self._vector_store = self._vector_store_factory()
+            self._vector_store.add_interactions(interactions)
+        except Exception as e:
+            self.logger.error(f"Could not store {len(interactions)} interactions in vector database, keeping them spooled: {e}")
+            for path in paths:
+                self._unclaim(path)
+            return
+
+        for path in paths:
+            path.unlink(missing_ok=True)
+
+        # Stored first so a failing summary request never loses an interaction
+        try:
+            self._vector_store.summarize_pending(limit=SUMMARY_PENDING_LIMIT)
+        except Exception as e:
+            self.logger.error(f"Could not summarise stored interactions, will retry on a later write: {e}")
+
+    def _spool(self, interaction: Dict[str, Any]) -> Path:
+        """Durably write one interaction to the spool (write to temp file, fsync, atomic rename)"""
+        final_path = self.spool_dir / f"{time.time_ns()}-{interaction['id']}.json"
+        tmp_path = final_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(interaction, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, final_path)
+        return final_path
+
+    def _claim(self, path: Path) -> Optional[Path]:
+        """Atomically take ownership of a spooled interaction so concurrent drainers never both write it"""
+        claimed = path.with_name(f"{path.name}{CLAIM_SUFFIX}{os.getpid()}")
+        try:
+            os.rename(path, claimed)
+        except FileNotFoundError:
+            return None
+        return claimed
+
+    def _unclaim(self, claimed: Path) -> None:
+        try:
+            os.rename(claimed, claimed.with_name(claimed.name.split(CLAIM_SUFFIX)[0]))
+        except FileNotFoundError:
+            pass
+
+    def _claim_spooled(self) -> List[Path]:
+        """Claim unclaimed spool files and ones claimed by processes that have since died, oldest first"""
+        claimed = []
+        for path in sorted(self.spool_dir.iterdir()):
+            if path.name.endswith(".json"):
+                owned = self._claim(path)
+            elif CLAIM_SUFFIX in path.name and not _pid_alive(int(path.name.rsplit("-", 1)[1])):
+                self._unclaim(path)
+                owned = self._claim(path.with_name(path.name.split(CLAIM_SUFFIX)[0]))
+            else:
+                continue
+            if owned:
+                claimed.append(owned)
+        return claimed
+
+    def _release_queued(self) -> int:
+        """
+        Return interactions the worker has not picked up yet to the spool. The batch it is writing stays
+        claimed, so it is never written twice; once this process is gone it is recovered as a dead pid's claim.
+        """
+        released = 0
+        while True:
+            try:
+                path = self._queue.get_nowait()
+            except queue.Empty:
+                return released
+            self._unclaim(path)
+            self._queue.task_done()
+            released += 1
+
+    def _spawn_drainer(self) -> None:
+        try:
+            subprocess.Popen(
+                [sys.executable, "-m", "src.interaction_writer", str(os.getpid())],
+                cwd=str(Path(__file__).resolve().parent.parent),
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True,
+            )
+        except OSError as e:
+            self.logger.warning(f"Could not start background drainer, interactions will be stored on the next run: {e}")
+
+
+def _default_vector_store():
+    from src.vector_store import VectorStore
+    return VectorStore()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _wait_for_exit(pid: int, timeout: float) -> bool:
+    """Poll until process `pid` has exited; False on timeout"""
+    deadline = time.monotonic() + timeout
+    while _pid_alive(pid):
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+if __name__ == "__main__":
+    # Detached drainer started at exit by a CLI run that still had interactions spooled; waits for that run to
+    # exit so the batch it was writing can be recovered too
+    if len(sys.argv) > 1:
+        _wait_for_exit(int(sys.argv[1]), INTERACTION_DRAINER_WAIT)
+    writer = InteractionWriter(detach_on_exit=False)
+    logger.info(f"Stored {writer.serve()} spooled interactions")
@@ -0,0 +1,57 @@
+import importlib.machinery
+import importlib.util
+import sys
+from types import ModuleType
+
+
+class _MissingModule(ModuleType):
+    """Placeholder for an uninstalled optional dependency; raises on first use instead of at import"""
+
+    def __getattr__(self, attr):
+        # Introspection (hasattr, inspect, mock.patch) probes private and dunder names such as __func__ or
+        # _is_coroutine; those must look like plain missing attributes rather than a failed import
+        if attr.startswith("_"):
+            raise AttributeError(f"module '{self.__name__}' is not installed and has no attribute '{attr}'")
+        raise ModuleNotFoundError(f"No module named '{self.__name__}'", name=self.__name__)
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Return module `name` without executing it. The module body runs on first attribute access,
+    so heavy SDKs (provider clients, chromadb, sentence-transformers) only load on code paths that use them.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    try:
+        spec = _find_spec_without_parent_import(name)
+    except ModuleNotFoundError:
+        spec = None
+    if spec is None:
+        return _MissingModule(name)
+
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def is_installed(module: ModuleType) -> bool:
+    """Whether a module returned by lazy_import is really there, without loading it"""
+    return not isinstance(module, _MissingModule)
+
+
+def _find_spec_without_parent_import(name: str):
+    """
+    importlib.util.find_spec imports the parent package of a dotted name; locate submodules through the
+    parent's spec instead so e.g. lazy_import("tika.parser") does not run tika/__init__.py either.
+    """
+    if "." not in name or name.rpartition(".")[0] in sys.modules:
+        return importlib.util.find_spec(name)
+    parent, _, child = name.rpartition(".")
+    parent_spec = _find_spec_without_parent_import(parent)
+    if parent_spec is None or parent_spec.submodule_search_locations is None:
+        return None
+    return importlib.machinery.PathFinder.find_spec(name, parent_spec.submodule_search_locations)
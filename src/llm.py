@@ -1,11 +1,12 @@
-from openai import OpenAI
-from typing import List, Dict, Optional, Any, Union
+import asyncio
+from typing import AsyncIterator, List, Dict, Optional, Any, Union
 from config_logger import logger
 from pathlib import Path
-from config import LLMConfig
-import google.generativeai as genai
+from config import LLMConfig, RATE_LIMIT_MAX_RETRIES, LLM_REQUEST_TIMEOUT
+from src.client_pool import get_client, get_async_client
+from src.image_processor import media_type_of
+from src.rate_limiter import RateLimitError, rate_limiter_for, estimate_tokens
 import base64
-import anthropic
 
 REASONING_MODELS = ["o1-mini", "o1", "o1-preview", "o3-mini"]
 
@@ -15,9 +16,20 @@ class LLMProvider:
         self.llm_config = llm_config
         self.logger = logger
 
+    @property
+    def async_client(self) -> Any:
+        """Async SDK client for the running event loop, shared like the sync client"""
+        return get_async_client(self.llm_config)
+
     def query(self, messages: List[Dict[str, Any]], stream: bool = False) -> Optional[Union[str, Any]]:
         raise NotImplementedError("Subclasses must implement query method")
 
+    async def aquery(self, messages: List[Dict[str, Any]]) -> Optional[str]:
+        raise NotImplementedError("Subclasses must implement aquery method")
+
+    def astream(self, messages: List[Dict[str, Any]]) -> AsyncIterator[str]:
+        raise NotImplementedError("Subclasses must implement astream method")
+
     def prepare_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Prepare messages in the format expected by the provider"""
         full_messages = []
@@ -29,18 +41,21 @@ class LLMProvider:
         full_messages.extend(messages)
         return full_messages
 
+    def handle_error(self, error: Exception) -> None:
+        """Re-raise 429s as RateLimitError so LLM can back off; log everything else"""
+        if _is_rate_limit(error):
+            raise RateLimitError(f"{self.name} rate limit: {error}", _retry_after(error)) from error
+        self.logger.error(f"Error querying {self.name}: {error}")
+
 class OpenAIProvider(LLMProvider):
+    name = "OpenAI"
+
     def __init__(self, llm_config: LLMConfig):
         super().__init__(llm_config)
-        if self.llm_config.base_url:
-            self.client = OpenAI(
-                api_key=self.llm_config.api_key,
-                base_url=self.llm_config.base_url,
-            )
-        else:
-           self.client = OpenAI(api_key=self.llm_config.api_key)
+        self.client = get_client(self.llm_config)
 
-    def query(self, messages: List[Dict[str, Any]], stream: bool = False) -> Optional[Union[str, Any]]:
+    def build_params(self, messages: List[Dict[str, Any]], stream: bool = False) -> Dict[str, Any]:
+        """Request parameters shared by the sync and async paths"""
         full_messages = self.prepare_messages(messages)
         
         response_params = {
@@ -66,6 +81,11 @@ class OpenAIProvider(LLMProvider):
         if self.llm_config.response_format:
             response_params["response_format"] = self.llm_config.response_format
 
+        return response_params
+
+    def query(self, messages: List[Dict[str, Any]], stream: bool = False) -> Optional[Union[str, Any]]:
+        response_params = self.build_params(messages, stream)
+
         try:
             # If structured output, calling different method
             if self.llm_config.response_format:
@@ -84,66 +104,47 @@ class OpenAIProvider(LLMProvider):
                 return response.choices[0].message.content
 
         except Exception as e:
-            self.logger.error(f"Error querying OpenAI: {e}")
+            self.handle_error(e)
             return None
 
-class GeminiProvider(LLMProvider):
-    def __init__(self, llm_config: LLMConfig):
-        super().__init__(llm_config)
-        genai.configure(api_key=self.llm_config.api_key)
-        self.client = OpenAI(
-            api_key=self.llm_config.api_key,
-            base_url=self.llm_config.base_url,
-        )
-
-    def query(self, messages: List[Dict[str, Any]], stream: bool = False) -> Optional[Union[str, Any]]:
-        full_messages = self.prepare_messages(messages)
-        
-        response_params = {
-            "model": self.llm_config.model_name,
-            "n": 1,
-            "messages": full_messages,
-        }
-
-        if stream:
-            response_params["stream"] = True
-
-        if self.llm_config.model_name not in REASONING_MODELS:
-            response_params["max_tokens"] = self.llm_config.max_tokens
-            response_params["temperature"] = self.llm_config.temperature
-
-        if self.llm_config.tools:
-            response_params["tools"] = self.llm_config.tools
-            response_params["tool_choice"] = "auto"
-
-        if self.llm_config.response_format:
-            response_params["response_format"] = self.llm_config.response_format
+    async def aquery(self, messages: List[Dict[str, Any]]) -> Optional[str]:
+        response_params = self.build_params(messages)
 
         try:
-            # If structured output, calling different method
             if self.llm_config.response_format:
-                response = self.client.beta.chat.completions.parse(**response_params)
+                response = await self.async_client.beta.chat.completions.parse(**response_params)
                 return response.choices[0].message.parsed.model_dump_json(indent=2)
-            
-            # every other case
-            else:
-                response = self.client.chat.completions.create(**response_params)
 
-                # 1. Streaming case
-                if stream:
-                    return response
-                
-                # 2. Base case
-                return response.choices[0].message.content
+            response = await self.async_client.chat.completions.create(**response_params)
+            return response.choices[0].message.content
 
         except Exception as e:
-            self.logger.error(f"Error querying Gemini: {e}")
+            self.handle_error(e)
             return None
 
+    async def astream(self, messages: List[Dict[str, Any]]) -> AsyncIterator[str]:
+        try:
+            response = await self.async_client.chat.completions.create(**self.build_params(messages, stream=True))
+        except Exception as e:
+            self.handle_error(e)
+            return
+
+        try:
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # Also runs on cancellation/timeout, releasing the connection back to the pool
+            await response.close()
+
+class GeminiProvider(OpenAIProvider):
+    # Gemini is served through its OpenAI-compatible endpoint, so the google SDK is not needed
+    name = "Gemini"
+
 class AnthropicProvider(LLMProvider):
     def __init__(self, llm_config: LLMConfig):
         super().__init__(llm_config)
-        self.client = anthropic.Anthropic(api_key=self.llm_config.api_key)
+        self.client = get_client(self.llm_config)
     
     def prepare_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Convert messages to Anthropic format"""
@@ -172,7 +173,7 @@ class AnthropicProvider(LLMProvider):
                                         "type": "image",
                                         "source": {
                                             "type": "base64",
-                                            "media_type": "image/jpeg",
+                                            "media_type": media_type_of(image_url),
                                             "data": base64_data
                                         }
                                     })
@@ -203,14 +204,13 @@ class AnthropicProvider(LLMProvider):
         
         return anthropic_messages
     
-    def query(self, messages: List[Dict[str, Any]], stream: bool = False) -> Optional[str]:
-        anthropic_messages = self.prepare_messages(messages)
-        
+    def build_params(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Request parameters shared by the sync and async paths"""
         response_params = {
             "model": self.llm_config.model_name,
             "max_tokens": self.llm_config.max_tokens,
             "temperature": self.llm_config.temperature,
-            "messages": anthropic_messages,
+            "messages": self.prepare_messages(messages),
         }
         
         if self.llm_config.system_prompt:
@@ -223,28 +223,60 @@ class AnthropicProvider(LLMProvider):
                 "type": "enabled",
                 "budget_tokens": self.llm_config.budget_tokens, 
             }
+
+        return response_params
+
+    def query(self, messages: List[Dict[str, Any]], stream: bool = False) -> Optional[str]:
+        response_params = self.build_params(messages)
             
-        if stream:
-            response = self.client.messages.stream(**response_params)
-            return response
-        else:
+        try:
+            if stream:
+                return self.client.messages.stream(**response_params)
             response = self.client.messages.create(**response_params)
+        except Exception as e:
+            self.raise_error(e)
+
+        return self.response_text(response)
+
+    async def aquery(self, messages: List[Dict[str, Any]]) -> Optional[str]:
+        try:
+            response = await self.async_client.messages.create(**self.build_params(messages))
+        except Exception as e:
+            self.raise_error(e)
+
+        return self.response_text(response)
+
+    async def astream(self, messages: List[Dict[str, Any]]) -> AsyncIterator[str]:
+        try:
+            async with self.async_client.messages.stream(**self.build_params(messages)) as stream:
+                async for text in stream.text_stream:
+                    yield text
+        except Exception as e:
+            self.raise_error(e)
+
+    def raise_error(self, error: Exception) -> None:
+        """Unlike the OpenAI-compatible providers, Anthropic errors propagate; 429s become RateLimitError"""
+        if _is_rate_limit(error):
+            raise RateLimitError(f"Anthropic rate limit: {error}", _retry_after(error)) from error
+        raise error
+
+    def response_text(self, response: Any) -> Optional[str]:
+        # Extract text content from response
+        for block in response.content:
+            if block.type == "text":
+                return block.text
             
-            # Extract text content from response
-            for block in response.content:
-                if block.type == "text":
-                    return block.text
-                
-                if block.type == "thinking":
-                    print("Thinking Block...")
-                    print(block.thinking)
-            
-            return None
+            if block.type == "thinking":
+                print("Thinking Block...")
+                print(block.thinking)
+        
+        return None
 
 class LLM:
     def __init__(self, llm_config: LLMConfig):
         self.llm_config = llm_config
         self.logger = logger
+        self.rate_limiter = rate_limiter_for(llm_config)
         
         # Initialize the appropriate provider based on config
         if self.llm_config.provider == "openai":
@@ -262,8 +294,67 @@ class LLM:
             self.provider = OpenAIProvider(llm_config)
 
     def query(self, messages: List[Dict[str, Any]], stream: bool = False) -> Optional[Union[str, Any]]:
-        """Query the LLM using the appropriate provider"""
-        return self.provider.query(messages, stream)
+        """Query the LLM using the appropriate provider, waiting on its rate limiter and backing off on 429s"""
+        for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+            self.rate_limiter.acquire(estimate_tokens(messages))
+            try:
+                response = self.provider.query(messages, stream)
+            except RateLimitError as e:
+                if attempt == RATE_LIMIT_MAX_RETRIES:
+                    self.logger.error(f"Giving up after {attempt + 1} rate-limited attempts: {e}")
+                    return None
+                self.rate_limiter.backoff(e.retry_after)
+                continue
+            self.rate_limiter.succeeded()
+            return response
+
+    async def aquery(self, messages: List[Dict[str, Any]], timeout: Optional[float] = LLM_REQUEST_TIMEOUT) -> Optional[str]:
+        """
+        Async query on the SDK's async client; many can run concurrently from one event loop.
+        Returns None on timeout. Cancelling the awaiting task cancels the HTTP request.
+        """
+        for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+            await self.rate_limiter.aacquire(estimate_tokens(messages))
+            try:
+                response = await asyncio.wait_for(self.provider.aquery(messages), timeout)
+            except RateLimitError as e:
+                if attempt == RATE_LIMIT_MAX_RETRIES:
+                    self.logger.error(f"Giving up after {attempt + 1} rate-limited attempts: {e}")
+                    return None
+                self.rate_limiter.backoff(e.retry_after)
+                continue
+            except asyncio.TimeoutError:
+                self.logger.error(f"Query to {self.llm_config.model_name} timed out after {timeout}s")
+                return None
+            self.rate_limiter.succeeded()
+            return response
+
+    async def astream(self, messages: List[Dict[str, Any]], timeout: Optional[float] = LLM_REQUEST_TIMEOUT) -> AsyncIterator[str]:
+        """
+        Yield response text as it arrives. timeout bounds the wait for each chunk, so long answers are fine
+        but a stalled stream raises asyncio.TimeoutError. A 429 before the first chunk is retried.
+        """
+        for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+            await self.rate_limiter.aacquire(estimate_tokens(messages))
+            stream = self.provider.astream(messages)
+            started = False
+            try:
+                while True:
+                    try:
+                        text = await asyncio.wait_for(stream.__anext__(), timeout)
+                    except StopAsyncIteration:
+                        break
+                    started = True
+                    yield text
+            except RateLimitError as e:
+                if started or attempt == RATE_LIMIT_MAX_RETRIES:
+                    raise
+                self.rate_limiter.backoff(e.retry_after)
+                continue
+            finally:
+                await stream.aclose()
+            self.rate_limiter.succeeded()
+            return
     
     def process_pdf(self, pdf_path: Path, prompt: str) -> Optional[str]:
         """Process a PDF file and generate a response based on its content"""
@@ -294,4 +385,16 @@ class LLM:
             return response
         except Exception as e:
             self.logger.error(f"Error processing PDF: {e}")
-            return None
\ No newline at end of file
+            return None
+
+
+def _is_rate_limit(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds from the Retry-After header of a 429 response, if the server sent one"""
+    try:
+        return float(error.response.headers["retry-after"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
@@ -0,0 +1,221 @@
+import multiprocessing
+import os
+import sqlite3
+import subprocess
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from config import (
+    CLI_LLM_DIR, TIKA_TIMEOUT, OCR_DPI, OCR_BATCH_PAGES, OCR_PROCESSES, OCR_LANGUAGE, OCR_MIN_PAGE_CHARS,
+)
+from config_logger import logger
+from src.lazy_import import lazy_import
+from src.parse_cache import ParseCache, get_parse_cache
+
+pdf2image = lazy_import("pdf2image")
+pytesseract = lazy_import("pytesseract")
+
+
+def _init_worker() -> None:
+    # One tesseract thread per worker; the pool provides the parallelism
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+
+def _ocr_pages(file_path: str, first: int, last: int, dpi: int, language: str) -> List[str]:
+    """Rasterize and OCR pages first..last (1-based, inclusive); only this batch's images are ever in memory"""
+    images = pdf2image.convert_from_path(file_path, dpi=dpi, first_page=first, last_page=last)
+    texts = []
+    for image in images:
+        try:
+            texts.append(pytesseract.image_to_string(image, lang=language))
+        finally:
+            image.close()
+    return texts
+
+
+def page_count(file_path: Path) -> int:
+    return int(pdf2image.pdfinfo_from_path(str(file_path))["Pages"])
+
+
+def extract_page_texts(file_path: Path) -> Optional[List[str]]:
+    """
+    Text layer of each page via pdftotext (poppler, which pdf2image needs anyway), or None when it is unavailable.
+    Used to find the pages of a mixed PDF that have no text and need OCR.
+    """
+    try:
+        result = subprocess.run(["pdftotext", "-layout", str(file_path), "-"],
+                                capture_output=True, timeout=TIKA_TIMEOUT, check=True)
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.debug(f"No per-page text layer for {file_path}: {e}")
+        return None
+    pages = result.stdout.decode("utf-8", errors="replace").split("\f")
+    # pdftotext ends every page with a form feed, leaving an empty piece after the last one
+    if pages and not pages[-1]:
+        pages.pop()
+    return pages
+
+
+def failed_pages(page_texts: Sequence[str], min_chars: int = OCR_MIN_PAGE_CHARS) -> List[int]:
+    """1-based numbers of the pages whose extracted text is too short to be a real text layer"""
+    return [i for i, text in enumerate(page_texts, 1) if len(text.strip()) < min_chars]
+
+
+def batches(pages: Iterable[int], size: int) -> List[Tuple[int, int]]:
+    """Sorted pages as (first, last) ranges of consecutive pages, each at most size pages long"""
+    ranges: List[Tuple[int, int]] = []
+    for page in sorted(set(pages)):
+        if ranges and page == ranges[-1][1] + 1 and page - ranges[-1][0] < size:
+            ranges[-1] = (ranges[-1][0], page)
+        else:
+            ranges.append((page, page))
+    return ranges
+
+
+class OcrPageCache:
+    """
+    OCR text per page, keyed by the document's content hash, page, DPI and language.
+    Pages are stored as soon as their batch finishes, so an interrupted OCR job resumes where it stopped.
+    """
+
+    def __init__(self, path: Optional[Path] = None, parse_cache: Optional[ParseCache] = None):
+        self.logger = logger
+        self.path = Path(path) if path else CLI_LLM_DIR / "ocr_pages.sqlite3"
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self._parse_cache = parse_cache
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                "digest TEXT NOT NULL, page INTEGER NOT NULL, dpi INTEGER NOT NULL, language TEXT NOT NULL, "
+                "content TEXT NOT NULL, created REAL NOT NULL, PRIMARY KEY (digest, page, dpi, language))"
+            )
+
+    def digest(self, file_path: Path) -> str:
+        # The parse cache already tracks (path, mtime, size) -> hash, so unchanged files are not hashed again
+        return (self._parse_cache or get_parse_cache()).digest(file_path)
+
+    def get(self, digest: str, dpi: int, language: str) -> Dict[int, str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT page, content FROM pages WHERE digest = ? AND dpi = ? AND language = ?",
+                (digest, dpi, language),
+            ).fetchall()
+        return dict(rows)
+
+    def put(self, digest: str, dpi: int, language: str, pages: Dict[int, str]) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pages (digest, page, dpi, language, content, created) VALUES (?, ?, ?, ?, ?, ?)",
+                [(digest, page, dpi, language, content, now) for page, content in pages.items()],
+            )
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM pages")
+
+
+_page_cache: Optional[OcrPageCache] = None
+_page_cache_lock = threading.Lock()
+
+
+def get_page_cache() -> OcrPageCache:
+    """Process-wide OCR page cache"""
+    global _page_cache
+    with _page_cache_lock:
+        if _page_cache is None:
+            _page_cache = OcrPageCache()
+        return _page_cache
+
+
+class OcrEngine:
+    """
+    OCR for PDFs without (or with a partial) text layer. Pages are rasterized batch_pages at a time, so memory
+    stays bounded by one batch per worker whatever the page count, and batches are OCRed across a process pool.
+    Inside a worker process (e.g. DocumentParser's pool) batches run inline instead of nesting another pool.
+    """
+
+    def __init__(self,
+                 dpi: int = OCR_DPI,
+                 batch_pages: int = OCR_BATCH_PAGES,
+                 processes: int = OCR_PROCESSES,
+                 language: str = OCR_LANGUAGE,
+                 min_chars: int = OCR_MIN_PAGE_CHARS,
+                 cache: Optional[OcrPageCache] = None,
+                 use_cache: bool = True):
+        self.logger = logger
+        self.dpi = dpi
+        self.batch_pages = max(1, batch_pages)
+        self.processes = max(1, processes)
+        self.language = language
+        self.min_chars = min_chars
+        self.cache = (cache or get_page_cache()) if use_cache else None
+
+    def extract(self, file_path: Path, page_texts: Optional[Sequence[str]] = None) -> str:
+        """
+        Text of the whole PDF. With page_texts (the text layer per page), pages that have text keep it and
+        only the rest are OCRed; without it every page is.
+        """
+        file_path = Path(file_path)
+        n_pages = page_count(file_path)
+        if page_texts is not None and len(page_texts) != n_pages:
+            self.logger.warning(f"Text layer of {file_path} has {len(page_texts)} pages, expected {n_pages}; OCRing all")
+            page_texts = None
+        pages = failed_pages(page_texts, self.min_chars) if page_texts is not None else list(range(1, n_pages + 1))
+
+        ocr_texts = self.ocr_pages(file_path, pages)
+        texts = [ocr_texts[page] if page in ocr_texts else page_texts[page - 1] for page in range(1, n_pages + 1)]
+        return "\n\n".join(text.rstrip() for text in texts if text.strip())
+
+    def ocr_pages(self, file_path: Path, pages: Sequence[int]) -> Dict[int, str]:
+        """OCR text of the given 1-based pages, reusing cached pages and caching each batch as it finishes"""
+        file_path = Path(file_path)
+        digest = self.cache.digest(file_path) if self.cache else None
+        done = self.cache.get(digest, self.dpi, self.language) if self.cache else {}
+        results = {page: done[page] for page in pages if page in done}
+        todo = batches([page for page in pages if page not in results], self.batch_pages)
+        if not todo:
+            return results
+
+        start_time = time.perf_counter()
+        self.logger.info(f"OCR of {file_path}: {sum(last - first + 1 for first, last in todo)} pages in "
+                         f"{len(todo)} batches at {self.dpi} DPI, {len(results)} pages from cache")
+        for (first, _), texts in self._run(file_path, todo):
+            batch = {first + i: text for i, text in enumerate(texts)}
+            results.update(batch)
+            if self.cache:
+                self.cache.put(digest, self.dpi, self.language, batch)
+        self.logger.info(f"OCR of {file_path} finished in {time.perf_counter() - start_time:.2f}s")
+        return results
+
+    def _run(self, file_path: Path, todo: List[Tuple[int, int]]) -> Iterable[Tuple[Tuple[int, int], List[str]]]:
+        path = str(file_path)
+        if self.processes == 1 or len(todo) == 1 or multiprocessing.parent_process() is not None:
+            for first, last in todo:
+                yield (first, last), _ocr_pages(path, first, last, self.dpi, self.language)
+            return
+
+        workers = min(self.processes, len(todo))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            # A bounded window of submitted batches, so finished pages are cached while later ones are still queued
+            pending: Dict[Future, Tuple[int, int]] = {}
+            queue = iter(todo)
+            try:
+                while True:
+                    for first, last in queue:
+                        pending[pool.submit(_ocr_pages, path, first, last, self.dpi, self.language)] = (first, last)
+                        if len(pending) >= 2 * workers:
+                            break
+                    if not pending:
+                        return
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        yield pending.pop(future), future.result()
+            finally:
+                for future in pending:
+                    future.cancel()
@@ -0,0 +1,156 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from config import CLI_LLM_DIR, PARSE_CACHE_MAX_BYTES
+from config_logger import logger
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class CachedParse:
+    digest: str
+    content: str
+    token_count: int
+    method: str
+
+
+class ParseCache:
+    """
+    Global cache of extracted document text, shared by every session and by `llm -f`.
+    Entries are keyed by a SHA-256 of the file's bytes, so edited files are re-parsed and identical files
+    in different places are parsed once. A (path, mtime, size) table lets unchanged files skip hashing.
+    Least-recently-used entries are evicted once the stored text exceeds max_bytes.
+    """
+
+    def __init__(self, path: Optional[Path] = None, max_bytes: int = PARSE_CACHE_MAX_BYTES):
+        self.logger = logger
+        self.path = Path(path) if path else CLI_LLM_DIR / "parse_cache.sqlite3"
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        # Parsing runs on thread pools, so share one connection behind a lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS parsed ("
+                "digest TEXT PRIMARY KEY, content TEXT NOT NULL, token_count INTEGER NOT NULL, "
+                "method TEXT NOT NULL, bytes INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS parsed_last_used ON parsed (last_used)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL, digest TEXT NOT NULL)"
+            )
+
+    def digest(self, file_path: Path) -> str:
+        """Content hash of a file, reusing the stored one when path, mtime and size are unchanged"""
+        file_path = Path(file_path).resolve()
+        stat = file_path.stat()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT digest FROM files WHERE path = ? AND mtime_ns = ? AND size = ?",
+                (str(file_path), stat.st_mtime_ns, stat.st_size),
+            ).fetchone()
+        if row:
+            return row[0]
+
+        sha = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                sha.update(block)
+        digest = sha.hexdigest()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (path, mtime_ns, size, digest) VALUES (?, ?, ?, ?)",
+                (str(file_path), stat.st_mtime_ns, stat.st_size, digest),
+            )
+        return digest
+
+    def get(self, file_path: Path) -> Optional[CachedParse]:
+        """Cached parse of the file's current contents, or None"""
+        try:
+            digest = self.digest(file_path)
+        except OSError:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, token_count, method FROM parsed WHERE digest = ?", (digest,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            with self._conn:
+                self._conn.execute("UPDATE parsed SET last_used = ? WHERE digest = ?", (time.time(), digest))
+        return CachedParse(digest, row[0], row[1], row[2])
+
+    def put(self, file_path: Path, content: str, token_count: int, method: str, digest: Optional[str] = None) -> None:
+        """Store a parse of the file and evict the least recently used entries beyond the byte cap"""
+        try:
+            digest = digest or self.digest(file_path)
+        except OSError as e:
+            self.logger.warning(f"Not caching parse of {file_path}: {e}")
+            return
+        size = len(content.encode("utf-8"))
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO parsed (digest, content, token_count, method, bytes, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (digest, content, token_count, method, size, time.time()),
+            )
+            self._evict()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, total_bytes = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM parsed").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM parsed")
+            self._conn.execute("DELETE FROM files")
+
+    def _evict(self) -> None:
+        total = self._conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM parsed").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for digest, size in self._conn.execute("SELECT digest, bytes FROM parsed ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM parsed WHERE digest = ?", (digest,))
+            total -= size
+            evicted += 1
+        # Drop path records that no longer point at anything cached
+        self._conn.execute("DELETE FROM files WHERE digest NOT IN (SELECT digest FROM parsed)")
+        self.logger.debug(f"Evicted {evicted} parsed documents from cache")
+
+
+_parse_cache: Optional[ParseCache] = None
+_parse_cache_lock = threading.Lock()
+
+
+def get_parse_cache() -> ParseCache:
+    """Process-wide parse cache"""
+    global _parse_cache
+    with _parse_cache_lock:
+        if _parse_cache is None:
+            _parse_cache = ParseCache()
+        return _parse_cache
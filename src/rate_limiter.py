@@ -0,0 +1,148 @@
+import asyncio
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from config import LLMConfig, RATE_LIMIT_BACKOFF_BASE, RATE_LIMIT_BACKOFF_MAX
+from config_logger import logger
+
+
+class RateLimitError(Exception):
+    """Raised by a provider when the API answers 429; retry_after is the server's hint in seconds, if any"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Blocking token bucket refilled continuously at rate_per_minute, holding at most one minute's worth"""
+
+    def __init__(self,
+                 rate_per_minute: float,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = float(rate_per_minute)
+        self._tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """Take amount tokens, waiting for the refill if needed; returns the seconds waited"""
+        waited = 0.0
+        while True:
+            delay = self._take(amount)
+            if delay <= 0:
+                return waited
+            self._sleep(delay)
+            waited += delay
+
+    async def aacquire(self, amount: float = 1.0) -> float:
+        """Like acquire, but waits without blocking the event loop"""
+        waited = 0.0
+        while True:
+            delay = self._take(amount)
+            if delay <= 0:
+                return waited
+            await asyncio.sleep(delay)
+            waited += delay
+
+    def _take(self, amount: float) -> float:
+        """Take the tokens and return 0, or return how long until they will be available"""
+        # A single request larger than the bucket can never fit, so let it through once the bucket is full
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_second)
+            self._updated = now
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0.0
+            return (amount - self._tokens) / self.rate_per_second
+
+
+class RateLimiter:
+    """
+    Per-(provider, model) limiter combining a requests/min and a tokens/min bucket with adaptive backoff.
+    A 429 pauses every caller sharing the limiter, and the pause doubles on consecutive 429s.
+    """
+
+    def __init__(self,
+                 requests_per_minute: Optional[int] = None,
+                 tokens_per_minute: Optional[int] = None,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.logger = logger
+        self.requests = TokenBucket(requests_per_minute, clock, sleep) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute, clock, sleep) if tokens_per_minute else None
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+        self._consecutive_limits = 0
+
+    def acquire(self, tokens: int = 0) -> None:
+        """Block until a request of roughly `tokens` input tokens may be sent"""
+        while (delay := self._pause_remaining()) > 0:
+            self._sleep(delay)
+        if self.requests:
+            self.requests.acquire(1)
+        if self.tokens and tokens:
+            self.tokens.acquire(tokens)
+
+    async def aacquire(self, tokens: int = 0) -> None:
+        """Like acquire, but waits without blocking the event loop"""
+        while (delay := self._pause_remaining()) > 0:
+            await asyncio.sleep(delay)
+        if self.requests:
+            await self.requests.aacquire(1)
+        if self.tokens and tokens:
+            await self.tokens.aacquire(tokens)
+
+    def _pause_remaining(self) -> float:
+        with self._lock:
+            return self._paused_until - self._clock()
+
+    def backoff(self, retry_after: Optional[float] = None) -> float:
+        """Record a 429 and pause all callers; returns the pause in seconds"""
+        with self._lock:
+            self._consecutive_limits += 1
+            delay = RATE_LIMIT_BACKOFF_BASE * 2 ** (self._consecutive_limits - 1)
+            if retry_after:
+                delay = max(delay, retry_after)
+            delay = min(delay, RATE_LIMIT_BACKOFF_MAX)
+            self._paused_until = max(self._paused_until, self._clock() + delay)
+        self.logger.warning(f"Rate limited, pausing requests for {delay:.1f}s")
+        return delay
+
+    def succeeded(self) -> None:
+        with self._lock:
+            self._consecutive_limits = 0
+
+
+_limiters: Dict[Tuple[str, str], RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def rate_limiter_for(llm_config: LLMConfig) -> RateLimiter:
+    """Process-wide limiter shared by every LLM using the same provider and model"""
+    key = (llm_config.provider, llm_config.model_name)
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = RateLimiter(llm_config.requests_per_minute, llm_config.tokens_per_minute)
+        return _limiters[key]
+
+
+def estimate_tokens(messages) -> int:
+    """Cheap input-token estimate (~4 characters per token) used for tokens/min budgeting"""
+    chars = 0
+    for message in messages:
+        content = message.get("content", "")
+        if isinstance(content, str):
+            chars += len(content)
+        else:
+            chars += sum(len(item.get("text", "")) for item in content if isinstance(item, dict))
+    return chars // 4
@@ -3,20 +3,27 @@ import os
 from termcolor import colored
 from typing import Dict, Any, Optional, List, Union
 from config import DEFAULT_PAPERS_OUTPUT_DIR
-from src.vector_store import VectorStore
 
 class ResponseHandler:
     """
     Handles formatting and output of LLM responses to various destinations.
     Supports multiple output types including terminal, file, and specialized formats like obsidian_papers.
-    Also stores responses in vector database for future reference.
+    Also stores responses in vector database for future reference, via a background write-behind queue.
     """
     
     def __init__(self, model_name: str, force_overwrite: bool = False, store_in_db: bool = True):
         self.model_name = model_name
         self.force_overwrite = force_overwrite
         self.store_in_db = store_in_db
-        self.vector_store = VectorStore() if store_in_db else None
+        self._interaction_writer = None
+
+    @property
+    def interaction_writer(self):
+        """Background writer, created on first use so output-only runs never load chromadb or the embedding model"""
+        if self.store_in_db and self._interaction_writer is None:
+            from src.interaction_writer import InteractionWriter
+            self._interaction_writer = InteractionWriter()
+        return self._interaction_writer
     
     def handle_response(self, 
                        response: str, 
@@ -31,13 +38,13 @@ class ResponseHandler:
             output_destination: Where to send the output (terminal, file, obsidian_papers)
             input_file: The input file that was processed (if any)
         """
-        # Store the response in vector DB if enabled and we have a query
-        if self.store_in_db and self.vector_store and query:
+        # Queue the response for the vector DB if enabled and we have a query; stored in the background
+        if self.store_in_db and query:
             query_type = "file_analysis" if input_file else "question"
             file_path = str(input_file) if input_file else None
             
             try:
-                self.vector_store.add_interaction(
+                self.interaction_writer.enqueue(
                     query=query,
                     response=response,
                     model_name=self.model_name,
@@ -46,7 +46,7 @@ class SearchService:
             similarity_pct = int(result["similarity"] * 100)
             
             output += f"{i+1}. [{similarity_pct}% match] "
-            output += colored(result["summary"], "cyan") + "\n"
+            output += colored(result["summary"] or "(summary pending)", "cyan") + "\n"
             output += f"   Model: {result['model']} | Date: {formatted_date}\n"
             
             if result.get("file_path"):
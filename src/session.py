@@ -1,12 +1,14 @@
+import os
 from pathlib import Path
-from typing import Tuple, Dict
+from typing import Tuple, Dict, List
 import yaml
 from config_logger import logger
-import tiktoken
 
-from config import DEFAULT_METADATA, SESSIONS_DIR, DELIMITER, INTERNAL_CHAT_DELIMITER, SUPPORTED_MODELS, DEFAULT_MODEL
+from config import DEFAULT_METADATA, SESSIONS_DIR, DELIMITER, INTERNAL_CHAT_DELIMITER, SUPPORTED_MODELS, DEFAULT_MODEL, RETRIEVAL_TOP_K
 from src.context_manager import ContextManager
 from src.llm import LLM
+from src.session_index import SessionIndex, dump_metadata, update_token_field
+from src.tokenizer import get_tokenizer
 from prompts.prompts import PROMPTS
 
 class Session:
@@ -28,15 +30,6 @@ class Session:
         loaded_metadata, self.latest_query, self.chat_history = self.load_session_core()
         self.metadata = loaded_metadata
         
-        self.context = ContextManager(
-            location=self.session_dir,
-            files=self.metadata.get('files', []), # 'files' now handles text and images
-            search=self.metadata.get('search', []),
-            # images parameter removed
-            query=self.latest_query,
-            chat_history=self.chat_history,
-            is_session=is_session
-        )
         self.llm_config_name = self.metadata.get('llm_config', DEFAULT_MODEL)
         if self.llm_config_name not in SUPPORTED_MODELS:
             self.logger.warning(
@@ -50,6 +43,20 @@ class Session:
         
         self.llm_config = SUPPORTED_MODELS[self.llm_config_name]
 
+        self.context = ContextManager(
+            location=self.session_dir,
+            files=self.metadata.get('files', []), # 'files' now handles text and images
+            search=self.metadata.get('search', []),
+            # images parameter removed
+            query=self.latest_query,
+            chat_history=self.chat_history,
+            is_session=is_session,
+            retrieval=bool(self.metadata.get('retrieval', False)),
+            retrieval_top_k=int(self.metadata.get('retrieval_top_k', RETRIEVAL_TOP_K)),
+            # Images are sized and encoded for the session's model
+            provider=self.llm_config.provider,
+        )
+
         if self.system_prompt_name in PROMPTS:
             self.logger.info(f"Using system prompt '{self.system_prompt_name}'")
             self.llm_config.system_prompt = PROMPTS[self.system_prompt_name]
@@ -59,10 +66,9 @@ class Session:
         )
 
     def count_tokens(self, text) -> int:
-        """Count tokens in text using tiktoken"""
+        """Count tokens in text with the shared tokenizer"""
         try:
-            encoding = tiktoken.get_encoding("cl100k_base")  # GPT-4 encoding
-            return len(encoding.encode(text))
+            return get_tokenizer().count(text)
         except Exception as e:
             self.logger.error(f"Error counting tokens: {e}")
             return 0
@@ -104,6 +110,9 @@ class Session:
         return latest_query, chat_history
 
     def load_session_core(self) -> Tuple[Dict, str, list[dict]]:
+        self.index = SessionIndex(self.md_file, self.count_tokens)
+        self._loaded_metadata, self._has_header, self._body_is_blank = None, False, True
+
         if not self.md_file.exists():
             self.logger.error(f"Session markdown file {self.md_file} not found.")
             return DEFAULT_METADATA.copy(), "", []
@@ -131,22 +140,74 @@ class Session:
                 _content_for_chat = parts[1] if len(parts) > 1 else ""
         
         # images_from_yaml logic removed here
-            
-        latest_query, chat_history = self.parse_chat_history(_content_for_chat)
+
+        # Remembered so run_session can tell whether appending the response is enough
+        self._loaded_metadata = dict(metadata)
+        self._has_header = content.find('---') != -1
+        self._body_is_blank = _content_for_chat.strip() == ""
+
+        # Turns already seen in earlier runs are reused from the sidecar index instead of re-split and re-tokenized
+        latest_query, chat_history = self.index.parse(_content_for_chat)
 
         return metadata, latest_query, chat_history
 
     def run_session(self):
         """Passing new block since it was initialised and using"""
-        messages = self.context.get_messages()
+        messages = self.context.get_messages(self.llm_config)
 
-        n_tokens = sum([self.count_tokens(m['content']) for m in messages])
+        n_tokens = self.prompt_tokens(messages)
         self.metadata['current_tokens'] = n_tokens
 
         response = self.llm.query(messages=messages)
 
         self.logger.info(f"Using model {self.llm_config_name} to generate response...")
 
+        if not self._append_response(response, n_tokens):
+            self._rewrite_with_response(response)
+
+        # Re-index: the unchanged prefix is verified by digest, so only the new turn is tokenized
+        self.load_session_core()
+        self.index.save()
+            
+        self.logger.info(f"Session {self.session_name} updated with new response")
+        return True
+
+    def prompt_tokens(self, messages: List[Dict]) -> int:
+        """Tokens actually sent: the packer's count when history was trimmed to fit, else history plus the new message"""
+        packed = self.context.last_pack
+        # A pack that fit without counting (see ContextPacker.pack) has no decisions; everything went in
+        if packed is not None and packed.decisions:
+            return packed.used_tokens
+        # History token counts come from the index; only the new user message is tokenized
+        return self.index.history_tokens() + self.count_message_tokens(messages[-1])
+
+    def count_message_tokens(self, message: Dict) -> int:
+        content = message['content']
+        if isinstance(content, str):
+            return self.count_tokens(content)
+        return sum(self.count_tokens(part['text']) for part in content if part.get('type') == 'text')
+
+    def _append_response(self, response: str, n_tokens: int) -> bool:
+        """
+        Append the response to the end of the file and update current_tokens in place.
+        Returns False when the file needs a full rewrite instead (metadata changed, blank body, unpadded header).
+        """
+        if self._body_is_blank:
+            return False
+        if self._has_header:
+            unchanged = {k: v for k, v in self.metadata.items() if k != 'current_tokens'}
+            loaded = {k: v for k, v in (self._loaded_metadata or {}).items() if k != 'current_tokens'}
+            if unchanged != loaded:
+                return False
+
+        with self.md_file.open('r+b') as f:
+            if self._has_header and not update_token_field(f, n_tokens):
+                return False
+            f.seek(0, os.SEEK_END)
+            f.write(f'\n{INTERNAL_CHAT_DELIMITER}{response}\n\n{DELIMITER}'.encode('utf-8'))
+        return True
+
+    def _rewrite_with_response(self, response: str) -> None:
         with self.md_file.open('r') as f:
             content = f.read()
             if content.find('---') == -1:
@@ -161,7 +222,7 @@ class Session:
         with self.md_file.open('w') as f:
             if write_metadata:
                 f.write('---\n')
-                yaml.dump(self.metadata, f, default_flow_style=False)
+                f.write(dump_metadata(self.metadata))
                 f.write('---')
            
             if body.strip() == "":
@@ -170,9 +231,3 @@ class Session:
                 f.write(body)
             f.write(f'\n{INTERNAL_CHAT_DELIMITER}{response}\n\n')
             f.write(f"{DELIMITER}")
-            
-        self.logger.info(f"Session {self.session_name} updated with new response")
-        return True
-            
-
-
@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+import re
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import yaml
+
+from config import CLI_LLM_DIR, DELIMITER, INTERNAL_CHAT_DELIMITER
+from config_logger import logger
+
+INDEX_VERSION = 1
+
+# current_tokens is written padded to this width so later runs can update it in place
+TOKEN_FIELD = b"current_tokens:"
+TOKEN_FIELD_WIDTH = 12
+
+Span = Tuple[int, int]
+
+
+@dataclass
+class Turn:
+    """One completed query/response block; spans are offsets into the chat body (after the metadata header)"""
+    user: Span
+    assistant: Span
+    digest: str
+    tokens: Tuple[int, int]
+
+
+def dump_metadata(metadata: Dict) -> str:
+    """YAML for the session header, with current_tokens padded so it can be rewritten in place"""
+    text = yaml.dump(metadata, default_flow_style=False)
+    return re.sub(
+        r"^current_tokens: (\d+)$",
+        lambda m: f"current_tokens: {m.group(1)}".ljust(len(TOKEN_FIELD) + TOKEN_FIELD_WIDTH),
+        text,
+        flags=re.MULTILINE,
+    )
+
+
+def update_token_field(f, n_tokens: int) -> bool:
+    """
+    Overwrite current_tokens in the YAML header of an open ('r+b') session file without moving any other byte.
+    Returns False if there is no header field or the new value does not fit its padding.
+    """
+    f.seek(0)
+    if f.readline().strip() != b"---":
+        return False
+    while True:
+        position = f.tell()
+        line = f.readline()
+        if not line or line.startswith(b"---"):
+            return False
+        if line.startswith(TOKEN_FIELD):
+            width = len(line.rstrip(b"\r\n")) - len(TOKEN_FIELD)
+            value = f" {n_tokens}".encode()
+            if len(value) > width:
+                return False
+            f.seek(position + len(TOKEN_FIELD))
+            f.write(value.ljust(width))
+            return True
+
+
+class SessionIndex:
+    """
+    Sidecar index of a session file's completed turns: their offsets in the chat body, a digest and token counts.
+    As long as the already-indexed part of the body is unchanged, loading only scans and tokenizes the new tail;
+    if earlier turns were edited the body is rescanned, still reusing counts for every unchanged turn.
+    """
+
+    def __init__(self, md_file: Path, count_tokens: Callable[[str], int], index_dir: Optional[Path] = None):
+        self.logger = logger
+        self.md_file = Path(md_file)
+        self.count_tokens = count_tokens
+        index_dir = Path(index_dir) if index_dir else CLI_LLM_DIR / "session_index"
+        index_dir.mkdir(exist_ok=True, parents=True)
+        path_key = hashlib.sha1(str(self.md_file.resolve()).encode("utf-8")).hexdigest()
+        self.path = index_dir / f"{path_key}.json"
+
+        self.turns: List[Turn] = []
+        self.prefix_length = 0
+        self.prefix_digest = _digest("")
+        self._load()
+
+    def parse(self, body: str) -> Tuple[str, List[Dict[str, str]]]:
+        """Latest query and chat history of a chat body, updating the index in memory"""
+        if (len(body) >= self.prefix_length
+                and _digest(body[:self.prefix_length]) == self.prefix_digest):
+            turns, scan_from = self.turns, self.prefix_length
+        else:
+            self.logger.debug(f"Session {self.md_file.name} was edited before its last turn; rescanning")
+            turns, scan_from = [], 0
+
+        known_tokens = {turn.digest: turn.tokens for turn in self.turns}
+        new_turns, prefix_end = _scan_turns(body, scan_from)
+        for turn in new_turns:
+            turn.tokens = known_tokens.get(turn.digest) or (
+                self.count_tokens(_message(body, turn.user)),
+                self.count_tokens(_message(body, turn.assistant)),
+            )
+
+        self.turns = turns + new_turns
+        self.prefix_length = prefix_end
+        self.prefix_digest = _digest(body[:prefix_end])
+
+        chat_history = []
+        for turn in self.turns:
+            chat_history.append({"role": "user", "content": _message(body, turn.user)})
+            chat_history.append({"role": "assistant", "content": _message(body, turn.assistant)})
+        return body[prefix_end:].strip(), chat_history
+
+    def history_tokens(self) -> int:
+        return sum(user + assistant for user, assistant in (turn.tokens for turn in self.turns))
+
+    def save(self) -> None:
+        data = {
+            "version": INDEX_VERSION,
+            "prefix_length": self.prefix_length,
+            "prefix_digest": self.prefix_digest,
+            "turns": [asdict(turn) for turn in self.turns],
+        }
+        tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != INDEX_VERSION:
+                return
+            self.turns = [
+                Turn(tuple(t["user"]), tuple(t["assistant"]), t["digest"], tuple(t["tokens"])) for t in data["turns"]
+            ]
+            self.prefix_length = data["prefix_length"]
+            self.prefix_digest = data["prefix_digest"]
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.logger.warning(f"Ignoring unreadable session index {self.path}: {e}")
+
+
+def _scan_turns(body: str, start: int) -> Tuple[List[Turn], int]:
+    """Completed blocks from start onwards, split exactly like Session.parse_chat_history; returns (turns, end)"""
+    turns = []
+    position = start
+    while (end := body.find(DELIMITER, position)) != -1:
+        separator = body.find(INTERNAL_CHAT_DELIMITER, position, end)
+        if separator != -1:
+            turns.append(Turn(
+                user=_strip_span(body, position, separator),
+                assistant=_strip_span(body, separator + len(INTERNAL_CHAT_DELIMITER), end),
+                digest=_digest(body[position:end]),
+                tokens=(0, 0),
+            ))
+        position = end + len(DELIMITER)
+    return turns, position
+
+
+def _strip_span(text: str, start: int, end: int) -> Span:
+    segment = text[start:end]
+    left = len(segment) - len(segment.lstrip())
+    right = len(segment.rstrip())
+    return (start + left, start + max(left, right))
+
+
+def _message(body: str, span: Span) -> str:
+    # Empty messages are sent as "..." so providers never receive empty content
+    return body[span[0]:span[1]] or "..."
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
@@ -1,9 +1,9 @@
 from pathlib import Path
-import yaml
 import shutil
 from typing import List
 
 from config import SESSIONS_DIR, DEFAULT_METADATA
+from src.session_index import dump_metadata
 
 class SessionManager:
     def __init__(self, sessions_dir: Path=Path(SESSIONS_DIR)):
@@ -25,7 +25,7 @@ class SessionManager:
         # Write metadata and create initial markdown file
         with session_md.open('w') as f:
             f.write('---\n')
-            yaml.dump(DEFAULT_METADATA, f, default_flow_style=False)
+            f.write(dump_metadata(DEFAULT_METADATA))
             f.write('---\n\n')
         return session_dir
             
@@ -0,0 +1,129 @@
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+
+
+class SimilarityIndex:
+    """
+    Exact cosine-similarity index over a contiguous, pre-normalised float32 matrix.
+    Rows can be appended in place; storage grows geometrically so appends are amortised O(1).
+    """
+
+    def __init__(self, dim: Optional[int] = None, capacity: int = 1024):
+        self.dim = dim
+        self.ids: List[str] = []
+        self._size = 0
+        self._matrix = np.empty((capacity, dim), dtype=np.float32) if dim else None
+
+    @classmethod
+    def from_embeddings(cls, ids: Sequence[str], embeddings) -> "SimilarityIndex":
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        index = cls(dim=embeddings.shape[1] if embeddings.ndim == 2 else None, capacity=max(len(ids), 1))
+        if len(ids):
+            index.add(ids, embeddings)
+        return index
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """View of the populated rows"""
+        if self._matrix is None:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return self._matrix[:self._size]
+
+    def add(self, ids: Sequence[str], embeddings) -> None:
+        """Append rows, normalising them on the way in"""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim == 1:
+            embeddings = embeddings[np.newaxis, :]
+        if len(ids) != embeddings.shape[0]:
+            raise ValueError(f"Got {len(ids)} ids for {embeddings.shape[0]} embeddings")
+        if self.dim is None:
+            self.dim = embeddings.shape[1]
+        elif embeddings.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension {embeddings.shape[1]} does not match index dimension {self.dim}")
+
+        self._reserve(self._size + len(ids))
+        rows = self._matrix[self._size:self._size + len(ids)]
+        rows[:] = embeddings
+        _normalize_rows(rows)
+
+        self.ids.extend(ids)
+        self._size += len(ids)
+
+    def scores(self, queries) -> np.ndarray:
+        """Cosine similarity of one query (n,) or a batch of queries (q, n) against every row"""
+        queries = np.asarray(queries, dtype=np.float32)
+        single = queries.ndim == 1
+        queries = np.atleast_2d(queries).copy()
+        _normalize_rows(queries)
+        scores = queries @ self.matrix.T
+        return scores[0] if single else scores
+
+    def search(self, query, k: int) -> List[Tuple[str, float]]:
+        """Top-k (id, similarity) pairs for one query, best first"""
+        return self.search_batch(np.atleast_2d(np.asarray(query, dtype=np.float32)), k)[0]
+
+    def search_batch(self, queries, k: int) -> List[List[Tuple[str, float]]]:
+        """Top-k (id, similarity) pairs for each query in a batch"""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if self._size == 0 or k <= 0:
+            return [[] for _ in range(queries.shape[0])]
+
+        scores = self.scores(queries)
+        top = top_k_indices(scores, k)
+        return [
+            [(self.ids[i], float(row_scores[i])) for i in row_top]
+            for row_scores, row_top in zip(scores, top)
+        ]
+
+    def _reserve(self, capacity: int) -> None:
+        if self._matrix is None:
+            self._matrix = np.empty((max(capacity, 1), self.dim), dtype=np.float32)
+            return
+        if capacity <= self._matrix.shape[0]:
+            return
+        new_capacity = max(capacity, 2 * self._matrix.shape[0])
+        grown = np.empty((new_capacity, self.dim), dtype=np.float32)
+        grown[:self._size] = self._matrix[:self._size]
+        self._matrix = grown
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores along the last axis, sorted best first"""
+    scores = np.atleast_2d(scores)
+    k = min(k, scores.shape[1])
+    if k < scores.shape[1]:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def pool_scores(scores: np.ndarray, groups: np.ndarray, n_groups: int, method: str = "max") -> np.ndarray:
+    """
+    Aggregate per-row scores (q, n) into per-group scores (q, n_groups), e.g. chunk scores into documents.
+    Groups without rows score -inf.
+    """
+    scores = np.atleast_2d(scores)
+    if method == "max":
+        pooled = np.full((n_groups, scores.shape[0]), -np.inf, dtype=np.float32)
+        np.maximum.at(pooled, groups, scores.T)
+        return pooled.T
+    if method == "mean":
+        sums = np.zeros((n_groups, scores.shape[0]), dtype=np.float32)
+        np.add.at(sums, groups, scores.T)
+        counts = np.bincount(groups, minlength=n_groups).astype(np.float32)[:, np.newaxis]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            pooled = np.where(counts > 0, sums / counts, -np.inf)
+        return pooled.T
+    raise ValueError(f"Unknown pooling method: {method}")
+
+
+def _normalize_rows(rows: np.ndarray) -> None:
+    norms = np.linalg.norm(rows, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    rows /= norms
@@ -0,0 +1,95 @@
+from dataclasses import replace
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+from config import LLMConfig, SUPPORTED_MODELS, SUMMARY_BATCH_SIZE, SUMMARY_MAX_CHARS_PER_FIELD
+from config_logger import logger
+from src.llm import LLM
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You write concise one-sentence summaries (max 15 words) that capture the key insight or action "
+    "of a query and its response. Return exactly one summary per interaction, keyed by its id."
+)
+
+
+class InteractionSummary(BaseModel):
+    id: str
+    summary: str
+
+
+class InteractionSummaries(BaseModel):
+    summaries: List[InteractionSummary]
+
+
+class InteractionSummarizer:
+    """
+    Summarises stored interactions many at a time using one structured-output request per batch.
+    A single LLM client per configuration is shared across instances.
+    """
+
+    _clients: Dict[str, LLM] = {}
+
+    def __init__(self,
+                 llm_config: Optional[LLMConfig] = None,
+                 batch_size: int = SUMMARY_BATCH_SIZE,
+                 max_chars_per_field: int = SUMMARY_MAX_CHARS_PER_FIELD):
+        self.logger = logger
+        base_config = llm_config or SUPPORTED_MODELS["flash"]
+        self.llm_config = replace(
+            base_config,
+            system_prompt=SUMMARY_SYSTEM_PROMPT,
+            response_format=InteractionSummaries,
+            temperature=0.0,
+        )
+        self.batch_size = batch_size
+        self.max_chars_per_field = max_chars_per_field
+
+    @property
+    def llm(self) -> LLM:
+        key = f"{self.llm_config.provider}:{self.llm_config.model_name}"
+        if key not in self._clients:
+            self._clients[key] = LLM(llm_config=self.llm_config)
+        return self._clients[key]
+
+    def summarize(self, interactions: List[Dict[str, Any]]) -> Dict[str, str]:
+        """Map interaction id -> summary for interactions with "id", "query" and "response" keys"""
+        summaries: Dict[str, str] = {}
+        for start in range(0, len(interactions), self.batch_size):
+            batch = interactions[start:start + self.batch_size]
+            try:
+                summaries.update(self._summarize_batch(batch))
+            except Exception as e:
+                self.logger.error(f"Error generating summaries for {len(batch)} interactions: {e}")
+        return summaries
+
+    def _summarize_batch(self, batch: List[Dict[str, Any]]) -> Dict[str, str]:
+        blocks = []
+        for interaction in batch:
+            blocks.append(
+                f"<interaction id=\"{interaction['id']}\">\n"
+                f"[QUERY]\n{self._clip(interaction['query'])}\n\n"
+                f"[RESPONSE]\n{self._clip(interaction['response'])}\n"
+                f"</interaction>"
+            )
+        prompt = f"Summarise each of the following {len(batch)} interactions.\n\n" + "\n\n".join(blocks)
+
+        response = self.llm.query(messages=[{"role": "user", "content": prompt}])
+        if not response:
+            raise ValueError("empty response from summary model")
+
+        wanted_ids = {interaction["id"] for interaction in batch}
+        parsed = InteractionSummaries.model_validate_json(response)
+        summaries = {
+            item.id: item.summary.strip().removeprefix("Summary:").strip()
+            for item in parsed.summaries
+            if item.id in wanted_ids and item.summary.strip()
+        }
+        if len(summaries) < len(batch):
+            self.logger.warning(f"Summary model returned {len(summaries)} of {len(batch)} summaries")
+        return summaries
+
+    def _clip(self, text: str) -> str:
+        if len(text) <= self.max_chars_per_field:
+            return text
+        return text[:self.max_chars_per_field] + " [...]"
@@ -0,0 +1,199 @@
+import codecs
+import mmap
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Deque, Iterator, List, Optional, Tuple
+
+from config import MAX_TOKENS, TEXT_EXCERPT_MODE, TEXT_SAMPLE_WINDOWS, STDIN_HEAD_TOKENS, STDIN_TAIL_TOKENS
+from config_logger import logger
+from src.tokenizer import Tokenizer, get_tokenizer
+
+# Bytes decoded and counted per step while checking a file against its token budget
+READ_CHUNK_BYTES = 1024 * 1024
+
+# Bytes read from a pipe at a time
+STREAM_CHUNK_BYTES = 64 * 1024
+
+# Bytes read per wanted token when cutting an excerpt window; tokens average about four bytes
+WINDOW_BYTES_PER_TOKEN = 8
+
+
+@dataclass
+class BoundedText:
+    content: str
+    token_count: int
+    truncated: bool
+    size: int  # bytes of the file or stream
+
+
+def read_bounded(file_path: Path,
+                 max_tokens: int = MAX_TOKENS,
+                 mode: str = TEXT_EXCERPT_MODE,
+                 tokenizer: Optional[Tokenizer] = None) -> BoundedText:
+    """
+    Text of a file within max_tokens, using memory proportional to max_tokens rather than to the file.
+    The file is memory-mapped and counted in chunks until the budget is passed; a file over budget yields
+    its beginning and end ("head_tail") or evenly spaced windows ("sample"), cut straight from the mapping.
+    """
+    tokenizer = tokenizer or get_tokenizer()
+    file_path = Path(file_path)
+    size = file_path.stat().st_size
+    if size == 0:
+        return BoundedText("", 0, False, 0)
+
+    with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pieces: List[str] = []
+        total = 0
+        for piece in _decoded_chunks(mm):
+            total += len(tokenizer.encode(piece))
+            if total > max_tokens:
+                break
+            pieces.append(piece)
+        else:
+            return BoundedText("".join(pieces), total, False, size)
+
+        pieces.clear()
+        logger.warning(f"{file_path} ({size / 1e6:.1f} MB) has more than {max_tokens} tokens; keeping a {mode} excerpt")
+        if mode == "sample":
+            content = _sampled(mm, max_tokens, TEXT_SAMPLE_WINDOWS, tokenizer)
+        else:
+            content = _head_tail(mm, max_tokens, tokenizer)
+    return BoundedText(content, len(tokenizer.encode(content)), True, size)
+
+
+def _decoded_chunks(mm: mmap.mmap) -> Iterator[str]:
+    """The mapping decoded in chunks of about READ_CHUNK_BYTES, cut after a newline where possible"""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    start = 0
+    while start < len(mm):
+        end = min(len(mm), start + READ_CHUNK_BYTES)
+        if end < len(mm):
+            newline = mm.rfind(b"\n", start, end)
+            end = newline + 1 if newline > start else end
+        yield decoder.decode(mm[start:end], final=end == len(mm))
+        start = end
+
+
+def _window(mm: mmap.mmap, start: int, n_bytes: int) -> Tuple[int, str]:
+    """Offset and text of n_bytes from start, moved forward to the next line start unless at the beginning of the file"""
+    if start > 0:
+        newline = mm.find(b"\n", start - 1, start + n_bytes)
+        start = newline + 1 if newline != -1 else start
+    return start, mm[start:start + n_bytes].decode("utf-8", errors="replace")
+
+
+def _marker(omitted_bytes: int) -> str:
+    return f"\n[... {omitted_bytes} bytes omitted ...]\n"
+
+
+def _head_tail(mm: mmap.mmap, max_tokens: int, tokenizer: Tokenizer) -> str:
+    size = len(mm)
+    room = max(0, max_tokens - len(tokenizer.encode(_marker(size))))
+    head_tokens = room * 2 // 3
+    tail_tokens = room - head_tokens
+
+    _, head_window = _window(mm, 0, head_tokens * WINDOW_BYTES_PER_TOKEN)
+    head = tokenizer.encode(head_window)[:head_tokens]
+    tail_start = max(0, size - tail_tokens * WINDOW_BYTES_PER_TOKEN)
+    _, tail_window = _window(mm, tail_start, size - tail_start)
+    tail = tokenizer.encode(tail_window)[-tail_tokens:] if tail_tokens else []
+
+    decode = tokenizer.encoding.decode
+    head_text, tail_text = decode(head), decode(tail)
+    omitted = size - len(head_text.encode("utf-8")) - len(tail_text.encode("utf-8"))
+    return head_text + _marker(max(0, omitted)) + tail_text
+
+
+def _sampled(mm: mmap.mmap, max_tokens: int, windows: int, tokenizer: Tokenizer) -> str:
+    size = len(mm)
+    windows = max(1, windows)
+    # Up to one marker before each window and one after the last
+    room = max(0, max_tokens - (windows + 1) * len(tokenizer.encode(_marker(size))))
+    per_window = room // windows
+    window_bytes = per_window * WINDOW_BYTES_PER_TOKEN
+
+    parts = []
+    position = 0
+    for i in range(windows):
+        start = (size - window_bytes) * i // (windows - 1) if windows > 1 else 0
+        start, window = _window(mm, max(start, position), window_bytes)
+        text = tokenizer.encoding.decode(tokenizer.encode(window)[:per_window])
+        if start > position:
+            parts.append(_marker(start - position))
+        parts.append(text)
+        position = start + len(text.encode("utf-8"))
+    if position < size:
+        parts.append(_marker(size - position))
+    return "".join(parts)
+
+
+def read_stream_bounded(stream: BinaryIO,
+                        head_tokens: int = STDIN_HEAD_TOKENS,
+                        tail_tokens: int = STDIN_TAIL_TOKENS,
+                        tokenizer: Optional[Tokenizer] = None) -> BoundedText:
+    """
+    First head_tokens and last tail_tokens of a stream such as piped stdin, read in chunks so memory stays
+    bounded by the two windows however much is piped in. Only retained text is tokenized: chunks until the
+    head is full, then the tail, a rolling window of WINDOW_BYTES_PER_TOKEN bytes per token, once at the end.
+    """
+    tokenizer = tokenizer or get_tokenizer()
+    decode = tokenizer.encoding.decode
+    head: List[str] = []
+    head_count = 0
+    tail: Deque[Tuple[str, int]] = deque()
+    tail_bytes = 0
+    window_bytes = tail_tokens * WINDOW_BYTES_PER_TOKEN
+    omitted_bytes = 0
+    size = 0
+
+    for piece in _stream_chunks(stream):
+        n_bytes = len(piece.encode("utf-8", "surrogatepass"))
+        size += n_bytes
+        if head_count < head_tokens:
+            tokens = tokenizer.encode(piece)
+            take = min(len(tokens), head_tokens - head_count)
+            head.append(piece if take == len(tokens) else decode(tokens[:take]))
+            head_count += take
+            if take == len(tokens):
+                continue
+            piece = decode(tokens[take:])
+            n_bytes = len(piece.encode("utf-8", "surrogatepass"))
+        tail.append((piece, n_bytes))
+        tail_bytes += n_bytes
+        # Drop whole chunks from the front while the rest still fills the tail window
+        while tail and tail_bytes - tail[0][1] >= window_bytes:
+            omitted_bytes += tail[0][1]
+            tail_bytes -= tail.popleft()[1]
+
+    tail_tokens_kept = tokenizer.encode("".join(piece for piece, _ in tail))
+    tail.clear()
+    if len(tail_tokens_kept) > tail_tokens:
+        cut = len(tail_tokens_kept) - tail_tokens
+        omitted_bytes += len(decode(tail_tokens_kept[:cut]).encode("utf-8", "surrogatepass"))
+        tail_tokens_kept = tail_tokens_kept[cut:]
+
+    marker = _marker(omitted_bytes) if omitted_bytes else ""
+    content = "".join(head) + marker + decode(tail_tokens_kept)
+    token_count = head_count + (len(tokenizer.encode(marker)) if marker else 0) + len(tail_tokens_kept)
+    return BoundedText(content, token_count, omitted_bytes > 0, size)
+
+
+def _stream_chunks(stream: BinaryIO) -> Iterator[str]:
+    """Decoded chunks of a byte (or text) stream, each ending at a newline unless a line is longer than a chunk"""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = ""
+    while True:
+        data = stream.read(STREAM_CHUNK_BYTES)
+        if not data:
+            break
+        pending += data if isinstance(data, str) else decoder.decode(data)
+        newline = pending.rfind("\n")
+        if newline == -1 and len(pending) < STREAM_CHUNK_BYTES:
+            continue
+        cut = newline + 1 if newline != -1 else len(pending)
+        yield pending[:cut]
+        pending = pending[cut:]
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
@@ -0,0 +1,242 @@
+import fcntl
+import json
+import os
+import shutil
+import signal
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+from urllib.parse import quote, urlparse
+
+from config import (
+    CLI_LLM_DIR, TIKA_TIMEOUT, TIKA_MANAGED_SERVER, TIKA_SERVER_ENDPOINT, TIKA_JAVA, TIKA_STARTUP_TIMEOUT,
+    TIKA_POOL_SIZE,
+)
+from config_logger import logger
+from src.lazy_import import lazy_import
+
+requests = lazy_import("requests")
+# Only for locating and downloading the server jar, the same one tika.parser would use
+tika = lazy_import("tika.tika")
+
+HEALTH_TIMEOUT = 2.0
+STARTUP_POLL_SECONDS = 0.25
+
+
+class TikaServer:
+    """
+    A local Tika server shared by every process. The first process that needs it starts the JVM in its own
+    session, so it keeps running for later `llm` invocations, and records its pid in CLI_LLM_DIR/tika_server.json;
+    a file lock keeps concurrent parse workers from starting two. Each process talks to it through one
+    requests.Session whose keep-alive pool allows pool_size parses in flight at once.
+    """
+
+    def __init__(self,
+                 endpoint: str = TIKA_SERVER_ENDPOINT,
+                 pool_size: int = TIKA_POOL_SIZE,
+                 startup_timeout: float = TIKA_STARTUP_TIMEOUT,
+                 state_dir: Optional[Path] = None):
+        self.logger = logger
+        self.endpoint = endpoint.rstrip("/")
+        self.pool_size = pool_size
+        self.startup_timeout = startup_timeout
+        state_dir = Path(state_dir) if state_dir else CLI_LLM_DIR
+        state_dir.mkdir(exist_ok=True, parents=True)
+        self.state_path = state_dir / "tika_server.json"
+        self.lock_path = state_dir / "tika_server.lock"
+        self.log_path = state_dir / "tika_server.log"
+
+        self._lock = threading.Lock()
+        self._session = None
+        # Decided once per process: either the server answers or this process falls back to tika.parser
+        self._available: Optional[bool] = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._session = session
+        return self._session
+
+    @property
+    def is_local(self) -> bool:
+        return urlparse(self.endpoint).hostname in ("localhost", "127.0.0.1")
+
+    def healthy(self) -> bool:
+        try:
+            return self.session.get(f"{self.endpoint}/version", timeout=HEALTH_TIMEOUT).status_code == 200
+        except requests.RequestException:
+            return False
+
+    def ensure_running(self) -> bool:
+        """Whether the server can be used, starting it if it is local and not running yet"""
+        with self._lock:
+            if self._available is None:
+                self._available = self.healthy() or self.start()
+            return self._available
+
+    def start(self) -> bool:
+        if not self.is_local:
+            self.logger.warning(f"Tika server at {self.endpoint} is not reachable")
+            return False
+        with open(self.lock_path, "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                # Another process may have started it (or still be starting it) while we waited for the lock
+                if self.healthy() or (self.server_pid() and self._wait_until_healthy()):
+                    return True
+                return self._spawn()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def stop(self) -> bool:
+        pid = self.server_pid()
+        if pid is None:
+            return False
+        self.state_path.unlink(missing_ok=True)
+        try:
+            os.killpg(os.getpgid(pid), signal.SIGTERM)
+        except OSError as e:
+            self.logger.warning(f"Could not stop Tika server (pid {pid}): {e}")
+            return False
+        with self._lock:
+            self._available = None
+        return True
+
+    def server_pid(self) -> Optional[int]:
+        """
+        pid of the server an earlier run started, if that process is still a Tika server JVM. A recorded pid
+        whose process has exited (and may have been reused by an unrelated one) drops the state file.
+        """
+        state = self.state()
+        pid = state.get("pid")
+        if pid and _pid_alive(pid) and _is_tika_process(pid, state.get("jar")):
+            return pid
+        if state:
+            self.logger.info(f"Tika server recorded in {self.state_path} (pid {pid}) is gone; forgetting it")
+            self.state_path.unlink(missing_ok=True)
+        return None
+
+    def state(self) -> Dict[str, Any]:
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def parse(self, file_path: Path) -> str:
+        """Plain text of a document; raises requests.RequestException if the server fails"""
+        file_path = Path(file_path)
+        headers = {
+            "Accept": "text/plain; charset=UTF-8",
+            "Content-Disposition": f"attachment; filename*=UTF-8''{quote(file_path.name)}",
+        }
+        try:
+            with open(file_path, "rb") as f:
+                response = self.session.put(f"{self.endpoint}/tika", data=f, headers=headers, timeout=TIKA_TIMEOUT)
+        except requests.ConnectionError:
+            # The server went away; check (and restart) it again on the next parse
+            with self._lock:
+                self._available = None
+            raise
+        response.raise_for_status()
+        response.encoding = "utf-8"
+        return response.text
+
+    def _spawn(self) -> bool:
+        java = shutil.which(TIKA_JAVA)
+        jar = self._jar() if java else None
+        if not jar:
+            self.logger.warning("Cannot start a Tika server (no java or server jar); parsing through tika.parser")
+            return False
+
+        port = str(urlparse(self.endpoint).port or 9998)
+        with open(self.log_path, "ab") as log_file:
+            process = subprocess.Popen(
+                [java, "-jar", str(jar), "--host", "localhost", "--port", port],
+                stdout=log_file, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+                start_new_session=True,
+            )
+        with open(self.state_path, "w", encoding="utf-8") as f:
+            json.dump({"pid": process.pid, "endpoint": self.endpoint, "jar": str(jar), "started": time.time()}, f)
+
+        self.logger.info(f"Starting Tika server (pid {process.pid}) on {self.endpoint}")
+        if self._wait_until_healthy(process):
+            return True
+        self.logger.warning(f"Tika server did not come up within {self.startup_timeout}s, see {self.log_path}")
+        return False
+
+    def _wait_until_healthy(self, process: Optional[subprocess.Popen] = None) -> bool:
+        start_time = time.perf_counter()
+        while time.perf_counter() - start_time < self.startup_timeout:
+            if self.healthy():
+                self.logger.info(f"Tika server ready after {time.perf_counter() - start_time:.1f}s")
+                return True
+            if process is not None and process.poll() is not None:
+                return False
+            time.sleep(STARTUP_POLL_SECONDS)
+        return False
+
+    def _jar(self) -> Optional[Path]:
+        jar = Path(tika.TikaJarPath) / "tika-server.jar"
+        if jar.is_file():
+            return jar
+        try:
+            tika.getRemoteJar(tika.TikaServerJar, str(jar))
+        except Exception as e:
+            self.logger.warning(f"Could not download the Tika server jar: {e}")
+            return None
+        return jar if jar.is_file() else None
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _is_tika_process(pid: int, jar: Optional[str] = None) -> bool:
+    """Whether pid runs the Tika server jar, judged by its command line"""
+    marker = jar or "tika-server"
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            args = f.read().decode("utf-8", errors="replace").split("\0")
+    except FileNotFoundError:
+        if Path("/proc").is_dir():
+            return False
+        # No procfs (macOS): ask ps
+        try:
+            result = subprocess.run(["ps", "-o", "command=", "-p", str(pid)],
+                                    capture_output=True, text=True, timeout=HEALTH_TIMEOUT)
+        except (OSError, subprocess.SubprocessError):
+            return False
+        args = result.stdout.split()
+    except OSError:
+        return False
+    return any(marker in arg for arg in args)
+
+
+_tika_server: Optional[TikaServer] = None
+_tika_server_lock = threading.Lock()
+
+
+def get_tika_server() -> Optional[TikaServer]:
+    """Process-wide Tika server client, or None when the managed server is disabled"""
+    global _tika_server
+    if not TIKA_MANAGED_SERVER:
+        return None
+    with _tika_server_lock:
+        if _tika_server is None:
+            _tika_server = TikaServer()
+        return _tika_server
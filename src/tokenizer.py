@@ -0,0 +1,157 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Optional, Sequence
+
+from config import TOKEN_COUNT_CACHE_SIZE, TOKENIZER_THREADS
+from src.lazy_import import lazy_import
+
+tiktoken = lazy_import("tiktoken")
+
+DEFAULT_ENCODING = "cl100k_base"
+
+# Model-name prefixes with a newer encoding; everything else (Gemini, Claude, ...) is approximated with cl100k
+MODEL_FAMILY_ENCODINGS = {
+    "gpt-4o": "o200k_base",
+    "gpt-4.1": "o200k_base",
+    "gpt-5": "o200k_base",
+    "o1": "o200k_base",
+    "o3": "o200k_base",
+    "o4": "o200k_base",
+}
+
+# Texts shorter than this are cheaper to encode than to hash and look up
+MEMOIZE_MIN_CHARS = 256
+
+
+@lru_cache(maxsize=None)
+def get_encoding(name: str):
+    """tiktoken encoding, loaded once per process"""
+    return tiktoken.get_encoding(name)
+
+
+def encoding_for_model(model_name: Optional[str]) -> str:
+    for prefix, encoding in MODEL_FAMILY_ENCODINGS.items():
+        if model_name and model_name.startswith(prefix):
+            return encoding
+    return DEFAULT_ENCODING
+
+
+class Tokenizer:
+    """
+    Token counting for one encoding, with counts memoized by content hash (LRU) and
+    cheap helpers for limit checks, batches and truncation.
+    """
+
+    def __init__(self, encoding_name: str = DEFAULT_ENCODING, cache_size: int = TOKEN_COUNT_CACHE_SIZE):
+        self.encoding_name = encoding_name
+        self.cache_size = cache_size
+        self._counts: "OrderedDict[bytes, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def encoding(self):
+        return get_encoding(self.encoding_name)
+
+    def encode(self, text: str) -> List[int]:
+        # Special-token strings in user content are counted as plain text instead of raising
+        return self.encoding.encode(text, disallowed_special=())
+
+    def count(self, text: str) -> int:
+        key = self._key(text)
+        if key is not None:
+            cached = self._cached(key)
+            if cached is not None:
+                return cached
+        n_tokens = len(self.encode(text))
+        if key is not None:
+            self._remember(key, n_tokens)
+        return n_tokens
+
+    def count_batch(self, texts: Sequence[str], num_threads: int = TOKENIZER_THREADS) -> List[int]:
+        """Counts for many texts; uncached ones are encoded together on tiktoken's thread pool"""
+        keys = [self._key(text) for text in texts]
+        counts: List[Optional[int]] = [self._cached(key) if key is not None else None for key in keys]
+        missing = [i for i, n_tokens in enumerate(counts) if n_tokens is None]
+        if missing:
+            encoded = self.encoding.encode_batch([texts[i] for i in missing], num_threads=num_threads, disallowed_special=())
+            for i, tokens in zip(missing, encoded):
+                counts[i] = len(tokens)
+                if keys[i] is not None:
+                    self._remember(keys[i], len(tokens))
+        return counts
+
+    def exceeds(self, text: str, limit: int) -> bool:
+        """
+        Whether text has more than limit tokens, without encoding all of a huge text: a token is at least one
+        UTF-8 byte, and otherwise text is encoded in whitespace-aligned pieces until the running count passes limit.
+        Piece boundaries can add at most one token each, so the answer may err towards True right at the limit.
+        """
+        if len(text) <= limit and len(text.encode("utf-8", "surrogatepass")) <= limit:
+            return False
+        key = self._key(text)
+        cached = self._cached(key) if key is not None else None
+        if cached is not None:
+            return cached > limit
+
+        # Text averages several characters per token, so a piece of 2 * limit characters rarely overshoots by much
+        piece_chars = max(4096, limit * 2)
+        total = 0
+        start = 0
+        while start < len(text):
+            end = min(len(text), start + piece_chars)
+            if end < len(text):
+                # Cut right before whitespace so tokens with a leading space stay whole
+                space = text.rfind(" ", start + 1, end)
+                end = space if space > start else end
+            total += len(self.encode(text[start:end]))
+            if total > limit:
+                return True
+            start = end
+        if key is not None:
+            self._remember(key, total)
+        return False
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Text cut down to its first max_tokens tokens"""
+        # Only the head of a huge text needs encoding; fall back to all of it if the head turns out too short
+        tokens = self.encode(text[:max(4096, max_tokens * 8)])
+        if len(tokens) <= max_tokens:
+            tokens = self.encode(text)
+            if len(tokens) <= max_tokens:
+                return text
+        return self.encoding.decode(tokens[:max_tokens])
+
+    def _key(self, text: str) -> Optional[bytes]:
+        if len(text) < MEMOIZE_MIN_CHARS:
+            return None
+        return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+    def _cached(self, key: bytes) -> Optional[int]:
+        with self._lock:
+            n_tokens = self._counts.get(key)
+            if n_tokens is not None:
+                self._counts.move_to_end(key)
+            return n_tokens
+
+    def _remember(self, key: bytes, n_tokens: int) -> None:
+        with self._lock:
+            self._counts[key] = n_tokens
+            self._counts.move_to_end(key)
+            while len(self._counts) > self.cache_size:
+                self._counts.popitem(last=False)
+
+
+@lru_cache(maxsize=None)
+def _tokenizer_for_encoding(encoding_name: str) -> Tokenizer:
+    return Tokenizer(encoding_name)
+
+
+def get_tokenizer(model_name: Optional[str] = None) -> Tokenizer:
+    """Shared tokenizer for a model's family (cl100k when unknown)"""
+    return _tokenizer_for_encoding(encoding_for_model(model_name))
+
+
+def count_tokens(text: str, model_name: Optional[str] = None) -> int:
+    return get_tokenizer(model_name).count(text)
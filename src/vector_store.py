@@ -1,26 +1,32 @@
 import os
+import time
 import uuid
 from pathlib import Path
 from typing import List, Dict, Any, Optional, Union
 import json
-import chromadb
-from chromadb.utils import embedding_functions
 from datetime import datetime
+import numpy as np
 
 from config_logger import logger
-from config import SUPPORTED_MODELS
+from config import (
+    SUPPORTED_MODELS, CLI_LLM_DIR, EMBEDDING_CHUNK_POOLING, SUMMARY_MAX_ATTEMPTS, SUMMARY_RETRY_BACKOFF,
+)
 from src.embeddings import EmbeddingGenerator
-from src.llm import LLM
+from src.similarity_index import SimilarityIndex, pool_scores, top_k_indices
+from src.summarizer import InteractionSummarizer
+from src.lazy_import import lazy_import
+
+chromadb = lazy_import("chromadb")
 
 class VectorStore:
     """Manages a ChromaDB collection for storing and retrieving embeddings"""
     
-    def __init__(self, data_dir: Optional[Path] = None):
+    def __init__(self, data_dir: Optional[Path] = None, reindex_on_model_change: bool = True):
         self.logger = logger
         
         # Set up data directory
         if data_dir is None:
-            self.data_dir = Path.home() / ".cli_llm" / "vector_db"
+            self.data_dir = CLI_LLM_DIR / "vector_db"
         else:
             self.data_dir = data_dir
             
@@ -35,10 +41,27 @@ class VectorStore:
             self.logger.info(f"Loaded existing vector collection with {self.collection.count()} records")
         except Exception:
             self.logger.info("Creating new vector collection")
-            self.collection = self.client.create_collection("llm_responses")
+            # Embeddings are unit-normalised, so cosine distance gives similarity directly
+            self.collection = self.client.create_collection("llm_responses", metadata={"hnsw:space": "cosine"})
         
         # Initialize embedding generator
         self.embedding_generator = EmbeddingGenerator(api_key=SUPPORTED_MODELS["flash"].api_key)
+
+        # Summary client is only created once there is something to summarise
+        self._summarizer: Optional[InteractionSummarizer] = None
+
+        # Built lazily from the stored chunk embeddings; appended to as interactions are added.
+        # Row i of the index belongs to interaction _parent_ids[_index_groups[i]].
+        self._similarity_index: Optional[SimilarityIndex] = None
+        self._parent_ids: List[str] = []
+        self._parent_codes: Dict[str, int] = {}
+        self._index_groups: List[int] = []
+        self._index_groups_array: Optional[np.ndarray] = None
+
+        # Records which embedding model the stored vectors came from
+        self.index_state_file = self.data_dir / "index_state.json"
+        if reindex_on_model_change:
+            self._ensure_index_current()
         
     def add_interaction(self, 
                        query: str, 
@@ -48,131 +71,355 @@ class VectorStore:
                        file_path: Optional[str] = None,
                        summary: Optional[str] = None) -> str:
         """Add a new interaction to the vector store"""
-        # Generate a unique ID
-        interaction_id = str(uuid.uuid4())
-        
-        # Create combined text for embedding
-        combined_text = f"Query: {query}\nResponse: {response}"
-        
-        # Generate embedding
-        embedding = self.embedding_generator.get_embedding(combined_text)
-        
-        # Generate summary if not provided
-        if not summary:
-            summary = self._generate_summary(query, response)
-        
-        # Prepare metadata
-        metadata = {
-            "timestamp": datetime.now().isoformat(),
-            "model": model_name,
+        return self.add_interactions([{
+            "query": query,
+            "response": response,
+            "model_name": model_name,
             "query_type": query_type,
+            "file_path": file_path,
             "summary": summary,
-        }
-        
-        if file_path:
-            metadata["file_path"] = str(file_path)
-            
-        # Prepare document
-        document = {
-            "query": query,
-            "response": response
-        }
-        
-        # Add to collection
-        self.collection.add(
-            ids=[interaction_id],
-            embeddings=[embedding],
-            metadatas=[metadata],
-            documents=[json.dumps(document)]
+        }])[0]
+
+    def add_interactions(self, interactions: List[Dict[str, Any]]) -> List[str]:
+        """
+        Add a batch of interactions with one embedding pass and one collection write.
+        Each combined query/response text is split into overlapping chunks stored as child records of the
+        interaction; the interaction record itself carries the mean chunk embedding.
+        Interactions may carry their own "id" and "timestamp"; writes are upserts, so replaying a batch is safe.
+        Interactions without a summary are marked pending; call summarize_pending to fill them in.
+        """
+        if not interactions:
+            return []
+
+        embedding_model = self.embedding_generator.model_name
+        interaction_ids, chunk_texts, chunk_owner = [], [], []
+        for i, interaction in enumerate(interactions):
+            # Generate a unique ID
+            interaction_ids.append(interaction.get("id") or str(uuid.uuid4()))
+
+            # Create combined text for embedding
+            combined_text = f"Query: {interaction['query']}\nResponse: {interaction['response']}"
+            chunks = self.embedding_generator.chunk(combined_text)
+            chunk_texts.extend(chunks)
+            chunk_owner.extend([i] * len(chunks))
+
+        # Generate embeddings for every chunk of every interaction at once
+        chunk_embeddings = self.embedding_generator.get_batch_embeddings(chunk_texts)
+        chunk_owner = np.asarray(chunk_owner)
+
+        ids, embeddings, metadatas, documents = [], [], [], []
+        index_chunk_ids, index_parent_ids = [], []
+        for i, (interaction_id, interaction) in enumerate(zip(interaction_ids, interactions)):
+            own_rows = np.flatnonzero(chunk_owner == i)
+            own_chunks = [chunk_texts[row] for row in own_rows]
+            timestamp = interaction.get("timestamp") or datetime.now().isoformat()
+
+            # Summaries are filled in afterwards in batches by summarize_pending
+            summary = interaction.get("summary") or ""
+
+            # Prepare metadata
+            metadata = {
+                "timestamp": timestamp,
+                "model": interaction["model_name"],
+                "query_type": interaction.get("query_type", "question"),
+                "summary": summary,
+                "summary_pending": not summary,
+                "summary_attempts": 0,
+                "summary_retry_at": 0.0,
+                "embedding_model": embedding_model,
+                "record_type": "interaction",
+                "n_chunks": len(own_chunks),
+            }
+            if interaction.get("file_path"):
+                metadata["file_path"] = str(interaction["file_path"])
+
+            # Prepare document
+            document = {
+                "query": interaction["query"],
+                "response": interaction["response"]
+            }
+
+            chunk_ids = [f"{interaction_id}#{n}" for n in range(len(own_chunks))]
+            ids.extend([interaction_id] + chunk_ids)
+            embeddings.append(_mean_embedding(chunk_embeddings[own_rows]))
+            embeddings.extend(chunk_embeddings[own_rows])
+            metadatas.append(metadata)
+            metadatas.extend(
+                {
+                    "record_type": "chunk",
+                    "parent_id": interaction_id,
+                    "chunk_index": n,
+                    "timestamp": timestamp,
+                    "embedding_model": embedding_model,
+                }
+                for n in range(len(own_chunks))
+            )
+            documents.append(json.dumps(document))
+            documents.extend(own_chunks)
+            index_chunk_ids.extend(chunk_ids)
+            index_parent_ids.extend([interaction_id] * len(chunk_ids))
+
+        # A replayed interaction may have been stored with more chunks than it has now; drop the old ones first
+        self.collection.delete(where={"parent_id": {"$in": interaction_ids}})
+        # Add interactions and their chunks to the collection in one write
+        self.collection.upsert(
+            ids=ids,
+            embeddings=np.vstack(embeddings),
+            metadatas=metadatas,
+            documents=documents,
         )
+        if self._similarity_index is not None:
+            if any(interaction_id in self._parent_codes for interaction_id in interaction_ids):
+                # Replaced chunks are loaded already; reload from the collection on the next search
+                self._similarity_index = None
+            else:
+                self._add_to_similarity_index(index_chunk_ids, index_parent_ids, chunk_embeddings)
+
+        self.logger.info(f"Added {len(interaction_ids)} interactions ({len(chunk_texts)} chunks) to vector store")
+        return interaction_ids
         
-        self.logger.info(f"Added interaction {interaction_id} to vector store")
-        return interaction_id
-        
-    def search(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+    def search(self, query: str, limit: int = 5, pooling: str = EMBEDDING_CHUNK_POOLING) -> List[Dict[str, Any]]:
         """Search for similar interactions"""
         # Generate embedding for the query
         query_embedding = self.embedding_generator.get_embedding(query)
-        
-        # Since ChromaDB embeddings might not be accessible, recalculate them
-        all_results = self.collection.get(limit=self.collection.count())
-        
-        # Process results with recalculated embeddings
-        processed_results = []
-        similarities = []
-        
-        # Process each item
-        for i in range(len(all_results['ids'])):
-            # Parse document and metadata
-            doc = json.loads(all_results['documents'][i])
-            metadata = all_results['metadatas'][i]
-            
-            # Recalculate embedding for document
-            doc_text = f"Query: {doc.get('query', '')}\nResponse: {doc.get('response', '')}"
-            doc_embedding = self.embedding_generator.get_embedding(doc_text)
-            
-            # Calculate cosine similarity directly
-            similarity = self.embedding_generator.similarity(query_embedding, doc_embedding)
-            similarities.append((i, similarity))
-            self.logger.info(f"Item {i}: similarity={similarity:.4f}, summary={metadata.get('summary', 'N/A')}")
-            
-        # Sort by similarity (highest first)
-        similarities.sort(key=lambda x: x[1], reverse=True)
-        
-        # Take top results based on limit
-        top_indices = [idx for idx, _ in similarities[:limit]]
-        
-        # Create processed results
-        for idx in top_indices:
-            doc = json.loads(all_results['documents'][idx])
-            metadata = all_results['metadatas'][idx]
-            
-            # Find the corresponding similarity score
-            similarity = 0.0
-            for i, sim_tuple in enumerate(similarities):
-                if sim_tuple[0] == idx:
-                    similarity = sim_tuple[1]
-                    break
-            
-            processed_results.append({
-                "id": all_results['ids'][idx],
-                "query": doc.get("query", ""),
-                "response": doc.get("response", ""),
-                "summary": metadata.get("summary", ""),
-                "model": metadata.get("model", ""),
-                "timestamp": metadata.get("timestamp", ""),
-                "file_path": metadata.get("file_path", ""),
-                "similarity": similarity,
-            })
+        return self.search_by_embedding(query_embedding, limit=limit, pooling=pooling)
+
+    def search_by_embedding(self,
+                            query_embedding: List[float],
+                            limit: int = 5,
+                            pooling: str = EMBEDDING_CHUNK_POOLING) -> List[Dict[str, Any]]:
+        """Nearest-neighbour search over the stored embeddings"""
+        return self.search_by_embeddings([query_embedding], limit=limit, pooling=pooling)[0]
+
+    def search_by_embeddings(self,
+                             query_embeddings: List[List[float]],
+                             limit: int = 5,
+                             pooling: str = EMBEDDING_CHUNK_POOLING) -> List[List[Dict[str, Any]]]:
+        """
+        Nearest-neighbour search for a batch of query embeddings, scored with one matrix product.
+        Chunk scores are pooled ("max" or "mean") into one score per interaction.
+        """
+        index = self._get_similarity_index()
+        if len(index) == 0 or limit <= 0:
+            return [[] for _ in query_embeddings]
+
+        scores = np.atleast_2d(index.scores(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))))
+        pooled = pool_scores(scores, self._index_group_array(), len(self._parent_ids), method=pooling)
+        ranked = [
+            [(self._parent_ids[j], float(row_scores[j])) for j in row_top if np.isfinite(row_scores[j])]
+            for row_scores, row_top in zip(pooled, top_k_indices(pooled, limit))
+        ]
+
+        wanted_ids = list({interaction_id for hits in ranked for interaction_id, _ in hits})
+        if not wanted_ids:
+            return [[] for _ in ranked]
+        records = self.collection.get(ids=wanted_ids, include=["documents", "metadatas"])
+        by_id = {
+            interaction_id: (document, metadata or {})
+            for interaction_id, document, metadata in zip(records['ids'], records['documents'], records['metadatas'])
+        }
+
+        all_results = []
+        for hits in ranked:
+            processed_results = []
+            for interaction_id, similarity in hits:
+                if interaction_id not in by_id:
+                    continue
+                document, metadata = by_id[interaction_id]
+                doc = json.loads(document)
+                self.logger.debug(f"Item {interaction_id}: similarity={similarity:.4f}, summary={metadata.get('summary', 'N/A')}")
+
+                processed_results.append({
+                    "id": interaction_id,
+                    "query": doc.get("query", ""),
+                    "response": doc.get("response", ""),
+                    "summary": metadata.get("summary", ""),
+                    "model": metadata.get("model", ""),
+                    "timestamp": metadata.get("timestamp", ""),
+                    "file_path": metadata.get("file_path", ""),
+                    "similarity": similarity,
+                })
+            all_results.append(processed_results)
             
-        return processed_results
-    
-    def _generate_summary(self, query: str, response: str) -> str:
-        """Generate a summary of the interaction using a small LLM"""
+        return all_results
+
+    def _get_similarity_index(self) -> SimilarityIndex:
+        """Load every stored chunk embedding into the in-memory index on first use"""
+        if self._similarity_index is None:
+            self._similarity_index = SimilarityIndex()
+            self._parent_ids = []
+            self._parent_codes = {}
+            self._index_groups = []
+            self._index_groups_array = None
+
+            stored = self.collection.get(include=["embeddings", "metadatas"])
+            chunk_ids, parent_ids, rows = [], [], []
+            for i, (record_id, metadata) in enumerate(zip(stored['ids'], stored['metadatas'])):
+                metadata = metadata or {}
+                record_type = metadata.get("record_type")
+                if record_type == "interaction":
+                    continue
+                chunk_ids.append(record_id)
+                # Records stored before chunking are their own parent
+                parent_ids.append(metadata["parent_id"] if record_type == "chunk" else record_id)
+                rows.append(i)
+
+            if rows:
+                self._add_to_similarity_index(chunk_ids, parent_ids, np.asarray(stored['embeddings'])[rows])
+            self.logger.info(f"Loaded {len(self._similarity_index)} chunk embeddings for {len(self._parent_ids)} interactions into similarity index")
+        return self._similarity_index
+
+    def _add_to_similarity_index(self, chunk_ids: List[str], parent_ids: List[str], embeddings) -> None:
+        for parent_id in parent_ids:
+            if parent_id not in self._parent_codes:
+                self._parent_codes[parent_id] = len(self._parent_ids)
+                self._parent_ids.append(parent_id)
+            self._index_groups.append(self._parent_codes[parent_id])
+        self._index_groups_array = None
+        self._similarity_index.add(chunk_ids, embeddings)
+
+    def _index_group_array(self) -> np.ndarray:
+        if self._index_groups_array is None:
+            self._index_groups_array = np.asarray(self._index_groups, dtype=np.intp)
+        return self._index_groups_array
+
+
+    def _ensure_index_current(self) -> None:
+        """Re-embed stored interactions if they were embedded with a different model"""
+        state = self._load_index_state()
+        current_model = self.embedding_generator.model_name
+        if state.get("embedding_model") == current_model:
+            return
+
+        if self.collection.count() > 0:
+            self.logger.info(
+                f"Embedding model changed ({state.get('embedding_model', 'unknown')} -> {current_model}), re-embedding stored interactions"
+            )
+            self.reindex()
+        self._save_index_state({"embedding_model": current_model})
+
+    def reindex(self, batch_size: int = 256) -> int:
+        """Re-embed every stored interaction with the current embedding model"""
+        current_model = self.embedding_generator.model_name
+        stale = self.collection.get(
+            where={"embedding_model": {"$ne": current_model}},
+            include=["documents", "metadatas"],
+        )
+
+        n_reembedded = 0
+        stale_parents = []
+        for start in range(0, len(stale['ids']), batch_size):
+            ids, texts, metadatas = [], [], []
+            for record_id, document, metadata in zip(
+                stale['ids'][start:start + batch_size],
+                stale['documents'][start:start + batch_size],
+                stale['metadatas'][start:start + batch_size],
+            ):
+                metadata = metadata or {}
+                if metadata.get("record_type") == "interaction":
+                    # Re-derived from its chunks once those are re-embedded
+                    stale_parents.append((record_id, metadata))
+                    continue
+                if metadata.get("record_type") == "chunk":
+                    texts.append(document)
+                else:
+                    doc = json.loads(document)
+                    texts.append(f"Query: {doc.get('query', '')}\nResponse: {doc.get('response', '')}")
+                ids.append(record_id)
+                metadatas.append({**metadata, "embedding_model": current_model})
+
+            if ids:
+                embeddings = self.embedding_generator.get_batch_embeddings(texts)
+                self.collection.update(ids=ids, embeddings=embeddings, metadatas=metadatas)
+                n_reembedded += len(ids)
+
+        for start in range(0, len(stale_parents), batch_size):
+            parents = stale_parents[start:start + batch_size]
+            chunks = self.collection.get(
+                where={"parent_id": {"$in": [parent_id for parent_id, _ in parents]}},
+                include=["embeddings", "metadatas"],
+            )
+            chunk_embeddings: Dict[str, List[Any]] = {}
+            for metadata, embedding in zip(chunks['metadatas'], chunks['embeddings']):
+                chunk_embeddings.setdefault(metadata["parent_id"], []).append(embedding)
+
+            parents = [(parent_id, metadata) for parent_id, metadata in parents if parent_id in chunk_embeddings]
+            if parents:
+                self.collection.update(
+                    ids=[parent_id for parent_id, _ in parents],
+                    embeddings=np.vstack([_mean_embedding(chunk_embeddings[parent_id]) for parent_id, _ in parents]),
+                    metadatas=[{**metadata, "embedding_model": current_model} for _, metadata in parents],
+                )
+                n_reembedded += len(parents)
+
+        # Stale vectors may already be loaded
+        self._similarity_index = None
+
+        self.logger.info(f"Re-embedded {n_reembedded} records with {current_model}")
+        return n_reembedded
+
+    def _load_index_state(self) -> Dict[str, Any]:
+        if not self.index_state_file.exists():
+            return {}
         try:
-            # Use Flash model for summarization
-            llm_config = SUPPORTED_MODELS["flash"]
-            llm = LLM(llm_config=llm_config)
-            
-            summarize_prompt = f"""Below is a query and its response. Create a concise one-sentence summary (max 15 words) that captures the key insight or action from this interaction:
+            with open(self.index_state_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            self.logger.warning(f"Could not read vector index state {self.index_state_file}: {e}")
+            return {}
 
-[QUERY]
-{query}
+    def _save_index_state(self, state: Dict[str, Any]) -> None:
+        with open(self.index_state_file, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+    
+    def summarize_pending(self, limit: Optional[int] = None) -> int:
+        """
+        Fill in summaries of interactions stored without one, many per summary request. Interactions whose
+        summary failed are retried with exponential backoff and given up on after SUMMARY_MAX_ATTEMPTS.
+        """
+        where = {"$and": [
+            {"record_type": "interaction"},
+            {"summary_pending": True},
+            {"summary_retry_at": {"$lte": time.time()}},
+        ]}
+        pending = self.collection.get(where=where, limit=limit, include=["documents", "metadatas"])
+        if not pending['ids']:
+            return 0
 
-[RESPONSE]
-{response}
+        interactions = []
+        for interaction_id, document in zip(pending['ids'], pending['documents']):
+            doc = json.loads(document)
+            interactions.append({"id": interaction_id, "query": doc.get("query", ""), "response": doc.get("response", "")})
 
-Summary: """
-            
-            messages = [{"role": "user", "content": summarize_prompt}]
-            summary = llm.query(messages=messages)
-            
-            # Clean up the summary if needed
-            summary = summary.strip()
-            if summary.startswith("Summary:"):
-                summary = summary[8:].strip()
-                
-            return summary
-        except Exception as e:
-            self.logger.error(f"Error generating summary: {e}")
-            return "Interaction summary unavailable"
+        summaries = self.summarizer.summarize(interactions)
+        updates, n_failed = [], 0
+        for interaction_id, metadata in zip(pending['ids'], pending['metadatas']):
+            if interaction_id in summaries:
+                updates.append((interaction_id, {**metadata, "summary": summaries[interaction_id], "summary_pending": False}))
+                continue
+            n_failed += 1
+            attempts = metadata.get("summary_attempts", 0) + 1
+            updates.append((interaction_id, {
+                **metadata,
+                "summary_attempts": attempts,
+                "summary_retry_at": time.time() + SUMMARY_RETRY_BACKOFF * 2 ** (attempts - 1),
+                "summary_pending": attempts < SUMMARY_MAX_ATTEMPTS,
+            }))
+        if updates:
+            self.collection.update(ids=[i for i, _ in updates], metadatas=[m for _, m in updates])
+
+        n_done = len(interactions) - n_failed
+        self.logger.info(f"Summarised {n_done} of {len(interactions)} pending interactions")
+        return n_done
+
+    @property
+    def summarizer(self) -> InteractionSummarizer:
+        if self._summarizer is None:
+            self._summarizer = InteractionSummarizer()
+        return self._summarizer
+
+def _mean_embedding(embeddings) -> np.ndarray:
+    """Unit-normalised mean of a set of embeddings, used as the interaction-level vector"""
+    mean = np.asarray(embeddings, dtype=np.float32).mean(axis=0)
+    norm = np.linalg.norm(mean)
+    return mean / norm if norm > 0 else mean
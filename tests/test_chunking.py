@@ -0,0 +1,48 @@
+import re
+from types import SimpleNamespace
+
+import pytest
+import tiktoken
+from src.chunking import chunk_text
+from src.embeddings import EmbeddingGenerator
+
+def test_short_text_is_a_single_chunk():
+    assert chunk_text("Query: hi\nResponse: hello", max_tokens=50, overlap=10) == ["Query: hi\nResponse: hello"]
+
+def test_long_text_is_split_into_overlapping_windows():
+    encoding = tiktoken.get_encoding("cl100k_base")
+    text = " ".join(f"w{i}" for i in range(300))
+    chunks = chunk_text(text, max_tokens=100, overlap=20)
+
+    token_lists = [encoding.encode(chunk) for chunk in chunks]
+    assert all(len(tokens) <= 100 for tokens in token_lists)
+    assert token_lists[0][-20:] == token_lists[1][:20]
+    # Last window reaches the end of the text
+    assert chunks[-1].endswith("w299")
+
+def test_overlap_must_be_smaller_than_window():
+    with pytest.raises(ValueError):
+        chunk_text("text", max_tokens=10, overlap=10)
+
+class PieceTokenizer:
+    """Stand-in for a word-piece tokenizer: every word is split into pieces of at most three characters"""
+
+    def __call__(self, text, add_special_tokens=True, return_offsets_mapping=False, verbose=True):
+        spans = []
+        for match in re.finditer(r"\S+", text):
+            spans.extend((start, min(start + 3, match.end())) for start in range(match.start(), match.end(), 3))
+        return {"offset_mapping": spans}
+
+def test_embedding_chunks_fit_the_models_own_input_limit():
+    tokenizer = PieceTokenizer()
+    generator = EmbeddingGenerator(use_cache=False)
+    generator._model = SimpleNamespace(tokenizer=tokenizer, max_seq_length=64)
+    text = " ".join(f"identifier_{i}" for i in range(400))
+
+    chunks = generator.chunk(text)
+
+    assert generator.chunk_tokens == 62
+    assert len(chunks) > 1
+    # Every window is within what the model reads, counted with its tokenizer rather than cl100k
+    assert all(len(tokenizer(chunk)["offset_mapping"]) <= generator.max_input_tokens for chunk in chunks)
+    assert chunks[0].startswith("identifier_0 ") and chunks[-1].endswith("identifier_399")
@@ -1,7 +1,9 @@
+import asyncio
 import pytest
 from pathlib import Path
 from src.context_manager import ContextManager
-from unittest.mock import patch, mock_open
+from src.parse_cache import ParseCache
+from unittest.mock import AsyncMock, patch, mock_open
 
 @pytest.fixture
 def temp_context_dir(tmp_path):
@@ -11,27 +13,31 @@ def temp_context_dir(tmp_path):
     return context_dir
 
 def test_context_manager_load_files(temp_context_dir):
-    test_file = temp_context_dir / "test_file.txt"
-    test_file.write_text("Sample content")
+    test_file = temp_context_dir / "test_file.docx"
+    test_file.write_bytes(b"Sample content")
     
-    with patch('src.context_manager.parser.from_file') as mock_parser:
+    parse_cache = ParseCache(temp_context_dir.parent / "parse_cache.sqlite3")
+    with patch('src.document_parser.get_parse_cache', return_value=parse_cache), \
+            patch('src.document_parser.get_tika_server', return_value=None), \
+            patch('src.document_parser.parser.from_file') as mock_parser:
         mock_parser.return_value = {'content': 'Parsed file content'}
         
         context = ContextManager(
             location=temp_context_dir,
-            files=["test_file.txt"],
+            files=["test_file.docx"],
             search=[],
             query="Test query",
             is_session=False
         )
         
         print(context.files_content)
-        assert context.files_content.get("test_file.txt") == "Parsed file content"
+        assert context.files_content.get("test_file.docx") == "Parsed file content"
 
 def test_context_manager_load_search(temp_context_dir):
     with patch('src.context_manager.LLM') as mock_llm:
         mock_llm_instance = mock_llm.return_value
         mock_llm_instance.query.return_value = "Search result for Python testing"
+        mock_llm_instance.aquery = AsyncMock(return_value="Search result for Python testing")
         
         context = ContextManager(
             location=temp_context_dir,
@@ -43,3 +49,59 @@ def test_context_manager_load_search(temp_context_dir):
         
         search_content = context.load_search()
         assert search_content["Python testing"] == "Search result for Python testing"
+
+def test_load_search_works_inside_a_running_event_loop(temp_context_dir):
+    with patch('src.context_manager.LLM') as mock_llm:
+        mock_llm.return_value.aquery = AsyncMock(return_value="Search result")
+        context = ContextManager(location=temp_context_dir, search=["Python testing"], query="q")
+
+        async def caller():
+            # Synchronous API called from async code, and the async one on the caller's loop
+            return context.load_search(), await context.aload_search()
+
+        assert asyncio.run(caller()) == ({"Python testing": "Search result"}, {"Python testing": "Search result"})
+
+def test_session_search_fetches_missing_terms_concurrently(temp_context_dir):
+    (temp_context_dir / "search").mkdir()
+    (temp_context_dir / "search" / "cached.txt").write_text("Cached result")
+
+    async def search(messages):
+        term = messages[0]["content"]
+        if term == "broken":
+            raise RuntimeError("search failed")
+        return f"Result for {term}"
+
+    with patch('src.context_manager.LLM') as mock_llm:
+        mock_llm.return_value.aquery = AsyncMock(side_effect=search)
+
+        context = ContextManager(
+            location=temp_context_dir,
+            search=["cached", "fresh", "broken"],
+            is_session=True
+        )
+
+    assert context.search_content == {"cached": "Cached result", "fresh": "Result for fresh"}
+    assert (temp_context_dir / "search" / "fresh.txt").read_text() == "Result for fresh"
+    assert not (temp_context_dir / "search" / "broken.txt").exists()
+    # Only uncached terms are requested, through one shared client
+    assert mock_llm.return_value.aquery.await_count == 2
+    assert mock_llm.call_count == 1
+
+def test_retrieval_sends_relevant_excerpts_instead_of_whole_files(temp_context_dir):
+    context = ContextManager(
+        location=temp_context_dir,
+        query="Where is the handler?",
+        is_session=True,
+        retrieval=True,
+        retrieval_top_k=3,
+    )
+    context.files_content = {"big.py": "def handler():\n    pass\n" * 50}
+
+    with patch('src.file_index.FileIndex') as mock_index:
+        mock_index.return_value.retrieve.return_value = {"big.py": "def handler():"}
+        prompt = context.get_messages()[-1]["content"]
+
+    mock_index.assert_called_once_with(temp_context_dir / "retrieval")
+    mock_index.return_value.update.assert_called_once_with(context.files_content)
+    mock_index.return_value.retrieve.assert_called_once_with("Where is the handler?", 3)
+    assert "--- big.py ---\ndef handler():\n</files>" in prompt
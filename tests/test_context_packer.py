@@ -0,0 +1,83 @@
+from dataclasses import replace
+
+from config import SUPPORTED_MODELS
+from src.context_packer import ContextPacker, allocate, excerpt, fair_shares
+from src.tokenizer import get_tokenizer
+
+
+def words(n: int, word: str = "word") -> str:
+    return " ".join(f"{word}{i}" for i in range(n))
+
+
+def history(n_turns: int, size: int):
+    messages = []
+    for i in range(n_turns):
+        messages.append({"role": "user", "content": f"question {i}? " + words(size)})
+        messages.append({"role": "assistant", "content": f"answer {i}. " + words(size)})
+    return messages
+
+
+def test_small_context_is_untouched():
+    packed = ContextPacker(10_000).pack("hi", history(2, 5), {"a.py": "print(1)"}, {"term": "result"})
+    assert packed.chat_history == history(2, 5)
+    assert packed.files == {"a.py": "print(1)"}
+    assert packed.search == {"term": "result"}
+    assert packed.decisions == []
+
+
+def test_oldest_turns_are_dropped_and_summarized():
+    packer = ContextPacker(3_000)
+    packed = packer.pack("What now?", history(10, 400), {}, {})
+
+    kept = packed.chat_history
+    assert kept and len(kept) % 2 == 0
+    # The most recent turns survive, whole and in order
+    assert kept[-2:] == history(10, 400)[-2:]
+    assert "question 0?" in packed.history_summary
+    assert {d.action for d in packed.decisions if d.section == "history"} >= {"kept", "dropped", "summarized"}
+    assert packed.used_tokens <= packer.budget
+
+
+def test_files_share_the_budget_fairly():
+    packer = ContextPacker(6_000)
+    files = {"small.txt": "tiny file", "big1.txt": words(20_000, "a"), "big2.txt": words(20_000, "b")}
+    packed = packer.pack("Summarize", [], files, {})
+
+    tokenizer = get_tokenizer()
+    assert packed.files["small.txt"] == "tiny file"
+    big = [tokenizer.count(packed.files[name]) for name in ("big1.txt", "big2.txt")]
+    assert abs(big[0] - big[1]) < 20
+    assert sum(big) <= packer.budget
+    # Excerpts keep the beginning and the end of the file
+    assert packed.files["big1.txt"].startswith("a0 a1")
+    assert packed.files["big1.txt"].endswith("a19999")
+    assert "tokens omitted" in packed.files["big1.txt"]
+
+
+def test_lowest_priority_sections_give_way_first():
+    packer = ContextPacker(4_000)
+    packed = packer.pack("q", history(2, 50), {"f.txt": words(3_000)}, {"term": words(3_000)})
+    decisions = {(d.section, d.name): d for d in packed.decisions}
+    assert decisions[("history", "turn 2")].action == "kept"
+    assert decisions[("files", "f.txt")].kept_tokens > decisions[("search", "term")].kept_tokens
+    assert "files" in packed.report()
+
+
+def test_budget_comes_from_the_model_config():
+    config = replace(SUPPORTED_MODELS["claude"], context_window=50_000, max_tokens=8_000, system_prompt="")
+    packer = ContextPacker.for_config(config)
+    assert packer.budget == 50_000 - 8_000 - 2_500  # 5% safety margin
+    assert ContextPacker.for_config(replace(config, context_window=None)) is None
+
+
+def test_allocate_passes_unused_share_down_by_priority():
+    allocation = allocate({"history": 100, "files": 10_000, "search": 10_000, "structure": 0}, 1_000)
+    assert allocation["history"] == 100
+    assert sum(allocation.values()) == 1_000
+    assert allocation["files"] > allocation["search"]
+
+
+def test_fair_shares_and_excerpt():
+    assert fair_shares({"a": 10, "b": 100, "c": 100}, 110) == {"a": 10, "b": 50, "c": 50}
+    assert excerpt("short", 100) == "short"
+    assert get_tokenizer().count(excerpt(words(1_000), 100)) <= 100
@@ -0,0 +1,59 @@
+import pytest
+from unittest.mock import patch
+from src.document_parser import DocumentParser, parse_document
+from src.parse_cache import ParseCache
+
+@pytest.fixture(autouse=True)
+def no_tika_server():
+    # Parse through the patched tika.parser rather than a real server
+    with patch('src.document_parser.get_tika_server', return_value=None):
+        yield
+
+def test_parse_many_keeps_input_order(tmp_path):
+    paths = []
+    for i in range(5):
+        path = tmp_path / f"note{i}.md"
+        path.write_text(f"note {i}")
+        paths.append(path)
+    paths.insert(2, tmp_path / "paper.docx")
+    paths[2].write_bytes(b"binary")
+
+    with patch('src.document_parser.parser.from_file', return_value={'content': 'Parsed docx'}) as mock_parser:
+        results = DocumentParser(processes=1, threads=3, use_cache=False).parse_many(paths)
+
+    assert [r.path for r in results] == paths
+    assert [r.content for r in results] == ["note 0", "note 1", "Parsed docx", "note 2", "note 3", "note 4"]
+    assert [r.method for r in results] == ["text", "text", "tika", "text", "text", "text"]
+    assert all(r.seconds >= 0 for r in results)
+    mock_parser.assert_called_once()
+
+def test_pdf_without_text_layer_falls_back_to_ocr(tmp_path):
+    pdf = tmp_path / "scan.pdf"
+    pdf.write_bytes(b"%PDF")
+
+    with patch('src.document_parser.parser.from_file', return_value={'content': '  \n'}), \
+         patch('src.document_parser.ocr_pdf', return_value="Scanned text") as mock_ocr:
+        result = parse_document(pdf)
+
+    mock_ocr.assert_called_once_with(pdf)
+    assert (result.content, result.method) == ("Scanned text", "ocr")
+
+def test_unreadable_file_is_reported_as_failed(tmp_path):
+    result = parse_document(tmp_path / "missing.txt")
+    assert (result.content, result.method) == ("", "failed")
+
+def test_cached_documents_are_not_parsed_again(tmp_path):
+    doc = tmp_path / "paper.docx"
+    doc.write_bytes(b"binary")
+    copy = tmp_path / "copy.docx"
+    copy.write_bytes(b"binary")
+    document_parser = DocumentParser(processes=1, cache=ParseCache(tmp_path / "cache.sqlite3"))
+
+    with patch('src.document_parser.parser.from_file', return_value={'content': 'Parsed docx'}) as mock_parser:
+        first = document_parser.parse(doc)
+        second = document_parser.parse_many([doc, copy])
+
+    mock_parser.assert_called_once()
+    assert not first.cached
+    assert [(r.content, r.cached) for r in second] == [("Parsed docx", True), ("Parsed docx", True)]
+    assert second[0].token_count == first.token_count > 0
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from src.embedding_cache import EmbeddingCache
+
+@pytest.fixture
+def cache(tmp_path):
+    return EmbeddingCache(tmp_path / "cache.sqlite3", max_entries=3)
+
+def test_roundtrip_and_stats(cache):
+    cache.put_many("model", ["hello world"], np.array([[1.0, 2.0]], dtype=np.float32))
+    cache.record_encode(1, 0.5)
+
+    hit, miss = cache.get_many("model", ["hello   world", "other"])
+
+    assert hit.tolist() == [1.0, 2.0]
+    assert miss is None
+    stats = cache.stats()
+    assert stats["session"]["hits"] == 1
+    assert stats["session"]["misses"] == 1
+    assert stats["lifetime"]["estimated_seconds_saved"] == pytest.approx(0.5)
+
+def test_key_depends_on_model(cache):
+    cache.put_many("model-a", ["text"], np.ones((1, 2)))
+    assert cache.get_many("model-b", ["text"]) == [None]
+
+def test_lru_eviction(cache):
+    for i, text in enumerate(["a", "b", "c"]):
+        cache.put_many("model", [text], np.full((1, 2), i))
+    cache.get_many("model", ["a"])  # refresh "a" so "b" is the oldest
+    cache.put_many("model", ["d"], np.full((1, 2), 3))
+
+    assert [r is not None for r in cache.get_many("model", ["a", "b", "c", "d"])] == [True, False, True, True]
+    assert cache.stats()["entries"] == 3
+
+def test_stats_persist_across_instances(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    first = EmbeddingCache(path)
+    first.put_many("model", ["x"], np.ones((1, 2)))
+    first.get_many("model", ["x"])
+
+    second = EmbeddingCache(path)
+    assert second.stats()["session"]["hits"] == 0
+    assert second.stats()["lifetime"]["hits"] == 1
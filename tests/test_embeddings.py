@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from unittest.mock import patch
+from src.embeddings import EmbeddingGenerator
+from src.embedding_cache import EmbeddingCache
+
+class LengthModel:
+    """Stand-in encoder whose embedding records the text length"""
+    def __init__(self):
+        self.calls = []
+
+    def get_sentence_embedding_dimension(self):
+        return 2
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=False, convert_to_numpy=True, show_progress_bar=False):
+        self.calls.append(list(texts))
+        return np.array([[len(t), 1.0] for t in texts], dtype=np.float32)
+
+@pytest.fixture
+def generator():
+    with patch('src.embeddings.sentence_transformers') as mock_st:
+        mock_st.SentenceTransformer.return_value = LengthModel()
+        yield EmbeddingGenerator(use_cache=False)
+
+def test_batch_embeddings_encode_once_sorted_and_keep_input_order(generator):
+    texts = ["ccc", "a", "bb"]
+    embeddings = generator.get_batch_embeddings(texts)
+
+    assert generator.model.calls == [["a", "bb", "ccc"]]
+    assert isinstance(embeddings, np.ndarray)
+    assert embeddings.dtype == np.float32
+    assert embeddings[:, 0].tolist() == [3, 1, 2]
+
+def test_batch_embeddings_empty(generator):
+    assert generator.get_batch_embeddings([]).shape == (0, 2)
+
+def test_iter_batch_embeddings_streams_chunks(generator):
+    texts = (str(i) * (i % 3 + 1) for i in range(5))
+    chunks = list(generator.iter_batch_embeddings(texts, chunk_size=2))
+
+    assert [len(c) for c in chunks] == [2, 2, 1]
+    assert len(generator.model.calls) == 3
+
+def test_cached_texts_skip_the_encoder(tmp_path):
+    with patch('src.embeddings.sentence_transformers') as mock_st:
+        mock_st.SentenceTransformer.return_value = LengthModel()
+        generator = EmbeddingGenerator(cache=EmbeddingCache(tmp_path / "cache.sqlite3"))
+        generator.get_batch_embeddings(["one", "three"])
+    embeddings = generator.get_batch_embeddings(["three", "seven", "one"])
+
+    assert generator.model.calls == [["one", "three"], ["seven"]]
+    assert embeddings[:, 0].tolist() == [5, 5, 3]
+    assert generator.cache_stats()["session"]["hits"] == 2
@@ -0,0 +1,94 @@
+import hashlib
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from src.embeddings import EmbeddingGenerator
+from src.file_index import FileIndex
+
+
+class KeywordGenerator(EmbeddingGenerator):
+    """Stand-in for EmbeddingGenerator: texts mentioning the same keyword get the same direction"""
+    keywords = ["apple", "banana", "cherry"]
+
+    def __init__(self):
+        super().__init__(model_name="keyword-model", use_cache=False)
+        # No tokenizer of its own, so chunks are measured in cl100k tokens
+        self._model = SimpleNamespace()
+        self.embedded = []
+
+    def get_batch_embeddings(self, texts):
+        self.embedded.extend(texts)
+        return np.array([self._embed(t) for t in texts], dtype=np.float32)
+
+    def get_embedding(self, text):
+        return self._embed(text)
+
+    def _embed(self, text):
+        vector = np.array([text.count(k) for k in self.keywords] + [0.01], dtype=np.float32)
+        return vector / np.linalg.norm(vector)
+
+
+def filler(n: int, seed: str) -> str:
+    return " ".join(hashlib.md5(f"{seed}{i}".encode()).hexdigest()[:6] for i in range(n))
+
+
+@pytest.fixture
+def files():
+    return {
+        "fruit.md": "apple " * 5 + filler(400, "a") + " cherry" * 5,
+        "notes.txt": "banana bread recipe",
+    }
+
+
+def test_retrieves_only_relevant_chunks(tmp_path, files):
+    index = FileIndex(tmp_path, embedding_generator=KeywordGenerator())
+    assert index.update(files) == 2
+
+    excerpts = index.retrieve("tell me about banana", top_k=1)
+    assert excerpts == {"notes.txt": "banana bread recipe"}
+
+    excerpts = index.retrieve("apple", top_k=1)
+    assert list(excerpts) == ["fruit.md"]
+    assert excerpts["fruit.md"].startswith("apple")
+    assert "cherry" not in excerpts["fruit.md"]
+
+
+def test_adjacent_chunks_are_merged(tmp_path, files):
+    index = FileIndex(tmp_path, embedding_generator=KeywordGenerator())
+    index.update(files)
+    n_chunks = index.files["fruit.md"]["n_chunks"]
+
+    # Every chunk of the file: one run, so the excerpt is the whole text with no overlap repeated
+    excerpt = index._excerpt(files["fruit.md"], list(range(n_chunks)))
+    assert excerpt == files["fruit.md"]
+    assert "[...]" in index._excerpt(files["fruit.md"], [0, n_chunks - 1])
+
+
+def test_update_only_embeds_changed_files(tmp_path, files):
+    FileIndex(tmp_path, embedding_generator=KeywordGenerator()).update(files)
+
+    generator = KeywordGenerator()
+    reloaded = FileIndex(tmp_path, embedding_generator=generator)
+    assert reloaded.update(files) == 0
+    assert generator.embedded == []
+
+    changed = {"notes.txt": "cherry pie recipe", "fruit.md": files["fruit.md"], "new.md": "banana split"}
+    assert reloaded.update(changed) == 2
+    assert generator.embedded == ["cherry pie recipe", "banana split"]
+    assert list(reloaded.files) == list(changed)
+    assert len(reloaded.embeddings) == sum(entry["n_chunks"] for entry in reloaded.files.values())
+    assert reloaded.retrieve("banana", top_k=1) == {"new.md": "banana split"}
+
+    # Removed files leave the index, and only the current embeddings file is kept on disk
+    reloaded.update({"new.md": "banana split"})
+    assert list(reloaded.files) == ["new.md"]
+    assert len(list(tmp_path.glob("embeddings-*.npy"))) == 1
+
+
+def test_model_change_rebuilds(tmp_path, files):
+    FileIndex(tmp_path, embedding_generator=KeywordGenerator()).update(files)
+    other = KeywordGenerator()
+    other.model_name = "other-model"
+    assert FileIndex(tmp_path, embedding_generator=other).update(files) == 2
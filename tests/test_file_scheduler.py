@@ -0,0 +1,15 @@
+import time
+from src.file_scheduler import FileScheduler
+
+def test_results_keep_input_order():
+    def task(n):
+        time.sleep(0.01 * (5 - n))  # later items finish first
+        if n == 2:
+            raise ValueError("bad file")
+        return n * 10
+
+    results = list(FileScheduler(workers=5).map(task, list(range(5))))
+
+    assert [item for item, _, _ in results] == [0, 1, 2, 3, 4]
+    assert [result for _, result, _ in results] == [0, 10, None, 30, 40]
+    assert isinstance(results[2][2], ValueError)
@@ -0,0 +1,114 @@
+import os
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from src.fs_walk import Crawler, DirectoryCache, classify, render_tree
+
+
+@pytest.fixture
+def project(tmp_path):
+    root = tmp_path / "project"
+    for relative in ["README.md", "src/app.py", "src/lib/util.py", "src/library.py", "node_modules/pkg/index.js", "a.txt"]:
+        path = root / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(relative)
+    return root
+
+
+def age(root: Path) -> None:
+    """Backdate every directory so its listing is old enough to cache"""
+    past = time.time() - 60
+    for directory in [root, *(p for p in root.rglob("*") if p.is_dir())]:
+        os.utime(directory, (past, past))
+
+
+def test_crawl_matches_sorted_rglob_without_excluded_dirs(project):
+    crawler = Crawler(excluded={"node_modules", "lib"}, use_cache=False)
+    entries = list(crawler.crawl([project]))
+    expected = [p for p in sorted(project.rglob("*")) if p.is_file()
+                and not {"node_modules", "lib"} & set(p.relative_to(project).parts[:-1])]
+    assert [e.path for e in entries] == expected
+    assert [e.key for e in entries] == [str(p.relative_to(project)) for p in expected]
+    # Pruning is by exact directory name, not substring
+    assert project / "src" / "library.py" in [e.path for e in entries]
+    assert crawler.directories == [project]
+
+
+def test_crawl_classifies_and_resolves_listed_paths(project):
+    (project / "logo.PNG").write_bytes(b"")
+    (project / "paper.pdf").write_bytes(b"")
+    (project / ".env").write_text("")
+    (project / ".github" / "workflows").mkdir(parents=True)
+    (project / ".github" / "workflows" / "ci.yml").write_text("on: push\n")
+    crawler = Crawler(include_hidden_files=False, use_cache=False)
+    entries = {e.key: e for e in crawler.crawl(["README.md", "logo.PNG", "paper.pdf", ".", "missing.txt"], base=project)}
+
+    assert entries["README.md"].kind == "text"
+    assert entries["logo.PNG"].kind == "image"
+    assert entries["paper.pdf"].kind == "tika"
+    assert entries["README.md"].root is None
+    assert entries["src/app.py"].root == project
+    assert ".env" not in entries
+    # Hidden directories are still walked; only dot-files are skipped
+    assert ".github/workflows/ci.yml" in entries
+    # Files already listed are not reported again by the directory walk
+    assert len([e for e in entries.values() if e.path == project / "README.md"]) == 1
+    assert classify(Path("archive.zip")) == "other"
+
+
+def test_crawl_follows_symlinks_once(project, tmp_path):
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    (shared / "notes.md").write_text("notes")
+    (project / "linked").symlink_to(shared)
+    (project / "linked_again").symlink_to(shared)
+    (project / "alias.md").symlink_to(project / "README.md")
+    (project / "src" / "loop").symlink_to(project)
+
+    entries = list(Crawler(use_cache=False).crawl([project]))
+    paths = [e.path for e in entries]
+    assert len(paths) == len(set(paths))
+    assert [e.key for e in entries if e.path == shared / "notes.md"] == ["linked/notes.md"]
+    assert [e.key for e in entries if e.path == project / "README.md"] == ["README.md"]
+
+
+def test_render_tree(project):
+    tree = render_tree(project, excluded={"node_modules"})
+    assert tree == (
+        "├── README.md\n"
+        "├── a.txt\n"
+        "└── src\n"
+        "    ├── app.py\n"
+        "    ├── lib\n"
+        "    │   └── util.py\n"
+        "    └── library.py\n"
+    )
+
+
+def test_render_tree_caps_depth_breadth_and_lines(project):
+    assert "├── lib/ …" in render_tree(project / "src", excluded=set(), max_depth=1)
+    assert render_tree(project, excluded=set(), max_entries=2).splitlines()[2] == "└── … 2 more entries"
+    capped = render_tree(project, excluded=set(), max_lines=3).splitlines()
+    assert len(capped) == 4
+    assert "tree truncated" in capped[-1]
+
+
+def test_cache_reuses_listings_until_a_directory_changes(project, tmp_path):
+    age(project)
+    cache = DirectoryCache(project, cache_dir=tmp_path / "cache")
+    first = render_tree(project, cache=cache)
+    cache.save()
+
+    reloaded = DirectoryCache(project, cache_dir=tmp_path / "cache")
+    with patch("src.fs_walk.scan_directory", side_effect=AssertionError("should use the cache")):
+        assert render_tree(project, cache=reloaded) == first
+    assert reloaded.misses == 0
+
+    (project / "src" / "new.py").write_text("")
+    fresh = DirectoryCache(project, cache_dir=tmp_path / "cache")
+    assert "new.py" in render_tree(project, cache=fresh)
+    # Only the modified directory is listed again
+    assert fresh.misses == 1
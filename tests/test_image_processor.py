@@ -0,0 +1,103 @@
+import base64
+import io
+from unittest.mock import patch
+
+import pytest
+
+from src.file_processor import FileProcessor
+from src.image_processor import ImageProcessor, PreparedImage, media_type_of, sniff_mime_type
+from src.lazy_import import _MissingModule
+from src.llm import AnthropicProvider
+from src.parse_cache import ParseCache
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+
+
+@pytest.fixture
+def processor(tmp_path):
+    return ImageProcessor(cache_dir=tmp_path / "images", parse_cache=ParseCache(tmp_path / "parse.sqlite3"))
+
+
+def test_mime_type_is_sniffed_from_the_bytes():
+    assert sniff_mime_type(PNG) == "image/png"
+    assert sniff_mime_type(b"\xff\xd8\xff\xe0" + b"\x00" * 12) == "image/jpeg"
+    assert sniff_mime_type(b"GIF89a" + b"\x00" * 10) == "image/gif"
+    assert sniff_mime_type(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == "image/webp"
+    assert sniff_mime_type(b"BM" + b"\x00" * 14) == "image/bmp"
+    assert sniff_mime_type(b"not an image") is None
+    assert media_type_of("data:image/png;base64,AAAA") == "image/png"
+
+
+def test_without_pillow_images_pass_through_with_real_type(tmp_path, processor):
+    # Named .jpg, but the bytes are a PNG
+    path = tmp_path / "screenshot.jpg"
+    path.write_bytes(PNG)
+    with patch("src.image_processor.Image", _MissingModule("PIL.Image")):
+        image = processor.prepare(path, "anthropic")
+    assert image.mime_type == "image/png"
+    assert base64.b64decode(image.data) == PNG
+
+
+def test_prepared_payloads_are_cached_by_content(tmp_path, processor):
+    path = tmp_path / "diagram.png"
+    path.write_bytes(PNG)
+    with patch("src.image_processor.Image", _MissingModule("PIL.Image")):
+        first = processor.prepare(path, "openai")
+
+    copy = tmp_path / "copy.png"
+    copy.write_bytes(PNG)
+    with patch("src.image_processor.Image", _MissingModule("PIL.Image")), \
+         patch.object(ImageProcessor, "_encode", side_effect=AssertionError("should come from the cache")):
+        cached = processor.prepare(copy, "openai")
+    assert cached.cached
+    assert cached.data_url == first.data_url
+
+
+def test_payloads_cached_without_pillow_are_not_reused_once_it_is_installed(tmp_path, processor):
+    path = tmp_path / "diagram.png"
+    path.write_bytes(PNG)
+    with patch("src.image_processor.Image", _MissingModule("PIL.Image")):
+        processor.prepare(path, "openai")
+
+    resized = PreparedImage("image/webp", "UklGRg==", 2048, 512)
+    with patch("src.image_processor.Image", object()), \
+         patch.object(ImageProcessor, "_encode", return_value=resized) as encode:
+        image = processor.prepare(path, "openai")
+    encode.assert_called_once()
+    assert not image.cached and image.mime_type == "image/webp"
+
+
+def test_cache_is_capped(tmp_path):
+    processor = ImageProcessor(cache_dir=tmp_path / "images", parse_cache=ParseCache(tmp_path / "parse.sqlite3"),
+                               max_cache_bytes=200)
+    with patch("src.image_processor.Image", _MissingModule("PIL.Image")):
+        for i in range(5):
+            path = tmp_path / f"image{i}.png"
+            path.write_bytes(PNG + bytes([i]))
+            processor.prepare(path)
+    assert sum(p.stat().st_size for p in (tmp_path / "images").glob("*.b64")) <= 200
+
+
+def test_large_images_are_downscaled_for_the_provider(tmp_path, processor):
+    Image = pytest.importorskip("PIL.Image")
+    path = tmp_path / "screenshot.png"
+    Image.new("RGB", (4000, 1000), "white").save(path)
+
+    image = processor.prepare(path, "anthropic")
+    assert image.mime_type == "image/webp"
+    assert (image.width, image.height) == (1568, 392)
+    with Image.open(io.BytesIO(base64.b64decode(image.data))) as decoded:
+        assert decoded.size == (1568, 392)
+
+
+def test_image_messages_carry_their_media_type(tmp_path, processor):
+    path = tmp_path / "photo.png"
+    path.write_bytes(PNG)
+    with patch("src.file_processor.get_image_processor", return_value=processor), \
+         patch("src.image_processor.Image", _MissingModule("PIL.Image")):
+        item = FileProcessor().process_image(str(path), "anthropic")
+    assert item["image_url"]["url"].startswith("data:image/png;base64,")
+
+    provider = AnthropicProvider.__new__(AnthropicProvider)
+    messages = provider.prepare_messages([{"role": "user", "content": [item]}])
+    assert messages[0]["content"][0]["source"]["media_type"] == "image/png"
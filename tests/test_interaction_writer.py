@@ -0,0 +1,105 @@
+import json
+import threading
+import time
+import pytest
+from unittest.mock import MagicMock, patch
+from src.interaction_writer import InteractionWriter
+
+@pytest.fixture
+def store():
+    return MagicMock()
+
+def make_writer(tmp_path, store, **kwargs):
+    return InteractionWriter(spool_dir=tmp_path / "spool", vector_store_factory=lambda: store, detach_on_exit=False, **kwargs)
+
+def test_enqueue_writes_in_background_and_clears_spool(tmp_path, store):
+    writer = make_writer(tmp_path, store)
+    interaction_id = writer.enqueue("q", "r", "flash")
+
+    assert writer.flush(timeout=5)
+    stored = store.add_interactions.call_args.args[0]
+    assert [i["id"] for i in stored] == [interaction_id]
+    assert stored[0]["query"] == "q"
+    assert list((tmp_path / "spool").iterdir()) == []
+
+def test_failed_write_stays_spooled_for_next_run(tmp_path, store):
+    store.add_interactions.side_effect = RuntimeError("db unavailable")
+    writer = make_writer(tmp_path, store)
+    writer.enqueue("q", "r", "flash")
+    assert writer.flush(timeout=5)
+
+    spooled = list((tmp_path / "spool").glob("*.json"))
+    assert len(spooled) == 1
+    assert json.loads(spooled[0].read_text())["response"] == "r"
+
+    next_store = MagicMock()
+    assert make_writer(tmp_path, next_store).drain() == 1
+    assert next_store.add_interactions.call_count == 1
+    assert list((tmp_path / "spool").iterdir()) == []
+
+def test_drain_batches(tmp_path, store):
+    writer = make_writer(tmp_path, store, batch_size=2)
+    for i in range(5):
+        writer._spool({"id": str(i), "query": "q", "response": "r", "model_name": "flash"})
+
+    assert writer.drain() == 5
+    assert [len(call.args[0]) for call in store.add_interactions.call_args_list] == [2, 2, 1]
+
+def test_claims_of_dead_processes_are_recovered(tmp_path, store):
+    writer = make_writer(tmp_path, store)
+    path = writer._spool({"id": "x", "query": "q", "response": "r", "model_name": "flash"})
+    path.rename(path.with_name(path.name + ".claimed-999999999"))
+
+    assert writer.drain() == 1
+
+def test_exit_releases_queued_but_keeps_in_flight_batch_claimed(tmp_path):
+    started, release = threading.Event(), threading.Event()
+    store = MagicMock()
+    store.add_interactions.side_effect = lambda interactions: (started.set(), release.wait(5))
+    writer = make_writer(tmp_path, store, batch_size=1)
+    writer.enqueue("first", "r", "flash")
+    assert started.wait(5)
+    writer.enqueue("second", "r", "flash")
+    writer.enqueue("third", "r", "flash")
+
+    writer.close(timeout=0.1)
+    spool = tmp_path / "spool"
+    claimed = [p for p in spool.iterdir() if ".claimed-" in p.name]
+    assert [json.loads(p.read_text())["query"] for p in claimed] == ["first"]
+    assert sorted(json.loads(p.read_text())["query"] for p in spool.glob("*.json")) == ["second", "third"]
+    release.set()
+
+def test_exit_does_not_wait_while_the_store_is_loading(tmp_path):
+    loading = threading.Event()
+    writer = InteractionWriter(spool_dir=tmp_path / "spool", detach_on_exit=False,
+                               vector_store_factory=lambda: loading.wait(5) and MagicMock())
+    writer.enqueue("q", "r", "flash")
+    writer.enqueue("q2", "r", "flash")
+
+    start = time.monotonic()
+    writer.close(timeout=5)
+    assert time.monotonic() - start < 1
+    loading.set()
+
+def test_one_drainer_serves_the_spool_for_later_runs(tmp_path, store):
+    drainer = make_writer(tmp_path, store)
+    stored = []
+    serving = threading.Thread(target=lambda: stored.append(drainer.serve(idle=0.5)))
+    with patch("src.interaction_writer.DRAINER_POLL_SECONDS", 0.05):
+        serving.start()
+        time.sleep(0.1)
+        # A later run leaves an interaction behind: no second drainer is spawned, the running one stores it
+        later_run = InteractionWriter(spool_dir=tmp_path / "spool", vector_store_factory=MagicMock, detach_on_exit=True)
+        assert later_run.drainer_running()
+        assert later_run.serve(idle=0) == 0
+        later_run._spool({"id": "late", "query": "q", "response": "r", "model_name": "flash"})
+        with patch.object(InteractionWriter, "_spawn_drainer") as spawn, \
+             patch.object(InteractionWriter, "flush", return_value=False):
+            later_run._thread = MagicMock()
+            later_run.close()
+        spawn.assert_not_called()
+        serving.join(5)
+
+    assert stored == [1]
+    assert [i["id"] for i in store.add_interactions.call_args.args[0]] == ["late"]
+    assert not drainer.drainer_running()
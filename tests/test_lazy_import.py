@@ -0,0 +1,35 @@
+import sys
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from src.lazy_import import lazy_import
+
+def test_module_body_runs_on_first_attribute_access():
+    sys.modules.pop("colorsys", None)
+    module = lazy_import("colorsys")
+
+    assert "colorsys" in sys.modules
+    assert module.rgb_to_hsv(1.0, 0.0, 0.0) == (0.0, 1.0, 1.0)
+
+def test_missing_module_raises_on_use_not_import():
+    module = lazy_import("definitely_not_an_installed_module")
+    with pytest.raises(ModuleNotFoundError):
+        module.anything
+
+def test_missing_module_can_be_introspected_and_patched():
+    module = lazy_import("definitely_not_an_installed_module")
+    assert not hasattr(module, "__func__")
+
+    holder = SimpleNamespace(module=module)
+    with patch.object(holder, "module") as mocked:
+        assert holder.module is mocked
+    assert holder.module is module
+
+def test_submodule_does_not_import_parent_package():
+    if "wsgiref" in sys.modules:
+        pytest.skip("wsgiref already imported")
+    module = lazy_import("wsgiref.headers")
+
+    assert "wsgiref" not in sys.modules
+    assert module.Headers([("A", "1")])["A"] == "1"
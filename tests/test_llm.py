@@ -1,12 +1,21 @@
+import asyncio
+from types import SimpleNamespace
 import pytest
-from unittest.mock import MagicMock, patch
+from unittest.mock import ANY, AsyncMock, MagicMock, patch
 from config import LLMConfig
 from src.llm import LLM
+from src.client_pool import client_registry, run_async
+
+@pytest.fixture(autouse=True)
+def clear_client_registry():
+    client_registry.close()
+    yield
+    client_registry.close()
 
 @pytest.fixture
 def mock_openai():
-    with patch('src.llm.OpenAI') as MockOpenAI:
-        yield MockOpenAI
+    with patch('src.client_pool.openai') as mock_openai_module, patch('src.client_pool.httpx'):
+        yield mock_openai_module.OpenAI
 
 def test_llm_initialization_openai(mock_openai):
     config = LLMConfig(
@@ -15,7 +24,7 @@ def test_llm_initialization_openai(mock_openai):
         provider="openai"
     )
     llm = LLM(llm_config=config)
-    mock_openai.assert_called_with(api_key="test-openai-key")
+    mock_openai.assert_called_with(api_key="test-openai-key", http_client=ANY)
     assert llm.llm_config == config
 
 def test_llm_initialization_other_provider(mock_openai):
@@ -26,7 +35,7 @@ def test_llm_initialization_other_provider(mock_openai):
         base_url="https://api.customprovider.com/v1/"
     )
     llm = LLM(llm_config=config)
-    mock_openai.assert_called_with(api_key="test-custom-key", base_url="https://api.customprovider.com/v1/")
+    mock_openai.assert_called_with(api_key="test-custom-key", base_url="https://api.customprovider.com/v1/", http_client=ANY)
     assert llm.llm_config == config
 
 def test_llm_query_openai(mock_openai):
@@ -85,3 +94,102 @@ def test_llm_query_with_system_prompt(mock_openai):
         temperature=0.5
     )
     assert response == "System prompt response"
+
+def test_clients_are_shared_per_provider_base_url_and_key(mock_openai):
+    mock_openai.side_effect = lambda **kwargs: MagicMock()
+    config = LLMConfig(model_name="gpt-4o", api_key="key-a", provider="openai")
+
+    first = LLM(llm_config=config)
+    second = LLM(llm_config=LLMConfig(model_name="gpt-4o-mini", api_key="key-a", provider="openai"))
+    other_key = LLM(llm_config=LLMConfig(model_name="gpt-4o", api_key="key-b", provider="openai"))
+
+    assert first.provider.client is second.provider.client
+    assert other_key.provider.client is not first.provider.client
+    assert mock_openai.call_count == 2
+    stats = client_registry.stats()["openai:default"]
+    assert stats["pools"] == 2
+    assert stats["clients_reused"] == 1
+
+def test_llm_aquery_uses_async_client(mock_openai):
+    with patch('src.client_pool.openai') as mock_openai_module, patch('src.client_pool.httpx'):
+        mock_create = mock_openai_module.AsyncOpenAI.return_value.chat.completions.create = AsyncMock(
+            return_value=MagicMock(choices=[MagicMock(message=MagicMock(content="Async response"))])
+        )
+        config = LLMConfig(model_name="o1-mini", api_key="test-openai-key", provider="openai")
+        llm = LLM(llm_config=config)
+
+        response = asyncio.run(llm.aquery([{"role": "user", "content": "Hello"}]))
+
+    mock_create.assert_awaited_once_with(model="o1-mini", n=1, messages=[{"role": "user", "content": "Hello"}])
+    assert response == "Async response"
+
+def test_run_async_closes_the_loops_clients(mock_openai):
+    with patch('src.client_pool.openai') as mock_openai_module, patch('src.client_pool.httpx'):
+        async_client = mock_openai_module.AsyncOpenAI.return_value
+        async_client.close = AsyncMock()
+        async_client.chat.completions.create = AsyncMock(
+            return_value=MagicMock(choices=[MagicMock(message=MagicMock(content="Async response"))])
+        )
+        llm = LLM(llm_config=LLMConfig(model_name="o1-mini", api_key="test-openai-key", provider="openai"))
+
+        assert run_async(llm.aquery([{"role": "user", "content": "Hello"}])) == "Async response"
+
+    async_client.close.assert_awaited_once()
+    assert len(client_registry._async_clients) == 0
+
+def test_llm_aquery_times_out(mock_openai):
+    config = LLMConfig(model_name="slow-model", api_key="test-openai-key", provider="openai")
+    llm = LLM(llm_config=config)
+
+    async def never_answers(messages):
+        await asyncio.sleep(10)
+
+    llm.provider.aquery = never_answers
+    assert asyncio.run(llm.aquery([{"role": "user", "content": "Hello"}], timeout=0.01)) is None
+
+def test_llm_astream_yields_text(mock_openai):
+    config = LLMConfig(model_name="stream-model", api_key="test-openai-key", provider="openai")
+    llm = LLM(llm_config=config)
+
+    async def chunks(messages):
+        for text in ["Hel", "lo"]:
+            yield text
+
+    llm.provider.astream = chunks
+
+    async def collect():
+        return [text async for text in llm.astream([{"role": "user", "content": "Hi"}])]
+
+    assert asyncio.run(collect()) == ["Hel", "lo"]
+
+class PinnedAnthropic:
+    """Stands in for the pinned anthropic SDK (0.22), which takes any httpx client and has no DefaultHttpxClient"""
+
+    def __init__(self, api_key, http_client):
+        self.api_key = api_key
+        self._client = http_client
+
+
+@pytest.mark.parametrize("provider", ["openai", "gemini", "anthropic", "perplexity"])
+def test_llm_builds_real_clients_for_every_provider_family(provider):
+    import httpx
+    pinned_anthropic = SimpleNamespace(Anthropic=PinnedAnthropic, AsyncAnthropic=PinnedAnthropic,
+                                       DEFAULT_TIMEOUT=httpx.Timeout(600.0, connect=5.0))
+    config = LLMConfig(model_name="model", api_key="key", provider=provider,
+                       base_url=None if provider in ("openai", "anthropic") else "https://example.com/v1")
+    with patch("src.client_pool.anthropic", pinned_anthropic):
+        llm = LLM(llm_config=config)
+
+        async def async_client():
+            return llm.provider.async_client
+
+        async_client = run_async(async_client())
+
+    # Both go through the registry's pooled transports, whose hooks count requests
+    assert len(llm.provider.client._client.event_hooks["request"]) == 1
+    assert len(async_client._client.event_hooks["request"]) == 1
+    if provider == "anthropic":
+        assert isinstance(llm.provider.client._client, httpx.Client)
+        assert isinstance(async_client._client, httpx.AsyncClient)
+    else:
+        assert type(llm.provider.client).__name__ == "OpenAI"
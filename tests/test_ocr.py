@@ -0,0 +1,124 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src.document_parser import parse_document
+from src.ocr import OcrEngine, OcrPageCache, batches, failed_pages
+from src.parse_cache import ParseCache
+
+
+class FakePdf:
+    """Stand-in for pdf2image: records which page ranges were rasterized"""
+
+    def __init__(self, n_pages):
+        self.n_pages = n_pages
+        self.ranges = []
+
+    def pdfinfo_from_path(self, path):
+        return {"Pages": self.n_pages}
+
+    def convert_from_path(self, path, dpi, first_page, last_page):
+        self.ranges.append((first_page, last_page))
+        images = []
+        for page in range(first_page, last_page + 1):
+            image = MagicMock()
+            image.page = page
+            images.append(image)
+        return images
+
+
+def fake_ocr(image, lang):
+    return f"page {image.page} ocr\n"
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    path = tmp_path / "book.pdf"
+    path.write_bytes(b"%PDF scanned")
+    return path
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return OcrPageCache(tmp_path / "ocr.sqlite3", parse_cache=ParseCache(tmp_path / "parse.sqlite3"))
+
+
+@pytest.fixture(autouse=True)
+def no_tika_server():
+    # Parse through the patched tika.parser rather than a real server
+    with patch('src.document_parser.get_tika_server', return_value=None):
+        yield
+
+
+def test_batches_are_bounded_runs_of_consecutive_pages():
+    assert batches([1, 2, 3, 4, 5], 2) == [(1, 2), (3, 4), (5, 5)]
+    assert batches([7, 1, 2, 5], 4) == [(1, 2), (5, 5), (7, 7)]
+    assert failed_pages(["a real page of text", " \n", "x"], min_chars=5) == [2, 3]
+
+
+def test_pages_are_rasterized_in_batches_and_joined(pdf, cache):
+    fake = FakePdf(5)
+    with patch("src.ocr.pdf2image", fake), patch("src.ocr.pytesseract", MagicMock(image_to_string=fake_ocr)):
+        text = OcrEngine(batch_pages=2, processes=1, cache=cache).extract(pdf)
+
+    assert fake.ranges == [(1, 2), (3, 4), (5, 5)]
+    assert text == "\n\n".join(f"page {i} ocr" for i in range(1, 6))
+
+
+def test_interrupted_job_resumes_from_cached_pages(pdf, cache):
+    fake = FakePdf(4)
+
+    def flaky_ocr(image, lang):
+        if image.page == 3:
+            raise RuntimeError("interrupted")
+        return fake_ocr(image, lang)
+
+    engine = OcrEngine(batch_pages=2, processes=1, cache=cache)
+    with patch("src.ocr.pdf2image", fake), patch("src.ocr.pytesseract", MagicMock(image_to_string=flaky_ocr)):
+        with pytest.raises(RuntimeError):
+            engine.extract(pdf)
+
+    fake.ranges.clear()
+    with patch("src.ocr.pdf2image", fake), patch("src.ocr.pytesseract", MagicMock(image_to_string=fake_ocr)):
+        text = engine.extract(pdf)
+    # The first batch was stored before the failure and is not rasterized again
+    assert fake.ranges == [(3, 4)]
+    assert text.startswith("page 1 ocr")
+
+
+def test_only_pages_without_text_are_ocred(pdf, cache):
+    fake = FakePdf(4)
+    page_texts = ["Digital page one with text", "", "Digital page three with text", "  "]
+    with patch("src.ocr.pdf2image", fake), patch("src.ocr.pytesseract", MagicMock(image_to_string=fake_ocr)):
+        text = OcrEngine(processes=1, cache=cache).extract(pdf, page_texts)
+
+    assert fake.ranges == [(2, 2), (4, 4)]
+    assert text.split("\n\n") == ["Digital page one with text", "page 2 ocr", "Digital page three with text", "page 4 ocr"]
+
+
+def test_mixed_pdf_is_completed_with_ocr(pdf):
+    page_texts = ["Digital page one with text", ""]
+    with patch("src.document_parser.parser.from_file", return_value={"content": "Digital page one with text"}), \
+         patch("src.document_parser.extract_page_texts", return_value=page_texts), \
+         patch("src.document_parser.ocr_pdf", return_value="Digital page one with text\n\nScanned") as mock_ocr:
+        result = parse_document(pdf)
+
+    mock_ocr.assert_called_once_with(pdf, page_texts)
+    assert (result.content, result.method) == ("Digital page one with text\n\nScanned", "ocr")
+
+
+def test_few_textless_pages_keep_tika_text_and_append_ocr(pdf):
+    tika = "Digital report text"
+    page_texts = [f"Digital page {i} with a text layer" for i in range(1, 20)] + [""]
+    with patch("src.document_parser.parser.from_file", return_value={"content": tika}), \
+         patch("src.document_parser.extract_page_texts", return_value=page_texts), \
+         patch("src.document_parser.ocr_pdf") as mock_ocr, \
+         patch("src.document_parser.ocr_pdf_pages", side_effect=["Scanned appendix", ""]) as mock_pages:
+        appended = parse_document(pdf)
+        # A blank page that OCR finds nothing on leaves Tika's result untouched
+        blank = parse_document(pdf)
+
+    mock_ocr.assert_not_called()
+    mock_pages.assert_called_with(pdf, [20])
+    assert (appended.content, appended.method) == ("Digital report text\n\nScanned appendix", "tika+ocr")
+    assert (blank.content, blank.method) == (tika, "tika")
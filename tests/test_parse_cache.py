@@ -0,0 +1,44 @@
+import os
+from src.parse_cache import ParseCache
+
+def test_edited_file_is_a_miss(tmp_path):
+    cache = ParseCache(tmp_path / "cache.sqlite3")
+    doc = tmp_path / "notes.md"
+    doc.write_text("first version")
+    cache.put(doc, "first version", 2, "text")
+
+    assert cache.get(doc).content == "first version"
+
+    doc.write_text("second version, longer")
+    assert cache.get(doc) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+def test_unchanged_stat_skips_hashing(tmp_path):
+    cache = ParseCache(tmp_path / "cache.sqlite3")
+    doc = tmp_path / "notes.md"
+    doc.write_text("content")
+    digest = cache.digest(doc)
+
+    # Same size and mtime: the stored digest is trusted without reading the file again
+    stat = doc.stat()
+    doc.write_text("CONTENT")
+    os.utime(doc, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert cache.digest(doc) == digest
+
+def test_least_recently_used_entries_evicted_beyond_byte_cap(tmp_path):
+    cache = ParseCache(tmp_path / "cache.sqlite3", max_bytes=25)
+    docs = []
+    for name in ["a", "b", "c"]:
+        doc = tmp_path / f"{name}.md"
+        doc.write_text(name)
+        docs.append(doc)
+
+    cache.put(docs[0], "x" * 10, 1, "text")
+    cache.put(docs[1], "y" * 10, 1, "text")
+    cache.get(docs[0])  # a is now more recently used than b
+    cache.put(docs[2], "z" * 10, 1, "text")
+
+    assert cache.get(docs[0]) is not None
+    assert cache.get(docs[1]) is None
+    assert cache.get(docs[2]) is not None
+    assert cache.stats()["bytes"] <= 25
@@ -0,0 +1,53 @@
+import pytest
+from unittest.mock import MagicMock, patch
+from config import LLMConfig
+from src.llm import LLM
+from src.rate_limiter import TokenBucket, RateLimiter, RateLimitError
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+def test_token_bucket_waits_for_refill():
+    clock = FakeClock()
+    bucket = TokenBucket(60, clock=clock, sleep=clock.sleep)  # one token per second
+
+    for _ in range(60):
+        assert bucket.acquire() == 0.0
+    assert bucket.acquire() == pytest.approx(1.0)
+    assert clock.now == pytest.approx(1.0)
+
+def test_backoff_pauses_and_grows_until_success():
+    clock = FakeClock()
+    limiter = RateLimiter(clock=clock, sleep=clock.sleep)
+
+    first = limiter.backoff()
+    second = limiter.backoff()
+    assert second == 2 * first
+    assert limiter.backoff(retry_after=100.0) == 100.0
+
+    limiter.acquire()
+    assert clock.now == pytest.approx(100.0)
+
+    limiter.succeeded()
+    assert limiter.backoff() == first
+
+def test_llm_query_retries_rate_limited_requests():
+    config = LLMConfig(model_name="retry-model", api_key="key", provider="openai")
+    with patch('src.client_pool.openai'), patch('src.client_pool.httpx'):
+        llm = LLM(llm_config=config)
+    llm.provider = MagicMock()
+    llm.provider.query.side_effect = [RateLimitError("429"), RateLimitError("429"), "done"]
+    llm.rate_limiter = MagicMock()
+
+    assert llm.query([{"role": "user", "content": "Hello"}]) == "done"
+    assert llm.rate_limiter.backoff.call_count == 2
+    llm.rate_limiter.succeeded.assert_called_once()
@@ -0,0 +1,36 @@
+from unittest.mock import MagicMock
+
+from src.context_packer import ContextPacker, PackDecision, PackedContext
+from src.session import Session
+
+
+def make_session(last_pack):
+    session = Session.__new__(Session)
+    session.context = MagicMock(last_pack=last_pack)
+    session.index = MagicMock()
+    session.index.history_tokens.return_value = 50_000
+    session.count_tokens = lambda text: len(text.split())
+    return session
+
+
+def test_prompt_tokens_count_what_the_packer_kept():
+    packed = PackedContext("query", [], {}, {}, "", budget=1_000, decisions=[
+        PackDecision("query", "query", 10, 10, "kept"),
+        PackDecision("history", "turn 1", 40_000, 0, "dropped"),
+        PackDecision("history", "turn 2", 300, 300, "kept"),
+    ])
+    session = make_session(packed)
+    assert session.prompt_tokens([{"role": "user", "content": "new question"}]) == 310
+
+
+def test_prompt_tokens_without_packing_count_the_whole_history():
+    session = make_session(PackedContext("query", [], {}, {}, ""))
+    assert session.prompt_tokens([{"role": "user", "content": "new question"}]) == 50_002
+
+
+def test_prompt_tokens_when_everything_fit_count_the_whole_history():
+    # Small enough for the packer's byte-length fast path, which records no decisions
+    packed = ContextPacker(100_000).pack("new question", [], {"a.py": "print(1)"}, {})
+    assert packed.budget == 100_000 and packed.decisions == []
+    session = make_session(packed)
+    assert session.prompt_tokens([{"role": "user", "content": "new question"}]) == 50_002
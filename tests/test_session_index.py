@@ -0,0 +1,59 @@
+import io
+import yaml
+from config import DELIMITER, INTERNAL_CHAT_DELIMITER
+from src.session_index import SessionIndex, dump_metadata, update_token_field
+
+def body_with_turns(n, latest="Latest question"):
+    blocks = [f"\nQuestion {i}\n{INTERNAL_CHAT_DELIMITER}Answer {i}\n\n" for i in range(n)]
+    return DELIMITER.join(blocks + [f"\n{latest}"])
+
+class CountingTokenizer:
+    def __init__(self):
+        self.seen = []
+
+    def __call__(self, text):
+        self.seen.append(text)
+        return len(text.split())
+
+def test_parse_matches_chat_history_format(tmp_path):
+    index = SessionIndex(tmp_path / "s.md", CountingTokenizer(), index_dir=tmp_path)
+    latest, history = index.parse(body_with_turns(2))
+
+    assert latest == "Latest question"
+    assert history == [
+        {"role": "user", "content": "Question 0"}, {"role": "assistant", "content": "Answer 0"},
+        {"role": "user", "content": "Question 1"}, {"role": "assistant", "content": "Answer 1"},
+    ]
+    assert index.history_tokens() == 8
+
+def test_only_new_turns_are_tokenized_after_reload(tmp_path):
+    index = SessionIndex(tmp_path / "s.md", CountingTokenizer(), index_dir=tmp_path)
+    index.parse(body_with_turns(3))
+    index.save()
+
+    tokenizer = CountingTokenizer()
+    reloaded = SessionIndex(tmp_path / "s.md", tokenizer, index_dir=tmp_path)
+    _, history = reloaded.parse(body_with_turns(4))
+
+    assert tokenizer.seen == ["Question 3", "Answer 3"]
+    assert len(history) == 8
+
+def test_edited_history_is_rescanned(tmp_path):
+    index = SessionIndex(tmp_path / "s.md", CountingTokenizer(), index_dir=tmp_path)
+    index.parse(body_with_turns(3))
+
+    _, history = index.parse(body_with_turns(3).replace("Answer 0", "Edited answer zero"))
+
+    assert history[1]["content"] == "Edited answer zero"
+    assert index.history_tokens() == 13
+
+def test_token_field_is_updated_in_place():
+    header = "---\n" + dump_metadata({"current_tokens": 0, "prompt": "default"}) + "---\n\nbody"
+    f = io.BytesIO(header.encode())
+
+    assert update_token_field(f, 123456)
+    updated = f.getvalue().decode()
+    assert len(updated) == len(header)
+    assert yaml.safe_load(updated.split("---")[1])["current_tokens"] == 123456
+    # Values wider than the padding need a full rewrite
+    assert not update_token_field(f, 10 ** 20)
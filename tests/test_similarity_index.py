@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from src.similarity_index import SimilarityIndex, top_k_indices, pool_scores
+
+@pytest.fixture
+def embeddings():
+    return np.random.default_rng(0).standard_normal((50, 8)).astype(np.float32)
+
+def test_search_matches_brute_force(embeddings):
+    ids = [f"id{i}" for i in range(len(embeddings))]
+    index = SimilarityIndex.from_embeddings(ids, embeddings)
+    query = embeddings[7] * 3.0  # scale should not matter
+
+    results = index.search(query, k=5)
+
+    normed = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    expected = np.argsort(-(normed @ (query / np.linalg.norm(query))))[:5]
+    assert [r[0] for r in results] == [ids[i] for i in expected]
+    assert results[0][0] == "id7"
+    assert results[0][1] == pytest.approx(1.0, abs=1e-5)
+
+def test_search_batch_returns_one_list_per_query(embeddings):
+    index = SimilarityIndex.from_embeddings([str(i) for i in range(50)], embeddings)
+    results = index.search_batch(embeddings[[1, 2, 3]], k=2)
+    assert [r[0][0] for r in results] == ["1", "2", "3"]
+    assert all(len(r) == 2 for r in results)
+
+def test_add_grows_in_place(embeddings):
+    index = SimilarityIndex(capacity=2)
+    for i, row in enumerate(embeddings):
+        index.add([str(i)], row)
+
+    assert len(index) == 50
+    assert index.matrix.dtype == np.float32
+    assert np.allclose(np.linalg.norm(index.matrix, axis=1), 1.0, atol=1e-5)
+    assert index.search(embeddings[42], k=1)[0][0] == "42"
+
+def test_k_larger_than_index_and_empty_index():
+    index = SimilarityIndex()
+    assert index.search([1.0, 0.0], k=3) == []
+
+    index.add(["a", "b"], [[1.0, 0.0], [0.0, 1.0]])
+    assert [r[0] for r in index.search([1.0, 0.1], k=10)] == ["a", "b"]
+
+def test_dimension_mismatch_raises():
+    index = SimilarityIndex.from_embeddings(["a"], [[1.0, 0.0]])
+    with pytest.raises(ValueError):
+        index.add(["b"], [[1.0, 0.0, 0.0]])
+
+def test_top_k_indices_sorted():
+    scores = np.array([[0.1, 0.9, 0.5, 0.7]])
+    assert top_k_indices(scores, 3).tolist() == [[1, 3, 2]]
+
+def test_pool_scores_max_and_mean():
+    scores = np.array([[0.2, 0.8, 0.4, 0.1]])
+    groups = np.array([0, 0, 1, 2])
+
+    assert pool_scores(scores, groups, 4, "max")[0, :3].tolist() == pytest.approx([0.8, 0.4, 0.1])
+    assert pool_scores(scores, groups, 4, "mean")[0, :3].tolist() == pytest.approx([0.5, 0.4, 0.1])
+    # A group with no rows can never win
+    assert pool_scores(scores, groups, 4, "max")[0, 3] == -np.inf
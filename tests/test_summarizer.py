@@ -0,0 +1,37 @@
+import json
+from unittest.mock import patch
+from config import LLMConfig
+from src.summarizer import InteractionSummarizer, InteractionSummaries
+
+CONFIG = LLMConfig(model_name="test-model", api_key="test-key", provider="gemini", base_url="https://example.com")
+
+def interactions(n):
+    return [{"id": f"id{i}", "query": f"query {i}", "response": f"response {i}"} for i in range(n)]
+
+def structured_reply(messages):
+    prompt = messages[0]["content"]
+    ids = [part.split('"')[0] for part in prompt.split('<interaction id="')[1:]]
+    return json.dumps({"summaries": [{"id": i, "summary": f"Summary: about {i}"} for i in ids]})
+
+def test_one_structured_request_per_batch():
+    with patch('src.summarizer.LLM') as mock_llm:
+        InteractionSummarizer._clients.clear()
+        mock_llm.return_value.query.side_effect = lambda messages: structured_reply(messages)
+
+        summarizer = InteractionSummarizer(llm_config=CONFIG, batch_size=3)
+        summaries = summarizer.summarize(interactions(7))
+
+    assert mock_llm.return_value.query.call_count == 3
+    # One shared client, configured for structured output
+    assert mock_llm.call_count == 1
+    assert mock_llm.call_args.kwargs["llm_config"].response_format is InteractionSummaries
+    assert summaries == {f"id{i}": f"about id{i}" for i in range(7)}
+
+def test_failed_batch_is_left_unsummarised():
+    with patch('src.summarizer.LLM') as mock_llm:
+        InteractionSummarizer._clients.clear()
+        mock_llm.return_value.query.side_effect = [None, structured_reply([{"content": '<interaction id="id2"'}])]
+
+        summaries = InteractionSummarizer(llm_config=CONFIG, batch_size=2).summarize(interactions(3))
+
+    assert summaries == {"id2": "about id2"}
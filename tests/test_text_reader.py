@@ -0,0 +1,106 @@
+import io
+import re
+from unittest.mock import patch
+
+import pytest
+
+from src.document_parser import parse_document
+from src.file_processor import FileProcessor
+from src.text_reader import read_bounded, read_stream_bounded
+from src.tokenizer import get_tokenizer
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = tmp_path / "build.txt"
+    path.write_text("".join(f"line {i}: compiling module {i} ✓\n" for i in range(20_000)))
+    return path
+
+
+def test_small_file_is_read_whole(tmp_path):
+    path = tmp_path / "notes.md"
+    path.write_text("short notes\n")
+    text = read_bounded(path, max_tokens=100)
+    assert (text.content, text.truncated) == ("short notes\n", False)
+    assert text.token_count == get_tokenizer().count("short notes\n")
+    assert read_bounded(tmp_path / "notes.md", max_tokens=0).truncated
+
+
+def test_oversized_file_keeps_head_and_tail_within_budget(log_file):
+    text = read_bounded(log_file, max_tokens=300)
+    assert text.truncated
+    assert text.token_count <= 300
+    assert text.content.startswith("line 0: compiling")
+    assert text.content.endswith("line 19999: compiling module 19999 ✓\n")
+    assert "bytes omitted" in text.content
+
+
+def test_sampled_excerpt_covers_the_middle(log_file):
+    text = read_bounded(log_file, max_tokens=600, mode="sample")
+    assert text.truncated
+    assert text.token_count <= 600
+    assert text.content.startswith("line 0: compiling")
+    assert text.content.count("bytes omitted") >= 7
+    numbers = [int(n) for n in re.findall(r"^line (\d+):", text.content, re.MULTILINE)]
+    assert any(5_000 < n < 15_000 for n in numbers)
+
+
+def test_counting_stops_once_over_budget(log_file):
+    tokenizer = get_tokenizer()
+    encoded = []
+    original = tokenizer.encode
+
+    def spy(text):
+        encoded.append(len(text))
+        return original(text)
+
+    with patch("src.text_reader.READ_CHUNK_BYTES", 4096), patch.object(tokenizer, "encode", side_effect=spy):
+        read_bounded(log_file, max_tokens=300, tokenizer=tokenizer)
+    # The budget check reads a few chunks, not the whole file
+    assert sum(encoded) < log_file.stat().st_size / 10
+
+
+def test_parse_document_returns_excerpt_of_huge_text_file(log_file):
+    with patch("src.document_parser.read_bounded", side_effect=lambda path: read_bounded(path, max_tokens=300)):
+        result = parse_document(log_file)
+    assert result.method == "text"
+    assert result.token_count <= 300
+    assert "bytes omitted" in result.content
+
+
+def log_lines(n: int) -> bytes:
+    return "".join(f"line {i}: compiling module {i} ✓\n" for i in range(n)).encode("utf-8")
+
+
+def test_short_stream_is_kept_whole():
+    data = log_lines(10)
+    with patch("src.text_reader.STREAM_CHUNK_BYTES", 7):
+        text = read_stream_bounded(io.BytesIO(data), head_tokens=1000, tail_tokens=1000)
+    # Multi-byte characters split across reads are decoded intact
+    assert text.content == data.decode("utf-8")
+    assert not text.truncated
+    assert text.size == len(data)
+
+
+def test_long_stream_keeps_head_and_exact_tail():
+    tokenizer = get_tokenizer()
+    data = log_lines(20_000)
+    with patch("src.text_reader.STREAM_CHUNK_BYTES", 4096):
+        text = read_stream_bounded(io.BytesIO(data), head_tokens=100, tail_tokens=300, tokenizer=tokenizer)
+
+    assert text.truncated
+    assert text.content.startswith("line 0: compiling")
+    assert text.content.endswith("line 19999: compiling module 19999 ✓\n")
+    head, marker, tail = re.split(r"(\n\[\.\.\. \d+ bytes omitted \.\.\.\]\n)", text.content)
+    assert len(tokenizer.encode(head)) <= 100
+    assert len(tokenizer.encode(tail)) <= 301
+    assert text.token_count <= 100 + 300 + len(tokenizer.encode(marker))
+
+
+def test_terminal_input_is_streamed_from_stdin():
+    stdin = io.TextIOWrapper(io.BytesIO(log_lines(5_000)), encoding="utf-8")
+    with patch("src.file_processor.sys.stdin", stdin):
+        content = FileProcessor().process_terminal_input(head_tokens=50, tail_tokens=50)
+    assert content["text"].startswith("\nTerminal context:\nline 0:")
+    assert content["text"].endswith("module 4999 ✓")
+    assert "bytes omitted" in content["text"]
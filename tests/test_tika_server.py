@@ -0,0 +1,116 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from src.document_parser import ParseResult, timings_by_type, tika_text
+from src.tika_server import TikaServer
+
+
+class FakeTika(BaseHTTPRequestHandler):
+    """Answers /version and returns uploaded documents upper-cased from /tika, over keep-alive connections"""
+    protocol_version = "HTTP/1.1"
+    connections = set()
+
+    def do_GET(self):
+        self._reply(b"Apache Tika 3.3.2" if self.path == "/version" else b"", 200 if self.path == "/version" else 404)
+
+    def do_PUT(self):
+        FakeTika.connections.add(self.client_address)
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self._reply(body.upper(), 200)
+
+    def _reply(self, body, status):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fake_server():
+    FakeTika.connections = set()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), FakeTika)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_parses_over_one_keep_alive_connection(fake_server, tmp_path):
+    server = TikaServer(endpoint=fake_server, state_dir=tmp_path)
+    assert server.ensure_running()
+
+    for i in range(3):
+        doc = tmp_path / f"paper{i}.docx"
+        doc.write_text(f"document {i}")
+        assert server.parse(doc) == f"DOCUMENT {i}"
+    assert len(FakeTika.connections) == 1
+
+
+def test_unreachable_server_falls_back_to_tika_parser(tmp_path):
+    doc = tmp_path / "paper.docx"
+    doc.write_text("document")
+    server = TikaServer(endpoint="http://127.0.0.1:9", state_dir=tmp_path)
+
+    with patch("src.tika_server.shutil.which", return_value=None) as which, \
+         patch("src.document_parser.get_tika_server", return_value=server), \
+         patch("src.document_parser.parser.from_file", return_value={"content": "Parsed docx"}) as mock_parser:
+        assert tika_text(doc) == "Parsed docx"
+        assert tika_text(doc) == "Parsed docx"
+
+    # Whether the server can be used is decided once per process
+    which.assert_called_once()
+    assert mock_parser.call_count == 2
+
+
+def test_timings_are_grouped_by_document_type():
+    results = [
+        ParseResult(Path("a.pdf"), "x", 2.0, "tika"),
+        ParseResult(Path("b.PDF"), "x", 1.0, "tika"),
+        ParseResult(Path("c.pdf"), "x", 30.0, "ocr"),
+        ParseResult(Path("d.docx"), "x", 0.0, "tika", cached=True),
+    ]
+    assert timings_by_type(results) == {(".pdf", "tika"): (2, 3.0), (".pdf", "ocr"): (1, 30.0)}
+
+
+def test_stale_pid_is_not_waited_on_or_killed(tmp_path):
+    server = TikaServer(endpoint="http://127.0.0.1:9", state_dir=tmp_path, startup_timeout=30)
+    # A recorded pid now used by an unrelated, live process (this test run)
+    server.state_path.write_text(json.dumps({"pid": os.getpid(), "endpoint": server.endpoint}))
+
+    with patch.object(TikaServer, "_spawn", return_value=False) as spawn:
+        start = time.monotonic()
+        assert not server.start()
+    assert time.monotonic() - start < 5
+    spawn.assert_called_once()
+
+    server.state_path.write_text(json.dumps({"pid": os.getpid(), "endpoint": server.endpoint}))
+    with patch("src.tika_server.os.killpg") as killpg:
+        assert not server.stop()
+    killpg.assert_not_called()
+    assert not server.state_path.exists()
+
+
+def test_recorded_tika_process_is_recognised(tmp_path):
+    process = subprocess.Popen([sys.executable, "-c", "import time; print(flush=True); time.sleep(30)", "tika-server.jar"],
+                               stdout=subprocess.PIPE)
+    try:
+        process.stdout.readline()
+        server = TikaServer(endpoint="http://127.0.0.1:9", state_dir=tmp_path)
+        server.state_path.write_text(json.dumps({"pid": process.pid, "jar": "tika-server.jar"}))
+        assert server.server_pid() == process.pid
+    finally:
+        process.kill()
+        process.wait()
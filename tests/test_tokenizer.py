@@ -0,0 +1,77 @@
+from unittest.mock import patch
+
+import pytest
+
+from src.tokenizer import Tokenizer, encoding_for_model, get_encoding, get_tokenizer
+
+
+@pytest.fixture
+def tokenizer():
+    return Tokenizer("cl100k_base", cache_size=2)
+
+
+def test_encodings_are_chosen_per_model_family():
+    assert encoding_for_model("gpt-4o-mini") == "o200k_base"
+    assert encoding_for_model("o3-mini") == "o200k_base"
+    assert encoding_for_model("claude-3-7-sonnet-latest") == "cl100k_base"
+    assert encoding_for_model(None) == "cl100k_base"
+    assert get_tokenizer("gpt-4o") is get_tokenizer("o1")
+    assert get_tokenizer() is not get_tokenizer("gpt-4o")
+
+
+def test_count_matches_tiktoken_and_handles_special_tokens(tokenizer):
+    text = "Hello world <|endoftext|> " * 20
+    expected = len(get_encoding("cl100k_base").encode(text, disallowed_special=()))
+    assert tokenizer.count(text) == expected
+
+
+def test_counts_are_memoized_by_content(tokenizer):
+    text = "some long document " * 50
+    first = tokenizer.count(text)
+    with patch.object(Tokenizer, "encode", side_effect=AssertionError("should be cached")):
+        assert tokenizer.count(text) == first
+        # Equal content hits the cache even when it is a different string object
+        assert tokenizer.count("".join(["some long document "] * 50)) == first
+
+
+def test_cache_is_bounded_lru(tokenizer):
+    texts = [f"document {i} " * 100 for i in range(3)]
+    for text in texts:
+        tokenizer.count(text)
+    assert len(tokenizer._counts) == 2
+    assert tokenizer._key(texts[0]) not in tokenizer._counts
+
+
+def test_exceeds_stops_encoding_past_the_limit(tokenizer):
+    text = "word " * 200_000
+    with patch.object(Tokenizer, "encode", wraps=tokenizer.encode) as encode:
+        assert tokenizer.exceeds(text, 1000)
+    assert sum(len(call.args[0]) for call in encode.call_args_list) < len(text) // 10
+
+
+def test_exceeds_agrees_with_count(tokenizer):
+    text = "word " * 5000
+    n_tokens = tokenizer.count(text)
+    fresh = Tokenizer("cl100k_base")
+    assert fresh.exceeds(text, n_tokens - 1)
+    assert not fresh.exceeds(text, n_tokens)
+    # Short texts are decided without encoding at all
+    with patch.object(Tokenizer, "encode", side_effect=AssertionError("should not encode")):
+        assert not fresh.exceeds("short", 10)
+
+
+def test_count_batch_reuses_cached_counts(tokenizer):
+    texts = ["alpha " * 100, "beta", "gamma " * 100]
+    expected = [len(get_encoding("cl100k_base").encode(t)) for t in texts]
+    tokenizer.count(texts[0])
+    with patch.object(get_encoding("cl100k_base"), "encode_batch", wraps=get_encoding("cl100k_base").encode_batch) as batch:
+        assert tokenizer.count_batch(texts) == expected
+    assert batch.call_args.args[0] == texts[1:]
+
+
+def test_truncate(tokenizer):
+    text = "word " * 1000
+    truncated = tokenizer.truncate(text, 100)
+    assert tokenizer.count(truncated) == 100
+    assert text.startswith(truncated)
+    assert tokenizer.truncate("short text", 100) == "short text"
@@ -0,0 +1,162 @@
+import json
+import re
+import time
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import chromadb
+import numpy as np
+import pytest
+
+from config import SUMMARY_MAX_ATTEMPTS
+from config_logger import logger
+from src.embeddings import EmbeddingGenerator
+from src.vector_store import VectorStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = VectorStore.__new__(VectorStore)
+    store.logger = logger
+    store.collection = chromadb.PersistentClient(path=str(tmp_path)).create_collection("llm_responses")
+    store._summarizer = MagicMock()
+    return store
+
+
+def add_pending(store, ids):
+    store.collection.add(
+        ids=ids,
+        embeddings=[[1.0, 0.0]] * len(ids),
+        documents=[json.dumps({"query": f"q {i}", "response": "r"}) for i in ids],
+        metadatas=[{"record_type": "interaction", "summary": "", "summary_pending": True,
+                    "summary_attempts": 0, "summary_retry_at": 0.0} for _ in ids],
+    )
+
+
+def metadata(store, interaction_id):
+    return store.collection.get(ids=[interaction_id])["metadatas"][0]
+
+
+def test_summarize_pending_is_bounded(store):
+    add_pending(store, [f"id{i}" for i in range(5)])
+    store.summarizer.summarize.side_effect = lambda interactions: {i["id"]: "summary" for i in interactions}
+
+    assert store.summarize_pending(limit=2) == 2
+    assert len(store.summarizer.summarize.call_args.args[0]) == 2
+    assert store.summarize_pending(limit=10) == 3
+    assert store.summarize_pending(limit=10) == 0
+
+
+def test_failed_summaries_back_off_and_are_given_up(store):
+    add_pending(store, ["ok", "failing"])
+    store.summarizer.summarize.side_effect = lambda interactions: {"ok": "summary"}
+
+    assert store.summarize_pending(limit=10) == 1
+    assert metadata(store, "ok")["summary"] == "summary"
+    failed = metadata(store, "failing")
+    assert failed["summary_attempts"] == 1
+    assert failed["summary_retry_at"] > time.time()
+
+    # Backing off: not picked up again right away
+    store.summarizer.summarize.reset_mock()
+    assert store.summarize_pending(limit=10) == 0
+    store.summarizer.summarize.assert_not_called()
+
+    for day in range(1, SUMMARY_MAX_ATTEMPTS):
+        with patch("src.vector_store.time.time", return_value=time.time() + day * 10 ** 6):
+            assert store.summarize_pending(limit=10) == 0
+    store.summarizer.summarize.reset_mock()
+    with patch("src.vector_store.time.time", return_value=time.time() + 10 ** 9):
+        store.summarize_pending(limit=10)
+    store.summarizer.summarize.assert_not_called()
+    failed = metadata(store, "failing")
+    assert failed["summary_attempts"] == SUMMARY_MAX_ATTEMPTS
+    assert failed["summary_pending"] is False
+
+
+TOPICS = ["python", "cooking", "music"]
+
+
+class WordTokenizer:
+    """Stand-in for a Hugging Face tokenizer: one token per word, with character offsets"""
+
+    def __call__(self, text, add_special_tokens=True, return_offsets_mapping=False, verbose=True):
+        return {"offset_mapping": [m.span() for m in re.finditer(r"\S+", text)]}
+
+
+class TopicEmbedder(EmbeddingGenerator):
+    """Stand-in embedding model: one dimension per topic word, plus a constant so no vector is zero"""
+
+    def __init__(self):
+        super().__init__(model_name="topic-test", use_cache=False)
+        # Reads 20 words per text, so longer interactions are chunked
+        self._model = SimpleNamespace(tokenizer=WordTokenizer(), max_seq_length=22)
+
+    def get_batch_embeddings(self, texts):
+        return np.array([[t.lower().count(w) for w in TOPICS] + [0.1] for t in texts], dtype=np.float32)
+
+    def get_embedding(self, text):
+        return self.get_batch_embeddings([text])[0]
+
+
+@pytest.fixture
+def real_store(tmp_path):
+    with patch("src.vector_store.EmbeddingGenerator", return_value=TopicEmbedder()):
+        yield VectorStore(data_dir=tmp_path / "vector_db")
+
+
+def records(store, where):
+    return store.collection.get(where=where, include=["embeddings", "metadatas", "documents"])
+
+
+def test_interactions_are_stored_as_chunks_and_searched_by_pooled_score(real_store):
+    long_response = " ".join(["cooking"] * 40 + ["python"] * 20)
+    real_store.add_interactions([
+        {"id": "long", "query": "dinner ideas", "response": long_response, "model_name": "flash"},
+        {"id": "short", "query": "python", "response": "python and cooking", "model_name": "flash"},
+    ])
+
+    chunks = records(real_store, {"parent_id": "long"})
+    assert len(chunks["ids"]) > 2
+    assert all(m["record_type"] == "chunk" for m in chunks["metadatas"])
+    parent = records(real_store, {"record_type": "interaction"})
+    assert sorted(parent["ids"]) == ["long", "short"]
+    # The interaction record carries the normalised mean of its chunk vectors
+    mean = np.asarray(chunks["embeddings"]).mean(axis=0)
+    long_vector = np.asarray(parent["embeddings"][parent["ids"].index("long")])
+    assert np.allclose(long_vector, mean / np.linalg.norm(mean), atol=1e-5)
+
+    # Only the last chunk of "long" is about python: it wins under max pooling, not under mean pooling
+    by_max = real_store.search("python", limit=2, pooling="max")
+    by_mean = real_store.search("python", limit=2, pooling="mean")
+    assert {r["id"] for r in by_max} == {"long", "short"}
+    assert by_max[0]["similarity"] > 0.9
+    assert by_mean[-1]["id"] == "long"
+    assert by_mean[-1]["similarity"] < [r for r in by_max if r["id"] == "long"][0]["similarity"]
+
+
+def test_legacy_single_record_rows_are_searched(real_store):
+    real_store.collection.add(
+        ids=["legacy"], embeddings=[[0.0, 0.0, 1.0, 0.1]],
+        documents=[json.dumps({"query": "favourite music", "response": "jazz"})],
+        metadatas=[{"model": "flash", "embedding_model": "topic-test"}],
+    )
+    real_store.add_interactions([{"id": "new", "query": "python", "response": "tips", "model_name": "flash"}])
+
+    assert [r["id"] for r in real_store.search("music", limit=1)] == ["legacy"]
+    assert real_store.search("music", limit=1)[0]["query"] == "favourite music"
+
+
+def test_replayed_interaction_replaces_its_chunks(real_store):
+    real_store.add_interactions([
+        {"id": "a", "query": "q", "response": " ".join(["music"] * 60), "model_name": "flash"},
+    ])
+    assert real_store.search("music", limit=1)[0]["id"] == "a"
+
+    real_store.add_interactions([{"id": "a", "query": "q", "response": "python", "model_name": "flash"}])
+
+    assert len(records(real_store, {"parent_id": "a"})["ids"]) == 1
+    assert len(real_store._get_similarity_index()) == 1
+    result = real_store.search("music", limit=1)[0]
+    assert result["response"] == "python"
+    assert result["similarity"] < 0.5